@@ -41,36 +41,37 @@ echo ""
 echo "📋 Applying database migrations..."
 echo ""
 
-# Apply the migration
-docker exec -i postgres-wso2 psql -U postgres -d banking_db < app_services/banking_service/app/database/migrations/001_init_banking_schema.sql
+# Apply all migrations in order (each one is idempotent)
+for migration in app_services/banking_service/app/database/migrations/*.sql; do
+    echo "  → $(basename "$migration")"
+    docker exec -i postgres-wso2 psql -U postgres -d banking_db -v ON_ERROR_STOP=1 < "$migration" || {
+        echo ""
+        echo "✗ $(basename "$migration") failed"
+        echo "Please check the error messages above"
+        exit 1
+    }
+done
+
+echo ""
+echo "✓ Database schema applied successfully"
+echo ""
+
+# Verify tables were created
+echo "📊 Verifying tables..."
+TABLES=$(docker exec postgres-wso2 psql -U postgres -d banking_db -tAc "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema='public' AND table_type='BASE TABLE'")
 
-if [ $? -eq 0 ]; then
+if [ "$TABLES" = "4" ]; then
+    echo "✓ All 4 tables created successfully:"
+    docker exec postgres-wso2 psql -U postgres -d banking_db -c "\dt"
     echo ""
-    echo "✓ Database schema applied successfully"
+    echo "Banking service database is ready!"
     echo ""
-    
-    # Verify tables were created
-    echo "📊 Verifying tables..."
-    TABLES=$(docker exec postgres-wso2 psql -U postgres -d banking_db -tAc "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema='public' AND table_type='BASE TABLE'")
-    
-    if [ "$TABLES" = "3" ]; then
-        echo "✓ All 3 tables created successfully:"
-        docker exec postgres-wso2 psql -U postgres -d banking_db -c "\dt"
-        echo ""
-        echo "Banking service database is ready!"
-        echo ""
-        echo "Next steps:"
-        echo "1. Configure Mastercard credentials in .env file"
-        echo "2. Build the service: docker compose build banking-service"
-        echo "3. Start the service: docker compose up -d banking-service"
-        echo "4. Check health: curl http://localhost:8007/health"
-    else
-        echo "Warning: Expected 3 tables, found $TABLES"
-        echo "Please check the migration script"
-    fi
+    echo "Next steps:"
+    echo "1. Configure Mastercard credentials in .env file"
+    echo "2. Build the service: docker compose build banking-service"
+    echo "3. Start the service: docker compose up -d banking-service"
+    echo "4. Check health: curl http://localhost:8007/health"
 else
-    echo ""
-    echo "Error applying database schema"
-    echo "Please check the error messages above"
-    exit 1
+    echo "Warning: Expected 4 tables, found $TABLES"
+    echo "Please check the migration script"
 fi
@@ -0,0 +1,52 @@
+#!/bin/bash
+
+# Banking Service Read Replica Setup Script
+# Allows streaming replication from postgres-wso2 and starts postgres-wso2-replica
+
+set -e
+
+echo "🏦 Banking Service Read Replica Setup"
+echo "====================================="
+echo ""
+
+# Check if postgres container is running
+if ! docker ps | grep -q postgres-wso2; then
+    echo "Error: PostgreSQL container is not running"
+    echo "Please start it with: docker compose up -d postgres"
+    exit 1
+fi
+
+# wal_level=replica and max_wal_senders are already the defaults; the
+# replica only needs to be allowed to connect for replication
+HBA_FILE=$(docker exec postgres-wso2 psql -U postgres -tAc "SHOW hba_file")
+if ! docker exec postgres-wso2 grep -q "^host replication all all" "$HBA_FILE"; then
+    echo "📋 Allowing replication connections..."
+    docker exec postgres-wso2 bash -c "echo 'host replication all all scram-sha-256' >> '$HBA_FILE'"
+    docker exec postgres-wso2 psql -U postgres -tAc "SELECT pg_reload_conf()" > /dev/null
+fi
+echo "✓ Primary accepts replication connections"
+echo ""
+
+echo "⏳ Starting the replica (clones the primary on first start)..."
+docker compose -f docker-compose.yml -f docker-compose.replica.yml up -d postgres-replica
+
+for i in $(seq 1 60); do
+    if docker exec postgres-wso2-replica pg_isready -U postgres > /dev/null 2>&1; then
+        break
+    fi
+    sleep 2
+done
+
+RECOVERY=$(docker exec postgres-wso2-replica psql -U postgres -tAc "SELECT pg_is_in_recovery()" 2>/dev/null || echo "")
+if [ "$RECOVERY" = "t" ]; then
+    echo "✓ Replica is streaming from the primary:"
+    docker exec postgres-wso2 psql -U postgres -c "SELECT client_addr, state, replay_lag FROM pg_stat_replication"
+    echo ""
+    echo "Next steps:"
+    echo "1. Start the service with the replica: docker compose -f docker-compose.yml -f docker-compose.replica.yml up -d banking-service"
+    echo "2. Check routing: curl http://localhost:8007/health (see \"replicas\")"
+else
+    echo "Error: replica is not running in recovery mode"
+    echo "Check the logs: docker logs postgres-wso2-replica"
+    exit 1
+fi
@@ -1,30 +1,57 @@
 """
 Bank Account API Endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import exists, func, select, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncGenerator, List, Optional
 import logging
 from datetime import datetime
 import uuid
 
 from app.schemas import (
     ConnectRequest, ConnectResponse, BankAccount, BankAccountListResponse,
-    BankAccountDetails, UnlinkAccountResponse, SetPrimaryAccountResponse
+    BankAccountDetails, UnlinkAccountResponse, SetPrimaryAccountResponse,
+    RefreshJobResponse
 )
+from app.config import settings
 from app.services.mastercard_client import mastercard_client
-from app.database.models import MastercardCustomer, LinkedBankAccount, AccountConnectionLog
-from app.database.connection import get_db
+from app.services.account_sync import upsert_linked_accounts
+from app.services.cache import account_cache
+from app.services.balance_refresher import balance_refresher, RefreshJob
+from app.services.audit_writer import audit_writer
+from app.services.pagination import encode_cursor, decode_cursor, InvalidCursorError
+from app.database.models import MastercardCustomer, LinkedBankAccount
+from app.database.connection import get_db, read_router
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+async def get_read_db(user_id: str) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for read-only endpoints
+    
+    Uses a healthy read replica, except within the read-your-writes window
+    after a change to the user's accounts (a lagging replica could miss it,
+    and the result would be cached).
+    """
+    primary = read_router.enabled and await account_cache.recently_written(user_id)
+    async with read_router.session(primary=primary) as db:
+        yield db
+
+
+# set-primary safety net: exclusion violation, deadlock, serialization failure
+SET_PRIMARY_ATTEMPTS = 3
+RETRYABLE_SQLSTATES = {"23P01", "40P01", "40001"}
+
 
 @router.post("/{user_id}/bank-accounts/connect", response_model=ConnectResponse)
 async def generate_connect_url(
     user_id: str,
     request: ConnectRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Generate Mastercard Connect URL for bank account linking
@@ -48,9 +75,9 @@ async def generate_connect_url(
     """
     try:
         # Check if Mastercard customer exists
-        mc_customer = db.query(MastercardCustomer).filter(
-            MastercardCustomer.user_id == user_id
-        ).first()
+        mc_customer = await db.scalar(
+            select(MastercardCustomer).where(MastercardCustomer.user_id == user_id)
+        )
         
         if not mc_customer:
             # Create new Mastercard customer
@@ -69,25 +96,23 @@ async def generate_connect_url(
                 status="active"
             )
             db.add(mc_customer)
-            db.commit()
-            db.refresh(mc_customer)
+            await db.commit()
+            await db.refresh(mc_customer)
         
         # Generate Connect URL
         connect_url = await mastercard_client.generate_connect_url(
             customer_id=mc_customer.mastercard_customer_id,
             redirect_uri=request.redirect_uri,
             institution_id=request.institution_id,
-            webhook_url=request.webhook_url
+            webhook_url=request.webhook_url or settings.MASTERCARD_WEBHOOK_URL
         )
         
         # Log connection attempt
-        log_entry = AccountConnectionLog(
+        audit_writer.log(
             user_id=user_id,
             action="connect_initiated",
             status="pending"
         )
-        db.add(log_entry)
-        db.commit()
         
         session_id = str(uuid.uuid4())
         
@@ -107,7 +132,7 @@ async def generate_connect_url(
 @router.get("/{user_id}/bank-accounts/callback")
 async def handle_connect_callback(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Handle callback after user completes account linking
@@ -119,14 +144,18 @@ async def handle_connect_callback(
     4. Save accounts to our database
     5. Return account list
     
+    With `MASTERCARD_WEBHOOKS_ENABLED` the callback returns 202 right away:
+    Mastercard pushes the linked accounts to `POST /webhooks/mastercard` and
+    the event consumer saves them, so steps 3-5 happen in the background.
+    
     **Note:** In production, you might want to accept a `code` or `session_id` 
     parameter to validate the callback.
     """
     try:
         # Get Mastercard customer
-        mc_customer = db.query(MastercardCustomer).filter(
-            MastercardCustomer.user_id == user_id
-        ).first()
+        mc_customer = await db.scalar(
+            select(MastercardCustomer).where(MastercardCustomer.user_id == user_id)
+        )
         
         if not mc_customer:
             raise HTTPException(
@@ -134,61 +163,40 @@ async def handle_connect_callback(
                 detail="Mastercard customer not found"
             )
         
+        if settings.MASTERCARD_WEBHOOKS_ENABLED:
+            audit_writer.log(
+                user_id=user_id,
+                action="connect_callback",
+                status="pending"
+            )
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"status": "pending", "accounts_added": 0, "accounts": []}
+            )
+        
         # Fetch accounts from Mastercard
         logger.info(f"Fetching accounts for customer {mc_customer.mastercard_customer_id}")
         accounts = await mastercard_client.get_customer_accounts(
             customer_id=mc_customer.mastercard_customer_id
         )
         
-        saved_accounts = []
+        # Upsert all accounts in one statement
+        saved_accounts = await upsert_linked_accounts(
+            db,
+            user_id=user_id,
+            mastercard_customer_id=mc_customer.mastercard_customer_id,
+            accounts=accounts
+        )
         
-        for account in accounts:
-            # Check if account already exists
-            existing_account = db.query(LinkedBankAccount).filter(
-                LinkedBankAccount.mastercard_account_id == account["id"]
-            ).first()
-            
-            if existing_account:
-                # Update existing account
-                existing_account.current_balance = account.get("balance")
-                existing_account.available_balance = account.get("availableBalance")
-                existing_account.last_updated_at = datetime.now()
-                existing_account.status = "active"
-                db.commit()
-                saved_accounts.append(existing_account)
-            else:
-                # Create new account record
-                new_account = LinkedBankAccount(
-                    user_id=user_id,
-                    mastercard_customer_id=mc_customer.mastercard_customer_id,
-                    mastercard_account_id=account["id"],
-                    account_name=account.get("name", "Unknown Account"),
-                    account_number_masked=account.get("accountNumberDisplay", "****"),
-                    account_type=account.get("type", "unknown"),
-                    institution_id=str(account.get("institutionId", "")),
-                    institution_name=account.get("institutionName", "Unknown"),
-                    institution_logo_url=account.get("institutionLogo"),
-                    current_balance=account.get("balance"),
-                    available_balance=account.get("availableBalance"),
-                    currency=account.get("currency", "USD"),
-                    status="active",
-                    consent_granted_at=datetime.now(),
-                    is_verified=True,
-                    verification_method="instant"
-                )
-                db.add(new_account)
-                db.commit()
-                db.refresh(new_account)
-                saved_accounts.append(new_account)
+        await db.commit()
+        await account_cache.invalidate(user_id)
         
         # Log successful connection
-        log_entry = AccountConnectionLog(
+        audit_writer.log(
             user_id=user_id,
             action="connect_success",
             status="completed"
         )
-        db.add(log_entry)
-        db.commit()
         
         logger.info(f"Successfully linked {len(saved_accounts)} accounts for user {user_id}")
         
@@ -198,18 +206,21 @@ async def handle_connect_callback(
             "accounts": [BankAccount.model_validate(acc) for acc in saved_accounts]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error handling callback: {e}")
         
+        # Discard any half-applied sync
+        await db.rollback()
+        
         # Log failed connection
-        log_entry = AccountConnectionLog(
+        audit_writer.log(
             user_id=user_id,
             action="connect_failed",
             status="error",
             error_message=str(e)
         )
-        db.add(log_entry)
-        db.commit()
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -221,29 +232,69 @@ async def handle_connect_callback(
 async def list_bank_accounts(
     user_id: str,
     status_filter: str = "active",
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     List all linked bank accounts for a user
     
     **Query Parameters:**
     - status_filter: Filter by status (active, inactive, all)
+    - limit: Page size (1-200)
+    - cursor: Resume after the previous page
+    
+    Accounts are sorted by creation time (then id), oldest first. Pass the
+    returned `next_cursor` to fetch the next page; it is null on the last page.
+    
+    Served from the Redis account cache when possible, otherwise from a
+    read replica.
     """
     try:
-        query = db.query(LinkedBankAccount).filter(
+        after = decode_cursor(cursor) if cursor else None
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    async def load() -> str:
+        filters = [
             LinkedBankAccount.user_id == user_id,
             LinkedBankAccount.deleted_at.is_(None)
-        )
-        
+        ]
         if status_filter != "all":
-            query = query.filter(LinkedBankAccount.status == status_filter)
+            filters.append(LinkedBankAccount.status == status_filter)
+        
+        # All of the user's matching accounts, not just this page
+        total = await db.scalar(select(func.count()).select_from(LinkedBankAccount).where(*filters))
+        
+        query = select(LinkedBankAccount).where(*filters)
+        if after:
+            query = query.where(
+                tuple_(LinkedBankAccount.created_at, LinkedBankAccount.id) > tuple_(*after)
+            )
+        
+        # One extra row tells us whether another page exists
+        query = query.order_by(
+            LinkedBankAccount.created_at, LinkedBankAccount.id
+        ).limit(limit + 1)
         
-        accounts = query.all()
+        accounts = (await db.scalars(query)).all()
+        
+        next_cursor = None
+        if len(accounts) > limit:
+            accounts = accounts[:limit]
+            next_cursor = encode_cursor(accounts[-1].created_at, accounts[-1].id)
         
         return BankAccountListResponse(
             accounts=[BankAccount.model_validate(acc) for acc in accounts],
-            total=len(accounts)
+            total=total,
+            next_cursor=next_cursor
+        ).model_dump_json()
+    
+    try:
+        payload = await account_cache.get_or_load(
+            user_id, f"list:{status_filter}:{limit}:{cursor or ''}", load
         )
+        return Response(content=payload, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error listing accounts: {e}")
@@ -257,15 +308,17 @@ async def list_bank_accounts(
 async def get_bank_account(
     user_id: str,
     account_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get detailed information for a specific bank account"""
-    try:
-        account = db.query(LinkedBankAccount).filter(
-            LinkedBankAccount.id == account_id,
-            LinkedBankAccount.user_id == user_id,
-            LinkedBankAccount.deleted_at.is_(None)
-        ).first()
+    """Get detailed information for a specific bank account (cache, then read replica)"""
+    async def load() -> str:
+        account = await db.scalar(
+            select(LinkedBankAccount).where(
+                LinkedBankAccount.id == account_id,
+                LinkedBankAccount.user_id == user_id,
+                LinkedBankAccount.deleted_at.is_(None)
+            )
+        )
         
         if not account:
             raise HTTPException(
@@ -273,7 +326,11 @@ async def get_bank_account(
                 detail="Bank account not found"
             )
         
-        return BankAccountDetails.model_validate(account)
+        return BankAccountDetails.model_validate(account).model_dump_json()
+    
+    try:
+        payload = await account_cache.get_or_load(user_id, f"account:{account_id}", load)
+        return Response(content=payload, media_type="application/json")
         
     except HTTPException:
         raise
@@ -289,20 +346,26 @@ async def get_bank_account(
 async def refresh_account_balance(
     user_id: str,
     account_id: str,
-    db: Session = Depends(get_db)
+    wait: bool = Query(True, description="Wait for the refresh; false queues it and returns 202"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Refresh account balance from Mastercard
     
     **Note:** This triggers a real-time data fetch from the bank.
     Use sparingly to avoid rate limits.
+    
+    With `wait=false` the refresh is queued on the background refresher and
+    a 202 with a job id is returned; poll `refresh-jobs/{job_id}` for status.
     """
     try:
-        account = db.query(LinkedBankAccount).filter(
-            LinkedBankAccount.id == account_id,
-            LinkedBankAccount.user_id == user_id,
-            LinkedBankAccount.deleted_at.is_(None)
-        ).first()
+        account = await db.scalar(
+            select(LinkedBankAccount).where(
+                LinkedBankAccount.id == account_id,
+                LinkedBankAccount.user_id == user_id,
+                LinkedBankAccount.deleted_at.is_(None)
+            )
+        )
         
         if not account:
             raise HTTPException(
@@ -310,17 +373,35 @@ async def refresh_account_balance(
                 detail="Bank account not found"
             )
         
+        if not wait:
+            job = await balance_refresher.enqueue(
+                user_id=user_id,
+                account_id=str(account.id),
+                mastercard_customer_id=account.mastercard_customer_id
+            )
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content=_job_response(job).model_dump(mode="json")
+            )
+        
         # Refresh from Mastercard
         mc_account = await mastercard_client.refresh_account(
             customer_id=account.mastercard_customer_id,
             account_id=account.mastercard_account_id
         )
         
+        if mc_account is None:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Account missing from Mastercard refresh response"
+            )
+        
         # Update database
-        account.current_balance = mc_account.get("balance")
-        account.available_balance = mc_account.get("availableBalance")
+        account.current_balance = mc_account.balance
+        account.available_balance = mc_account.available_balance
         account.last_updated_at = datetime.now()
-        db.commit()
+        await db.commit()
+        await account_cache.invalidate(user_id)
         
         return {
             "status": "refreshed",
@@ -341,11 +422,36 @@ async def refresh_account_balance(
         )
 
 
+@router.get("/{user_id}/bank-accounts/refresh-jobs/{job_id}", response_model=RefreshJobResponse)
+async def get_refresh_job(user_id: str, job_id: str):
+    """Get the status of a queued balance refresh"""
+    job = await balance_refresher.get_job(job_id)
+    
+    if not job or job.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Refresh job not found or expired"
+        )
+    
+    return _job_response(job)
+
+
+def _job_response(job: RefreshJob) -> RefreshJobResponse:
+    return RefreshJobResponse(
+        job_id=job.id,
+        account_id=job.account_id,
+        status=job.status,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        error=job.error
+    )
+
+
 @router.delete("/{user_id}/bank-accounts/{account_id}", response_model=UnlinkAccountResponse)
 async def unlink_bank_account(
     user_id: str,
     account_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Unlink a bank account
@@ -354,11 +460,13 @@ async def unlink_bank_account(
     but is marked as deleted.
     """
     try:
-        account = db.query(LinkedBankAccount).filter(
-            LinkedBankAccount.id == account_id,
-            LinkedBankAccount.user_id == user_id,
-            LinkedBankAccount.deleted_at.is_(None)
-        ).first()
+        account = await db.scalar(
+            select(LinkedBankAccount).where(
+                LinkedBankAccount.id == account_id,
+                LinkedBankAccount.user_id == user_id,
+                LinkedBankAccount.deleted_at.is_(None)
+            )
+        )
         
         if not account:
             raise HTTPException(
@@ -369,7 +477,8 @@ async def unlink_bank_account(
         # Soft delete in our database
         account.deleted_at = datetime.now()
         account.status = "inactive"
-        db.commit()
+        await db.commit()
+        await account_cache.invalidate(user_id)
         
         # Optionally delete from Mastercard
         # await mastercard_client.delete_account(
@@ -399,35 +508,69 @@ async def unlink_bank_account(
 async def set_primary_account(
     user_id: str,
     account_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Set an account as the primary funding source"""
-    try:
-        account = db.query(LinkedBankAccount).filter(
-            LinkedBankAccount.id == account_id,
+    """
+    Set an account as the primary funding source
+    
+    Runs as one statement: the user's live accounts are locked in id order
+    (so concurrent switches queue up instead of deadlocking, and each sees
+    the previous switch's result), then only rows whose flag actually
+    changes are updated.
+    """
+    locked = (
+        select(LinkedBankAccount.id, LinkedBankAccount.is_primary)
+        .where(
             LinkedBankAccount.user_id == user_id,
             LinkedBankAccount.deleted_at.is_(None)
-        ).first()
-        
-        if not account:
+        )
+        .order_by(LinkedBankAccount.id)
+        .with_for_update()
+        .cte("locked")
+        .prefix_with("MATERIALIZED")
+    )
+    target_exists = exists().where(locked.c.id == account_id)
+    switched = (
+        update(LinkedBankAccount)
+        .where(
+            LinkedBankAccount.id == locked.c.id,
+            locked.c.is_primary.is_distinct_from(locked.c.id == account_id),
+            target_exists
+        )
+        .values(is_primary=(LinkedBankAccount.id == account_id), updated_at=func.now())
+        .returning(LinkedBankAccount.id)
+        .cte("switched")
+    )
+    stmt = select(
+        target_exists.label("found"),
+        select(func.count()).select_from(switched).scalar_subquery().label("changed")
+    )
+    
+    try:
+        for attempt in range(SET_PRIMARY_ATTEMPTS):
+            try:
+                found, changed = (await db.execute(stmt)).one()
+                await db.commit()
+                break
+            except DBAPIError as e:
+                await db.rollback()
+                sqlstate = getattr(e.orig, "sqlstate", None)
+                if sqlstate not in RETRYABLE_SQLSTATES or attempt == SET_PRIMARY_ATTEMPTS - 1:
+                    raise
+                logger.info(f"Retrying set-primary for user {user_id} after {sqlstate}")
+        
+        if not found:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Bank account not found"
             )
         
-        # Unset other primary accounts
-        db.query(LinkedBankAccount).filter(
-            LinkedBankAccount.user_id == user_id,
-            LinkedBankAccount.id != account_id
-        ).update({"is_primary": False})
-        
-        # Set this account as primary
-        account.is_primary = True
-        db.commit()
+        if changed:
+            await account_cache.invalidate(user_id)
         
         return SetPrimaryAccountResponse(
             status="updated",
-            account_id=str(account.id),
+            account_id=account_id,
             is_primary=True
         )
         
@@ -0,0 +1,59 @@
+"""
+Mastercard Webhook Endpoints
+"""
+from fastapi import APIRouter, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from typing import Optional
+import logging
+
+from app.services.account_events import (
+    account_events, parse_event, verify_signature, InvalidEventError
+)
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.post("/webhooks/mastercard", status_code=status.HTTP_202_ACCEPTED)
+async def receive_mastercard_webhook(
+    request: Request,
+    x_mastercard_signature: Optional[str] = Header(None)
+):
+    """
+    Receive Mastercard Connect and account events
+
+    **Flow:**
+    1. Verify the `X-Mastercard-Signature` HMAC of the raw body
+    2. Validate the event shape
+    3. Enqueue it on Redpanda and return 202
+
+    Accounts are linked or updated by the background event consumer, so
+    this endpoint never calls Mastercard or writes to the database.
+    Returns 503 while Redpanda is unreachable so Mastercard retries.
+    """
+    body = await request.body()
+
+    if not verify_signature(body, x_mastercard_signature):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid webhook signature"
+        )
+
+    try:
+        event = parse_event(body)
+    except InvalidEventError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        await account_events.publish(event, body)
+    except Exception as e:
+        logger.error(f"Failed to enqueue Mastercard event for customer {event.customer_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Event queue unavailable"
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"status": "accepted", "event_type": event.event_type}
+    )
@@ -1,39 +1,229 @@
 """Database connection management"""
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional
 from app.config import settings
 
-# Create database engine
-# Use postgresql+psycopg for psycopg3
-database_url = settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://")
+logger = logging.getLogger(__name__)
+
+
+def _async_url(url: str) -> str:
+    # Use postgresql+psycopg for psycopg3 (async mode is selected by create_async_engine)
+    return url.replace("postgresql://", "postgresql+psycopg://")
+
+
+def _create_engine(url: str, pool_size: int) -> AsyncEngine:
+    return create_async_engine(
+        _async_url(url),
+        pool_size=pool_size,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        # SQLAlchemy compiled-statement cache (per engine)
+        query_cache_size=settings.DATABASE_STATEMENT_CACHE_SIZE,
+        # psycopg3 server-side prepared statements: a query is prepared after
+        # it has run `prepare_threshold` times on a connection (None disables,
+        # required behind PgBouncer in transaction mode)
+        connect_args={"prepare_threshold": settings.DATABASE_PREPARE_THRESHOLD},
+        echo=False
+    )
 
-engine = create_engine(
-    database_url,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    pool_pre_ping=True,  
-    echo=False
-)
+
+# Create async database engine (primary)
+database_url = _async_url(settings.DATABASE_URL)
+engine = _create_engine(settings.DATABASE_URL, settings.DATABASE_POOL_SIZE)
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False so ORM objects stay readable after commit without
+# implicit (blocking) lazy loads
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 
-def get_db() -> Session:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
-    Dependency for getting database session
+    Dependency for getting an async database session
     
     Usage in FastAPI:
     ```python
     @router.get("/")
-    async def my_endpoint(db: Session = Depends(get_db)):
-        # Use db here
-        pass
+    async def my_endpoint(db: AsyncSession = Depends(get_db)):
+        result = await db.execute(select(MyModel))
     ```
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def dispose_engine() -> None:
+    """Close all pooled connections (call on shutdown)"""
+    await read_router.stop()
+    await engine.dispose()
+
+
+def pool_stats(target: Optional[AsyncEngine] = None) -> dict:
+    """Connection pool usage, for health checks and load tests"""
+    pool = (target or engine).pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW
+    }
+
+
+# Seconds a replica is behind the primary; 0 when it has replayed all WAL it received
+_REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def _connection_lost(error: Optional[BaseException]) -> bool:
+    while error is not None:
+        if getattr(error, "connection_invalidated", False):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class ReplicaRouter:
+    """
+    Routes read-only sessions to streaming replicas
+
+    A background task measures each replica's replay lag every
+    `check_interval` seconds; replicas that are unreachable or more than
+    `max_lag` seconds behind are skipped until they catch up. Reads go to
+    the healthy replicas round-robin and fall back to the primary when
+    none is healthy, or when the caller asks for the primary (e.g. to read
+    its own recent writes).
+    """
+
+    def __init__(
+        self,
+        replica_urls: List[str],
+        max_lag_seconds: float = settings.DATABASE_REPLICA_MAX_LAG_SECONDS,
+        check_interval_seconds: float = settings.DATABASE_REPLICA_CHECK_INTERVAL_SECONDS
+    ):
+        self.max_lag = max_lag_seconds
+        self.check_interval = check_interval_seconds
+        self.replicas: List[AsyncEngine] = [
+            _create_engine(url, settings.DATABASE_REPLICA_POOL_SIZE) for url in replica_urls
+        ]
+
+        # Replicas start unhealthy until their first lag check passes
+        self._lag: Dict[int, Optional[float]] = {i: None for i in range(len(self.replicas))}
+        self._healthy: List[AsyncEngine] = []
+        self._next = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self._sessions = async_sessionmaker(
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False
+        )
+
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            await self.check()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for replica in self.replicas:
+            await replica.dispose()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    async def _measure(self, index: int) -> Optional[float]:
+        try:
+            async with self.replicas[index].connect() as conn:
+                return float(await asyncio.wait_for(conn.scalar(_REPLICA_LAG_SQL), timeout=self.check_interval))
+        except Exception as e:
+            if self._lag.get(index) is not None:
+                logger.warning(f"Read replica {index} unavailable: {e}")
+            return None
+
+    async def check(self):
+        """Measure replica lag and update the set of replicas used for reads"""
+        lags = await asyncio.gather(*(self._measure(i) for i in range(len(self.replicas))))
+        healthy = []
+        for index, lag in enumerate(lags):
+            was_healthy = self.replicas[index] in self._healthy
+            is_healthy = lag is not None and lag <= self.max_lag
+            if was_healthy and not is_healthy and lag is not None:
+                logger.warning(f"Read replica {index} is {lag:.1f}s behind, reading from the primary")
+            elif is_healthy and not was_healthy:
+                logger.info(f"Read replica {index} back in rotation")
+            self._lag[index] = lag
+            if is_healthy:
+                healthy.append(self.replicas[index])
+        self._healthy = healthy
+
+    def mark_failed(self, replica: AsyncEngine):
+        """Take a replica out of rotation until the next successful lag check"""
+        if replica in self._healthy:
+            self._healthy = [r for r in self._healthy if r is not replica]
+
+    def engine_for_read(self, primary: bool = False) -> AsyncEngine:
+        if primary or not self._healthy:
+            if not primary and self.enabled:
+                self.fallbacks += 1
+            self.primary_reads += 1
+            return engine
+        self.replica_reads += 1
+        return self._healthy[next(self._next) % len(self._healthy)]
+
+    @asynccontextmanager
+    async def session(self, primary: bool = False) -> AsyncIterator[AsyncSession]:
+        """Read-only session on a healthy replica (or the primary)"""
+        target = self.engine_for_read(primary)
+        async with self._sessions(bind=target) as db:
+            try:
+                yield db
+            except Exception as e:
+                # Connection-level failure on a replica (possibly wrapped in
+                # an HTTPException): stop using it until it recovers
+                if target is not engine and _connection_lost(e):
+                    self.mark_failed(target)
+                raise
+
+    def stats(self) -> Dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": len(self._healthy),
+            "lag_seconds": [self._lag[i] for i in range(len(self.replicas))],
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks
+        }
+
+
+# Global read router (a no-op passthrough to the primary without replicas)
+read_router = ReplicaRouter([
+    url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()
+])
@@ -0,0 +1,40 @@
+-- Banking Service: indexes for account listing and primary-account integrity
+-- Partial indexes skip soft-deleted rows, which every read path filters out.
+-- Run with psql (not inside a transaction) so CONCURRENTLY can be used.
+
+-- ============================================================================
+-- Listing indexes
+-- ============================================================================
+
+-- GET /bank-accounts?status_filter=<status>, keyset-paginated by (created_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_linked_accounts_live_user_status
+    ON linked_bank_accounts (user_id, status, created_at, id)
+    WHERE deleted_at IS NULL;
+
+-- GET /bank-accounts?status_filter=all
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_linked_accounts_live_user_created
+    ON linked_bank_accounts (user_id, created_at, id)
+    WHERE deleted_at IS NULL;
+
+-- ============================================================================
+-- One primary account per user
+-- ============================================================================
+
+-- Keep only the most recently updated primary per user before enforcing it
+-- (rows without timestamps count as oldest, so they cannot escape the dedup)
+UPDATE linked_bank_accounts AS a
+SET is_primary = false
+WHERE a.is_primary
+  AND a.deleted_at IS NULL
+  AND EXISTS (
+      SELECT 1 FROM linked_bank_accounts AS b
+      WHERE b.user_id = a.user_id
+        AND b.is_primary
+        AND b.deleted_at IS NULL
+        AND (COALESCE(b.updated_at, b.created_at, '-infinity'), b.id)
+          > (COALESCE(a.updated_at, a.created_at, '-infinity'), a.id)
+  );
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_linked_accounts_one_primary
+    ON linked_bank_accounts (user_id)
+    WHERE is_primary AND deleted_at IS NULL;
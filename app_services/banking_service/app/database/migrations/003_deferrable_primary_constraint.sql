@@ -0,0 +1,25 @@
+-- Banking Service: make the one-primary-per-user rule deferrable
+-- set_primary_account switches the primary with a single UPDATE. A plain
+-- unique index is checked row by row, so the statement could trip over the
+-- old primary before clearing it. A DEFERRABLE (initially immediate)
+-- exclusion constraint enforces the same rule at the end of each statement.
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'ex_linked_accounts_one_primary'
+    ) THEN
+        ALTER TABLE linked_bank_accounts
+            ADD CONSTRAINT ex_linked_accounts_one_primary
+            EXCLUDE USING btree (user_id WITH =)
+            WHERE (is_primary AND deleted_at IS NULL)
+            DEFERRABLE INITIALLY IMMEDIATE;
+    END IF;
+END
+$$;
+
+DROP INDEX IF EXISTS uq_linked_accounts_one_primary;
+
+COMMIT;
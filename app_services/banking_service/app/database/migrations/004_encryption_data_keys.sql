@@ -0,0 +1,13 @@
+-- Banking Service: per-tenant data keys for envelope encryption
+-- Each tenant (user) gets random AES-256 data keys, stored wrapped by the
+-- service master key (ENCRYPTION_KEY). The highest version is the active
+-- key; older versions stay to decrypt values written before a rotation.
+
+CREATE TABLE IF NOT EXISTS encryption_data_keys (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    tenant_id VARCHAR(255) NOT NULL,
+    version INTEGER NOT NULL,
+    wrapped_key TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_encryption_data_keys_tenant_version UNIQUE (tenant_id, version)
+);
@@ -1,10 +1,10 @@
 """
 Database models for Banking Service
 """
-from sqlalchemy import Column, String, Numeric, Boolean, DateTime, Text, Index
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, String, Numeric, Boolean, DateTime, Text, Index, Integer, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ExcludeConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import uuid
 
 Base = declarative_base()
@@ -22,6 +22,10 @@ class MastercardCustomer(Base):
     extra_data = Column(JSONB)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Fetch server-generated columns via RETURNING so they are loaded
+    # after flush (async sessions cannot lazy-load expired attributes)
+    __mapper_args__ = {"eager_defaults": True}
 
 
 class LinkedBankAccount(Base):
@@ -73,7 +77,28 @@ class LinkedBankAccount(Base):
     __table_args__ = (
         Index('idx_user_status', 'user_id', 'status'),
         Index('idx_mastercard_customer', 'mastercard_customer_id'),
+        # Partial listing indexes from migration 002 (soft-deleted rows excluded)
+        Index(
+            'idx_linked_accounts_live_user_status',
+            'user_id', 'status', 'created_at', 'id',
+            postgresql_where=text('deleted_at IS NULL')
+        ),
+        Index(
+            'idx_linked_accounts_live_user_created',
+            'user_id', 'created_at', 'id',
+            postgresql_where=text('deleted_at IS NULL')
+        ),
+        # One live primary per user, checked at statement end (migration 003)
+        ExcludeConstraint(
+            ('user_id', '='),
+            name='ex_linked_accounts_one_primary',
+            using='btree',
+            where=text('is_primary AND deleted_at IS NULL'),
+            deferrable=True,
+            initially='IMMEDIATE'
+        ),
     )
+    __mapper_args__ = {"eager_defaults": True}
 
 
 class AccountConnectionLog(Base):
@@ -91,3 +116,18 @@ class AccountConnectionLog(Base):
     user_agent = Column(Text)
     extra_data = Column(JSONB)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EncryptionDataKey(Base):
+    """Wrapped per-tenant data key; the highest version is active"""
+    __tablename__ = "encryption_data_keys"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(String(255), nullable=False)
+    version = Column(Integer, nullable=False)
+    wrapped_key = Column(Text, nullable=False)  # base64(nonce + AES-GCM(master key, data key))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint('tenant_id', 'version', name='uq_encryption_data_keys_tenant_version'),
+    )
@@ -5,9 +5,17 @@ Handles bank account linking via Mastercard Open Finance
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+from sqlalchemy import text
 
 from app.config import settings
-from app.api.v1 import bank_accounts
+from app.api.v1 import bank_accounts, webhooks
+from app.database.connection import dispose_engine, pool_stats, read_router
+from app.services.cache import account_cache
+from app.services.partner_cache import partner_cache
+from app.services.mastercard_client import mastercard_client
+from app.services.balance_refresher import balance_refresher
+from app.services.audit_writer import audit_writer
+from app.services.account_events import account_events
 from app.schemas import HealthResponse
 
 # Configure logging
@@ -41,12 +49,27 @@ async def startup_event():
     """Initialize application on startup"""
     logger.info(f"Starting {settings.SERVICE_NAME} v{settings.SERVICE_VERSION}")
     logger.info(f"Mastercard API: {settings.MASTERCARD_BASE_URL}")
+    await read_router.start()
+    await account_cache.connect()
+    await partner_cache.connect()
+    await audit_writer.start()
+    await mastercard_client.startup()
+    await balance_refresher.start(scheduler=settings.BALANCE_REFRESH_ENABLED)
+    if settings.MASTERCARD_WEBHOOKS_ENABLED:
+        await account_events.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info(f"Shutting down {settings.SERVICE_NAME}")
+    await account_events.stop()
+    await balance_refresher.stop()
+    await mastercard_client.shutdown()
+    await account_cache.close()
+    await partner_cache.close()
+    await audit_writer.stop()
+    await dispose_engine()
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -54,14 +77,27 @@ async def health_check():
     """
     Health check endpoint
     
-    Used by Docker health checks and monitoring systems
+    Used by Docker health checks and monitoring systems. The database probe
+    runs on a read replica when one is healthy.
     """
+    try:
+        async with read_router.session() as db:
+            await db.execute(text("SELECT 1"))
+        database = "connected"
+    except Exception as e:
+        logger.warning(f"Health check database probe failed: {e}")
+        database = "disconnected"
+
     return HealthResponse(
         status="healthy",
         service=settings.SERVICE_NAME,
         version=settings.SERVICE_VERSION,
-        database="connected",
-        cache="connected"
+        database=database,
+        database_pool=pool_stats(),
+        replicas=read_router.stats() if read_router.enabled else None,
+        cache="connected" if await account_cache.ping() else "disconnected",
+        audit_log=audit_writer.stats(),
+        events=account_events.stats() if settings.MASTERCARD_WEBHOOKS_ENABLED else None
     )
 
 
@@ -82,8 +118,12 @@ async def root():
             "list": "GET /api/v1/{user_id}/bank-accounts",
             "get": "GET /api/v1/{user_id}/bank-accounts/{account_id}",
             "refresh": "POST /api/v1/{user_id}/bank-accounts/{account_id}/refresh",
+            "refresh_job": "GET /api/v1/{user_id}/bank-accounts/refresh-jobs/{job_id}",
             "unlink": "DELETE /api/v1/{user_id}/bank-accounts/{account_id}",
-            "set_primary": "POST /api/v1/{user_id}/bank-accounts/{account_id}/set-primary"
+            "set_primary": "POST /api/v1/{user_id}/bank-accounts/{account_id}/set-primary",
+            "mastercard_webhook": (
+                "POST /api/v1/webhooks/mastercard" if settings.MASTERCARD_WEBHOOKS_ENABLED else None
+            )
         }
     }
 
@@ -94,6 +134,13 @@ app.include_router(
     prefix=f"{settings.API_V1_PREFIX}",
     tags=["bank-accounts"]
 )
+# Without the event consumer nothing would apply accepted webhooks
+if settings.MASTERCARD_WEBHOOKS_ENABLED:
+    app.include_router(
+        webhooks.router,
+        prefix=f"{settings.API_V1_PREFIX}",
+        tags=["webhooks"]
+    )
 
 
 if __name__ == "__main__":
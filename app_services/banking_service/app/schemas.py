@@ -55,7 +55,8 @@ class BankAccount(BaseModel):
 class BankAccountListResponse(BaseModel):
     """List of bank accounts"""
     accounts: list[BankAccount]
-    total: int
+    total: int  # All of the user's accounts matching the filter (across pages)
+    next_cursor: Optional[str] = None  # Pass as `cursor` for the next page
 
 
 class BankAccountDetails(BankAccount):
@@ -97,10 +98,24 @@ class SetPrimaryAccountResponse(BaseModel):
         return v
 
 
+class RefreshJobResponse(BaseModel):
+    """Status of a background balance refresh"""
+    job_id: str
+    account_id: str
+    status: str  # queued, running, completed, failed
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
     service: str
     version: str
     database: str
+    database_pool: Optional[dict] = None  # Pool size/checked_out/overflow
+    replicas: Optional[dict] = None  # Read replica health, lag and routing counters
     cache: str
+    audit_log: Optional[dict] = None  # Audit writer backlog/dropped counters
+    events: Optional[dict] = None  # Mastercard webhook queue counters
@@ -0,0 +1,422 @@
+"""
+Mastercard account events
+Queues verified webhook payloads on Redpanda and applies them to linked accounts in batches
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+from dataclasses import dataclass, field, replace
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import httpx
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from sqlalchemy import select
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from app.config import settings
+from app.database.connection import SessionLocal
+from app.database.models import MastercardCustomer
+from app.services.account_sync import apply_balance_updates, upsert_linked_accounts
+from app.services.audit_writer import audit_writer
+from app.services.cache import account_cache
+from app.services.finicity_decoder import FinicityAccount, decode_accounts_json
+from app.services.mastercard_client import mastercard_client
+
+logger = logging.getLogger(__name__)
+
+# Event types we act on; anything else is acknowledged and skipped
+LINK_EVENTS = {"added", "done"}  # Connect finished: link the customer's accounts
+UPDATE_EVENTS = {"accountsUpdated", "balanceUpdated"}  # Refresh known accounts only
+
+# Seconds to wait before re-reading a batch that failed to apply
+RETRY_BACKOFF_SECONDS = 5.0
+
+
+class InvalidEventError(ValueError):
+    """Raised when a webhook payload is not a usable Mastercard event"""
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failure is an outage worth retrying rather than a problem with the event"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, OperationalError, InterfaceError, OSError, asyncio.TimeoutError))
+
+
+@dataclass(slots=True)
+class AccountEvent:
+    """A decoded Mastercard webhook event"""
+    customer_id: str
+    event_type: str
+    event_id: Optional[str] = None
+    accounts: List[FinicityAccount] = field(default_factory=list)
+
+
+def verify_signature(body: bytes, signature: Optional[str]) -> bool:
+    """
+    Check the `X-Mastercard-Signature` header of a webhook
+
+    The header is the hex HMAC-SHA256 of the raw body keyed with the
+    webhook secret (the partner secret unless one is configured).
+    """
+    secret = settings.MASTERCARD_WEBHOOK_SECRET or settings.MASTERCARD_PARTNER_SECRET
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+def parse_event(body: bytes) -> AccountEvent:
+    """
+    Decode a webhook body into an AccountEvent
+
+    Raises:
+        InvalidEventError: If the body is not JSON or lacks customerId/eventType
+    """
+    try:
+        data = json.loads(body, parse_float=Decimal)
+    except ValueError as e:
+        raise InvalidEventError(f"Malformed event payload: {e}")
+
+    if not isinstance(data, dict) or not data.get("customerId") or not data.get("eventType"):
+        raise InvalidEventError("Event must include customerId and eventType")
+
+    payload = data.get("payload")
+    try:
+        accounts = decode_accounts_json(payload) if isinstance(payload, dict) else []
+    except (KeyError, TypeError, AttributeError) as e:
+        raise InvalidEventError(f"Malformed account payload: {e}")
+
+    return AccountEvent(
+        customer_id=str(data["customerId"]),
+        event_type=str(data["eventType"]),
+        event_id=data.get("eventId"),
+        accounts=accounts
+    )
+
+
+class AccountEventQueue:
+    """
+    Redpanda-backed pipeline for Mastercard webhook events
+
+    The webhook endpoint only verifies an event and `publish()`es it, keyed
+    by Mastercard customer so a customer's events stay ordered on one
+    partition. A consumer task reads up to `batch_size` records per poll,
+    collapses them to the latest accounts per customer, writes the batch in
+    one transaction and only then commits the offsets, so a crash replays
+    rather than loses events (the writes are idempotent upserts).
+
+    A batch that fails is re-read from its first offset. After
+    `max_batch_attempts` failures its events are applied one at a time:
+    an event that fails for a reason other than an outage (a 404 from
+    Mastercard, a row the database rejects) is sent to the dead-letter
+    topic and the consumer moves past it instead of blocking the partition.
+    """
+
+    def __init__(
+        self,
+        bootstrap_servers: str = settings.KAFKA_BOOTSTRAP_SERVERS,
+        topic: str = settings.MASTERCARD_EVENTS_TOPIC,
+        group_id: str = settings.MASTERCARD_EVENTS_CONSUMER_GROUP,
+        batch_size: int = settings.MASTERCARD_EVENTS_BATCH_SIZE,
+        poll_timeout_ms: int = settings.MASTERCARD_EVENTS_POLL_TIMEOUT_MS,
+        max_batch_attempts: int = settings.MASTERCARD_EVENTS_MAX_BATCH_ATTEMPTS,
+        dead_letter_topic: str = settings.MASTERCARD_EVENTS_DEAD_LETTER_TOPIC,
+        fetch_concurrency: int = settings.MASTERCARD_EVENTS_FETCH_CONCURRENCY
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.group_id = group_id
+        self.batch_size = batch_size
+        self.poll_timeout_ms = poll_timeout_ms
+        self.max_batch_attempts = max_batch_attempts
+        self.dead_letter_topic = dead_letter_topic
+        self.fetch_concurrency = fetch_concurrency
+
+        self._producer: Optional[AIOKafkaProducer] = None
+        self._consumer_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+
+        self.published = 0
+        self.applied = 0
+        self.skipped = 0
+        self.failed_batches = 0
+        self.dead_lettered = 0
+
+    async def start(self, consumer: bool = True):
+        """Connect the producer and, optionally, start the batch consumer"""
+        await self._connect_producer()
+        if consumer and self._consumer_task is None:
+            self._consumer_task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._consumer_task is not None:
+            self._consumer_task.cancel()
+            await asyncio.gather(self._consumer_task, return_exceptions=True)
+            self._consumer_task = None
+        if self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+
+    async def _connect_producer(self) -> bool:
+        if self._producer is not None:
+            return True
+        async with self._connect_lock:
+            if self._producer is not None:
+                return True
+            producer = AIOKafkaProducer(
+                bootstrap_servers=self.bootstrap_servers,
+                acks="all",
+                enable_idempotence=True,
+                linger_ms=5
+            )
+            try:
+                await producer.start()
+            except Exception as e:
+                # Webhooks answer 503 until Redpanda is reachable; the partner
+                # retries them and the next publish reconnects
+                logger.error(f"Failed to connect event producer to {self.bootstrap_servers}: {e}")
+                await producer.stop()
+                return False
+            self._producer = producer
+            return True
+
+    @property
+    def connected(self) -> bool:
+        return self._producer is not None
+
+    async def publish(self, event: AccountEvent, body: bytes):
+        """
+        Append a verified webhook body to the events topic
+
+        Waits for the broker acknowledgement so a 2xx to Mastercard means
+        the event is durable.
+
+        Raises:
+            RuntimeError: If the producer is not connected
+        """
+        if not await self._connect_producer():
+            raise RuntimeError("Event queue is not connected")
+        await self._producer.send_and_wait(
+            self.topic,
+            value=body,
+            key=event.customer_id.encode()
+        )
+        self.published += 1
+
+    async def _consume(self):
+        while True:
+            consumer = AIOKafkaConsumer(
+                self.topic,
+                bootstrap_servers=self.bootstrap_servers,
+                group_id=self.group_id,
+                enable_auto_commit=False,
+                auto_offset_reset="earliest"
+            )
+            attempts = 0  # Failed attempts at the batch starting at the current offsets
+            try:
+                await consumer.start()
+                logger.info(f"Consuming Mastercard events from {self.topic}")
+                while True:
+                    records = await consumer.getmany(
+                        timeout_ms=self.poll_timeout_ms,
+                        max_records=self.batch_size
+                    )
+                    if not records:
+                        continue
+
+                    bodies = [
+                        record.value
+                        for partition_records in records.values()
+                        for record in partition_records
+                    ]
+                    try:
+                        if attempts >= self.max_batch_attempts:
+                            await self._apply_one_by_one(bodies)
+                        else:
+                            await self.apply_batch(bodies)
+                    except Exception as e:
+                        # Rewind and retry; offsets stay uncommitted
+                        attempts += 1
+                        self.failed_batches += 1
+                        logger.error(f"Failed to apply Mastercard event batch (attempt {attempts}): {e}")
+                        for partition, partition_records in records.items():
+                            consumer.seek(partition, partition_records[0].offset)
+                        await asyncio.sleep(RETRY_BACKOFF_SECONDS)
+                        continue
+
+                    attempts = 0
+                    await consumer.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mastercard event consumer stopped: {e}")
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS)
+            finally:
+                await consumer.stop()
+
+    async def _apply_one_by_one(self, bodies: List[bytes]):
+        """
+        Apply events separately, dead-lettering the ones that cannot be applied
+
+        Raises:
+            Exception: The first outage-type failure, so the batch is retried
+        """
+        for body in bodies:
+            try:
+                await self.apply_batch([body])
+            except Exception as e:
+                if _is_transient(e):
+                    raise
+                await self._dead_letter(body, e)
+
+    async def _dead_letter(self, body: bytes, error: Exception):
+        self.dead_lettered += 1
+        logger.error(f"Dead-lettering Mastercard event that cannot be applied: {error!r}")
+        try:
+            if not await self._connect_producer():
+                raise RuntimeError("Event queue is not connected")
+            await self._producer.send_and_wait(
+                self.dead_letter_topic,
+                value=body,
+                headers=[("error", repr(error)[:1000].encode())]
+            )
+        except Exception as e:
+            # Never block the partition on the dead-letter topic; keep the event in the log
+            logger.error(f"Failed to dead-letter Mastercard event ({e}), dropping: {body[:4096]!r}")
+
+    async def apply_batch(self, bodies: List[bytes]) -> int:
+        """
+        Apply a batch of raw event bodies to linked accounts
+
+        Events are folded per customer in offset order, so an older event
+        never overwrites a newer one: a balance update after a link event
+        is merged into the linked accounts, a link event drops earlier
+        updates of the accounts it carries, and a customer whose accounts
+        are fetched (Connect finished without a payload) drops every update
+        in the batch, the fetch being newer than all of them.
+
+        Returns:
+            Number of events applied (malformed and ignored events excluded)
+        """
+        linked: Dict[str, Dict[str, FinicityAccount]] = {}
+        to_fetch = set()
+        updated: Dict[str, Dict[str, FinicityAccount]] = {}
+        applied = 0
+
+        for body in bodies:
+            try:
+                event = parse_event(body)
+            except InvalidEventError as e:
+                self.skipped += 1
+                logger.warning(f"Skipping Mastercard event: {e}")
+                continue
+
+            customer_id = event.customer_id
+            if event.event_type in LINK_EVENTS:
+                if event.accounts:
+                    accounts = linked.setdefault(customer_id, {})
+                    pending = updated.get(customer_id, {})
+                    for account in event.accounts:
+                        accounts[account.id] = account
+                        pending.pop(account.id, None)
+                else:
+                    # Connect finished without an account list
+                    to_fetch.add(customer_id)
+            elif event.event_type in UPDATE_EVENTS:
+                accounts = linked.get(customer_id, {})
+                pending = updated.setdefault(customer_id, {})
+                for account in event.accounts:
+                    if account.id in accounts:
+                        accounts[account.id] = replace(
+                            accounts[account.id],
+                            balance=account.balance,
+                            available_balance=account.available_balance
+                        )
+                    else:
+                        pending[account.id] = account
+            else:
+                self.skipped += 1
+                continue
+            applied += 1
+
+        # One pull per customer whose Connect session ended without a payload,
+        # at most `fetch_concurrency` at a time so a large batch does not burst
+        to_fetch = [customer_id for customer_id in to_fetch if customer_id not in linked]
+        if to_fetch:
+            fetch_limit = asyncio.Semaphore(self.fetch_concurrency)
+
+            async def fetch(customer_id: str) -> List[FinicityAccount]:
+                async with fetch_limit:
+                    return await mastercard_client.get_customer_accounts(customer_id)
+
+            fetched = await asyncio.gather(*(fetch(customer_id) for customer_id in to_fetch))
+            for customer_id, accounts in zip(to_fetch, fetched):
+                linked[customer_id] = {account.id: account for account in accounts}
+                updated.pop(customer_id, None)
+        updated = {
+            account_id: account
+            for accounts in updated.values()
+            for account_id, account in accounts.items()
+        }
+
+        if not linked and not updated:
+            return applied
+
+        async with SessionLocal() as db:
+            users = {}
+            if linked:
+                result = await db.execute(
+                    select(MastercardCustomer.mastercard_customer_id, MastercardCustomer.user_id)
+                    .where(MastercardCustomer.mastercard_customer_id.in_(list(linked)))
+                )
+                users = dict(result.all())
+
+            changed_users = set()
+            linked_counts = {}
+            for customer_id, accounts in linked.items():
+                user_id = users.get(customer_id)
+                if user_id is None:
+                    logger.warning(f"Ignoring events for unknown Mastercard customer {customer_id}")
+                    continue
+                saved = await upsert_linked_accounts(
+                    db,
+                    user_id=user_id,
+                    mastercard_customer_id=customer_id,
+                    accounts=list(accounts.values())
+                )
+                linked_counts[user_id] = len(saved)
+                changed_users.add(user_id)
+
+            changed_users.update(await apply_balance_updates(db, list(updated.values())))
+            await db.commit()
+
+        for user_id in changed_users:
+            await account_cache.invalidate(user_id)
+        for user_id, count in linked_counts.items():
+            audit_writer.log(
+                user_id=user_id,
+                action="connect_success",
+                status="completed",
+                extra_data={"source": "webhook", "accounts": count}
+            )
+
+        self.applied += applied
+        return applied
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "published": self.published,
+            "applied": self.applied,
+            "skipped": self.skipped,
+            "failed_batches": self.failed_batches,
+            "dead_lettered": self.dead_lettered
+        }
+
+
+# Global event queue instance
+account_events = AccountEventQueue()
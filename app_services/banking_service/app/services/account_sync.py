@@ -0,0 +1,214 @@
+"""
+Account synchronisation
+Applies Mastercard account payloads to linked_bank_accounts in one statement
+"""
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Numeric, String, Text, cast, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import UUID, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import LinkedBankAccount
+from app.services.encryption import FORMAT_PREFIX, encryption
+from app.services.finicity_decoder import FinicityAccount
+
+# Rows per statement, keeping bind parameters well under Postgres' 65535 limit
+UPSERT_CHUNK_SIZE = 1000
+UPDATE_CHUNK_SIZE = 5000
+
+
+async def upsert_linked_accounts(
+    db: AsyncSession,
+    user_id: str,
+    mastercard_customer_id: str,
+    accounts: List[FinicityAccount]
+) -> List[LinkedBankAccount]:
+    """
+    Insert new accounts and refresh balances of known ones
+    
+    Runs one `INSERT ... ON CONFLICT (mastercard_account_id) DO UPDATE
+    ... RETURNING` per UPSERT_CHUNK_SIZE accounts instead of a SELECT +
+    commit per account. The statements join the caller's transaction and
+    committing is left to the caller, so a failed sync can be rolled back
+    as a whole. The connection log is not part of that transaction: callers
+    hand it to `audit_writer` after committing, which writes it later in
+    its own batch, so a log entry can be lost without affecting the sync.
+    
+    Full account numbers are encrypted as one batch under the user's data
+    key when ENCRYPTION_KEY is set, and are not stored otherwise.
+    
+    Args:
+        db: Database session
+        user_id: Our internal user ID
+        mastercard_customer_id: Mastercard customer owning the accounts
+        accounts: Decoded Mastercard account records
+    
+    Returns:
+        The inserted or updated LinkedBankAccount rows
+    """
+    now = datetime.now()
+    
+    # ON CONFLICT cannot touch the same row twice in one statement
+    accounts = list({account.id: account for account in accounts}.values())
+    if not accounts:
+        return []
+    
+    numbers = [None] * len(accounts)
+    if encryption.enabled:
+        numbers = await encryption.encrypt_many(db, user_id, [account.number for account in accounts])
+    
+    rows = []
+    for account, number in zip(accounts, numbers):
+        rows.append({
+            "user_id": user_id,
+            "mastercard_customer_id": mastercard_customer_id,
+            "mastercard_account_id": account.id,
+            "account_name": account.name,
+            "account_number_masked": account.number_display,
+            "account_number_encrypted": number,
+            "account_type": account.type,
+            "institution_id": account.institution_id,
+            "institution_name": account.institution_name,
+            "institution_logo_url": account.institution_logo,
+            "current_balance": account.balance,
+            "available_balance": account.available_balance,
+            "currency": account.currency,
+            "last_updated_at": now,
+            "status": "active",
+            "consent_granted_at": now,
+            "is_verified": True,
+            "verification_method": "instant"
+        })
+    
+    saved = []
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        saved.extend(await _upsert_chunk(db, rows[start:start + UPSERT_CHUNK_SIZE]))
+    return saved
+
+
+async def _upsert_chunk(db: AsyncSession, rows: List[dict]) -> List[LinkedBankAccount]:
+    stmt = insert(LinkedBankAccount).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LinkedBankAccount.mastercard_account_id],
+        set_={
+            "current_balance": stmt.excluded.current_balance,
+            "available_balance": stmt.excluded.available_balance,
+            "last_updated_at": stmt.excluded.last_updated_at,
+            # Payloads without a number (e.g. served from the partner cache) keep the stored one
+            "account_number_encrypted": func.coalesce(
+                stmt.excluded.account_number_encrypted,
+                LinkedBankAccount.account_number_encrypted
+            ),
+            "status": "active",
+            "updated_at": func.now()
+        }
+    ).returning(LinkedBankAccount)
+    
+    result = await db.scalars(stmt, execution_options={"populate_existing": True})
+    return list(result.all())
+
+
+async def apply_balance_updates(
+    db: AsyncSession,
+    accounts: List[FinicityAccount]
+) -> List[str]:
+    """
+    Write refreshed balances for already linked accounts
+    
+    One `UPDATE ... FROM (VALUES ...)` keyed by mastercard_account_id per
+    UPDATE_CHUNK_SIZE accounts.
+    Unlike upsert_linked_accounts it never inserts accounts or revives
+    unlinked ones. Committing is left to the caller.
+    
+    Args:
+        db: Database session
+        accounts: Refreshed Mastercard account records
+    
+    Returns:
+        Distinct user IDs whose accounts changed (for cache invalidation)
+    """
+    accounts = list({account.id: account for account in accounts}.values())
+    user_ids = set()
+    for start in range(0, len(accounts), UPDATE_CHUNK_SIZE):
+        user_ids.update(await _update_balances_chunk(db, accounts[start:start + UPDATE_CHUNK_SIZE]))
+    return sorted(user_ids)
+
+
+async def _update_balances_chunk(db: AsyncSession, accounts: List[FinicityAccount]) -> List[str]:
+    refreshed = values(
+        column("mastercard_account_id", String),
+        column("current_balance", Numeric(15, 2)),
+        column("available_balance", Numeric(15, 2)),
+        name="refreshed"
+    ).data([
+        (account.id, account.balance, account.available_balance)
+        for account in accounts
+    ])
+    
+    stmt = (
+        update(LinkedBankAccount)
+        .where(
+            LinkedBankAccount.mastercard_account_id == refreshed.c.mastercard_account_id,
+            LinkedBankAccount.deleted_at.is_(None)
+        )
+        .values(
+            # An all-NULL VALUES column would otherwise be typed as text
+            current_balance=cast(refreshed.c.current_balance, Numeric(15, 2)),
+            available_balance=cast(refreshed.c.available_balance, Numeric(15, 2)),
+            last_updated_at=func.now(),
+            updated_at=func.now()
+        )
+        .returning(LinkedBankAccount.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def reencrypt_account_numbers(
+    db: AsyncSession,
+    user_id: str,
+    batch_size: int = 1000
+) -> int:
+    """
+    Rewrite a user's account numbers still encrypted under an older data key
+    
+    Run after `encryption.rotate()`. Each batch is decrypted, re-encrypted
+    and written back with one `UPDATE ... FROM (VALUES ...)`, then committed.
+    
+    Returns:
+        Number of rows rewritten
+    """
+    version = await encryption.active_version(db, user_id)
+    rewritten = 0
+    while True:
+        rows = (await db.execute(
+            select(LinkedBankAccount.id, LinkedBankAccount.account_number_encrypted)
+            .where(
+                LinkedBankAccount.user_id == user_id,
+                LinkedBankAccount.account_number_encrypted.is_not(None),
+                LinkedBankAccount.account_number_encrypted.not_like(f"{FORMAT_PREFIX}.{version}.%")
+            )
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            return rewritten
+        
+        numbers = await encryption.decrypt_many(db, user_id, [row.account_number_encrypted for row in rows])
+        tokens = await encryption.encrypt_many(db, user_id, numbers)
+        
+        rewrapped = values(
+            column("id", UUID(as_uuid=True)),
+            column("account_number_encrypted", Text),
+            name="rewrapped"
+        ).data([(row.id, token) for row, token in zip(rows, tokens)])
+        
+        await db.execute(
+            update(LinkedBankAccount)
+            .where(LinkedBankAccount.id == rewrapped.c.id)
+            .values(account_number_encrypted=rewrapped.c.account_number_encrypted)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        rewritten += len(rows)
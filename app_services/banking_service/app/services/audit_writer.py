@@ -0,0 +1,171 @@
+"""
+Buffered audit log writer
+Collects AccountConnectionLog entries off the request path and writes them in batches
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database.connection import engine
+from app.database.models import AccountConnectionLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """
+    In-process buffer for AccountConnectionLog rows
+
+    `log()` never blocks or touches the database: entries go into a bounded
+    queue and a background task writes them with one multi-row INSERT once
+    `batch_size` entries are waiting or `flush_interval` seconds have passed
+    since the first one. When the queue is full new entries are dropped and
+    counted rather than slowing requests down. `stop()` drains the queue.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.AUDIT_LOG_BATCH_SIZE,
+        flush_interval: float = settings.AUDIT_LOG_FLUSH_INTERVAL_SECONDS,
+        max_queue_size: int = settings.AUDIT_LOG_MAX_QUEUE_SIZE
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Future] = None
+        self._collecting: List[Dict[str, Any]] = []
+
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def log(
+        self,
+        user_id: str,
+        action: str,
+        status: str,
+        error_message: Optional[str] = None,
+        institution_id: Optional[str] = None,
+        institution_name: Optional[str] = None,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        extra_data: Optional[Dict] = None
+    ) -> bool:
+        """
+        Queue a connection log entry
+
+        Returns:
+            False if the entry was dropped because the buffer is full
+        """
+        entry = {
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "action": action,
+            "status": status,
+            "error_message": error_message,
+            "institution_id": institution_id,
+            "institution_name": institution_name,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "extra_data": extra_data,
+            # Event time, not flush time
+            "created_at": datetime.now()
+        }
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Audit log buffer full, {self.dropped} entries dropped so far")
+            return False
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop the writer after flushing everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._writing is not None:
+            await asyncio.gather(self._writing, return_exceptions=True)
+
+        # Entries taken off the queue by a batch that was still collecting
+        batch, self._collecting = self._collecting, []
+        await self._flush(batch)
+
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Audit log shutdown flush timed out, {self._queue.qsize()} entries lost")
+
+        if self.dropped or self.failed:
+            logger.warning(f"Audit log writer stopped: {self.dropped} dropped, {self.failed} failed")
+
+    async def _drain(self):
+        while not self._queue.empty():
+            await self._flush(self._take(self.batch_size))
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = self._collecting = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                batch.extend(self._take(self.batch_size - len(batch)))
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Shield so a shutdown during a write does not lose the batch
+            self._collecting = []
+            self._writing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._writing)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(insert(AccountConnectionLog).values(batch))
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} audit log entries: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backlog": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+
+# Global writer instance
+audit_writer = AuditLogWriter()
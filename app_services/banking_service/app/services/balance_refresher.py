@@ -0,0 +1,349 @@
+"""
+Background balance refresh
+Keeps linked-account balances fresh by refreshing stale customers in batches
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import func, or_, select
+
+from app.config import settings
+from app.database.connection import SessionLocal, engine
+from app.database.models import LinkedBankAccount
+from app.services.account_sync import apply_balance_updates
+from app.services.cache import account_cache
+from app.services.mastercard_client import mastercard_client
+
+logger = logging.getLogger(__name__)
+
+# pg advisory lock key so only one replica runs a scheduling cycle at a time
+SCHEDULER_LOCK_KEY = 0x62616C72  # "balr"
+
+
+class RateLimiter:
+    """Token bucket: `rate` calls per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+@dataclass
+class RefreshJob:
+    """A user-requested refresh, completed when its customer's batch is"""
+    id: str
+    user_id: str
+    account_id: str
+    mastercard_customer_id: str
+    status: str = "queued"  # queued, running, completed, failed
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    def to_json(self) -> str:
+        fields = asdict(self)
+        for name in ("created_at", "finished_at"):
+            if fields[name] is not None:
+                fields[name] = fields[name].isoformat()
+        return json.dumps(fields)
+
+    @classmethod
+    def from_json(cls, data: str) -> "RefreshJob":
+        fields: Dict[str, Any] = json.loads(data)
+        for name in ("created_at", "finished_at"):
+            if fields[name] is not None:
+                fields[name] = datetime.fromisoformat(fields[name])
+        return cls(**fields)
+
+
+@dataclass
+class _CustomerRefresh:
+    """One pending refresh of all accounts of a Mastercard customer"""
+    customer_id: str
+    done: asyncio.Future
+    jobs: List[RefreshJob] = field(default_factory=list)
+
+
+class BalanceRefresher:
+    """
+    Refreshes linked-account balances from Mastercard in the background
+
+    Every `interval` seconds (plus jitter) the scheduler picks up to
+    `batch_size` Mastercard customers with stale accounts, oldest first,
+    and refreshes each customer with a single Mastercard call. Workers share
+    a per-partner rate limiter, and scheduled refreshes are queued after a
+    random delay so load is spread rather than bursty.
+
+    User-requested refreshes (`enqueue`) go through the same workers and
+    join a refresh already queued for the same customer. A job runs on the
+    replica that queued it, but its status is written to Redis
+    (`banking:refresh-job:{id}`, kept for `job_ttl_seconds`) so a poll
+    routed to any replica finds it. If Redis is unavailable only the
+    queuing replica can answer.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = settings.BALANCE_REFRESH_INTERVAL_SECONDS,
+        stale_after_seconds: float = settings.BALANCE_REFRESH_STALE_AFTER_SECONDS,
+        batch_size: int = settings.BALANCE_REFRESH_BATCH_SIZE,
+        concurrency: int = settings.BALANCE_REFRESH_CONCURRENCY,
+        jitter_seconds: float = settings.BALANCE_REFRESH_JITTER_SECONDS,
+        rate_per_second: float = settings.MASTERCARD_RATE_LIMIT_PER_SECOND,
+        rate_burst: int = settings.MASTERCARD_RATE_LIMIT_BURST,
+        redis_url: str = settings.REDIS_URL,
+        job_ttl_seconds: int = settings.BALANCE_REFRESH_JOB_TTL_SECONDS,
+        max_jobs: int = 10000
+    ):
+        self.interval = interval_seconds
+        self.stale_after = timedelta(seconds=stale_after_seconds)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.jitter = jitter_seconds
+        self.rate_per_second = rate_per_second
+        self.rate_burst = rate_burst
+        self.redis_url = redis_url
+        self.job_ttl_seconds = job_ttl_seconds
+        self.max_jobs = max_jobs
+
+        self._redis: Optional[redis.Redis] = None
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._pending: Dict[str, _CustomerRefresh] = {}
+        self._jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+
+        self.refreshed = 0
+        self.failed = 0
+        self.errors = 0
+        self.last_run_at: Optional[datetime] = None
+
+    def _rate_limiter(self) -> RateLimiter:
+        """Limiter shared by all refreshes against the current partner"""
+        partner_id = mastercard_client.partner_id or ""
+        if partner_id not in self._limiters:
+            self._limiters[partner_id] = RateLimiter(self.rate_per_second, self.rate_burst)
+        return self._limiters[partner_id]
+
+    async def start(self, scheduler: bool = True):
+        """Start refresh workers and, optionally, the stale-balance scheduler"""
+        if self._tasks:
+            return
+        if self._redis is None:
+            self._redis = redis.from_url(
+                self.redis_url,
+                decode_responses=True,
+                socket_timeout=1.0,
+                socket_connect_timeout=1.0
+            )
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        if scheduler:
+            self._tasks.append(asyncio.create_task(self._run_scheduler()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"banking:refresh-job:{job_id}"
+
+    async def _save_jobs(self, jobs: List[RefreshJob]):
+        """Publish job status so every replica can answer polls"""
+        if self._redis is None or not jobs:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for job in jobs:
+                    pipe.set(self._job_key(job.id), job.to_json(), ex=self.job_ttl_seconds)
+                await pipe.execute()
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Failed to store refresh job status: {e}")
+
+    async def enqueue(self, user_id: str, account_id: str, mastercard_customer_id: str) -> RefreshJob:
+        """Queue a refresh of the account's customer and return its job"""
+        job = RefreshJob(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            account_id=account_id,
+            mastercard_customer_id=mastercard_customer_id
+        )
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+        self._submit(mastercard_customer_id).jobs.append(job)
+        await self._save_jobs([job])
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[RefreshJob]:
+        """A job queued on any replica, or None if unknown or expired"""
+        job = self._jobs.get(job_id)
+        if job is not None or self._redis is None:
+            return job
+        try:
+            data = await self._redis.get(self._job_key(job_id))
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Failed to read refresh job status: {e}")
+            return None
+        return RefreshJob.from_json(data) if data is not None else None
+
+    def _submit(self, customer_id: str) -> _CustomerRefresh:
+        refresh = self._pending.get(customer_id)
+        if refresh is None:
+            refresh = _CustomerRefresh(
+                customer_id=customer_id,
+                done=asyncio.get_running_loop().create_future()
+            )
+            self._pending[customer_id] = refresh
+            self._queue.put_nowait(customer_id)
+        return refresh
+
+    async def _worker(self):
+        while True:
+            customer_id = await self._queue.get()
+            refresh = self._pending.pop(customer_id)
+            try:
+                for job in refresh.jobs:
+                    job.status = "running"
+                await self._save_jobs(refresh.jobs)
+                error = None
+                try:
+                    await self._refresh_customer(customer_id)
+                    self.refreshed += 1
+                except Exception as e:
+                    logger.error(f"Balance refresh failed for customer {customer_id}: {e}")
+                    self.failed += 1
+                    error = str(e)
+
+                for job in refresh.jobs:
+                    job.status = "failed" if error else "completed"
+                    job.error = error
+                    job.finished_at = datetime.now()
+                await self._save_jobs(refresh.jobs)
+                if not refresh.done.done():
+                    refresh.done.set_result(error is None)
+            finally:
+                if not refresh.done.done():
+                    refresh.done.cancel()
+                self._queue.task_done()
+
+    async def _refresh_customer(self, customer_id: str):
+        await self._rate_limiter().acquire()
+        accounts = await mastercard_client.refresh_customer_accounts(customer_id)
+
+        async with SessionLocal() as db:
+            user_ids = await apply_balance_updates(db, accounts)
+            await db.commit()
+
+        for user_id in user_ids:
+            await account_cache.invalidate(user_id)
+
+    async def _run_scheduler(self):
+        while True:
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Balance refresh cycle failed: {e}")
+
+    async def run_once(self) -> int:
+        """
+        Run one scheduling cycle
+
+        Holds a Postgres advisory lock until the batch is refreshed, so
+        replicas never pick the same stale customers.
+
+        Returns:
+            Number of customers refreshed in this cycle
+        """
+        async with engine.connect() as conn:
+            locked = await conn.scalar(select(func.pg_try_advisory_lock(SCHEDULER_LOCK_KEY)))
+            await conn.commit()
+            if not locked:
+                return 0
+
+            try:
+                cutoff = datetime.now() - self.stale_after
+                result = await conn.execute(
+                    select(LinkedBankAccount.mastercard_customer_id)
+                    .where(
+                        LinkedBankAccount.deleted_at.is_(None),
+                        LinkedBankAccount.status == "active",
+                        or_(
+                            LinkedBankAccount.last_updated_at.is_(None),
+                            LinkedBankAccount.last_updated_at < cutoff
+                        )
+                    )
+                    .group_by(LinkedBankAccount.mastercard_customer_id)
+                    .order_by(func.min(LinkedBankAccount.last_updated_at).nulls_first())
+                    .limit(self.batch_size)
+                )
+                customer_ids = result.scalars().all()
+                await conn.commit()
+
+                self.last_run_at = datetime.now()
+                if not customer_ids:
+                    return 0
+
+                logger.info(f"Refreshing balances for {len(customer_ids)} stale customers")
+                await asyncio.gather(*(
+                    self._submit_with_jitter(customer_id) for customer_id in customer_ids
+                ), return_exceptions=True)
+                return len(customer_ids)
+            finally:
+                await conn.execute(select(func.pg_advisory_unlock(SCHEDULER_LOCK_KEY)))
+                await conn.commit()
+
+    async def _submit_with_jitter(self, customer_id: str) -> bool:
+        """Queue a scheduled refresh after a random delay to spread load"""
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        return await asyncio.shield(self._submit(customer_id).done)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "jobs": len(self._jobs),
+            "errors": self.errors,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None
+        }
+
+
+# Global refresher instance
+balance_refresher = BalanceRefresher()
@@ -0,0 +1,267 @@
+"""
+Redis read-through cache for bank account reads
+Caches serialized account listings and details per user
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+import redis.asyncio as redis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Write a loaded value only if the user's generation did not change while
+# loading (i.e. no invalidation raced the load), and start the TTL when the
+# hash is created so entries cannot live forever.
+_SET_IF_CURRENT = """
+local gen = redis.call('GET', KEYS[2]) or ''
+if gen ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+return 1
+"""
+
+# Delete the lock only if we still own it
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class AccountCache:
+    """
+    Read-through cache for per-user account listings and account details
+
+    All entries of a user live in one Redis hash (`banking:accounts:{user_id}`),
+    so any mutation invalidates everything for that user with a single DEL.
+
+    Stampede protection: concurrent misses in this process share one load,
+    and across replicas a short Redis lock lets a single loader hit Postgres
+    while the others wait briefly for the value. Redis failures never fail a
+    request - reads fall back to the database and `healthy` turns False.
+
+    `invalidate()` also marks the user as recently written for
+    `read_your_writes_seconds` (see `recently_written()`), so reads that
+    would repopulate the cache can be sent to the primary rather than a
+    lagging replica.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        ttl_seconds: int = settings.CACHE_TTL_SECONDS,
+        lock_ttl_ms: int = settings.CACHE_LOCK_TTL_MS,
+        lock_wait_seconds: float = 2.0,
+        read_your_writes_seconds: float = settings.DATABASE_READ_YOUR_WRITES_SECONDS
+    ):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait_seconds = lock_wait_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.healthy = False
+
+        self._redis: Optional[redis.Redis] = None
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._written: Dict[str, float] = {}  # user_id -> monotonic deadline
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def connect(self):
+        """Create the Redis connection pool and check connectivity"""
+        self._redis = redis.from_url(
+            self.redis_url,
+            decode_responses=True,
+            socket_timeout=1.0,
+            socket_connect_timeout=1.0
+        )
+        self._set_if_current = self._redis.register_script(_SET_IF_CURRENT)
+        self._release_lock = self._redis.register_script(_RELEASE_LOCK)
+        await self.ping()
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def ping(self) -> bool:
+        """Check Redis and update the health flag"""
+        if self._redis is None:
+            self.healthy = False
+            return False
+        try:
+            self.healthy = bool(await self._redis.ping())
+        except redis.RedisError as e:
+            logger.warning(f"Redis cache unavailable: {e}")
+            self.healthy = False
+        return self.healthy
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"banking:accounts:{user_id}"
+
+    @staticmethod
+    def _gen_key(user_id: str) -> str:
+        return f"banking:accounts:{user_id}:gen"
+
+    @staticmethod
+    def _written_key(user_id: str) -> str:
+        return f"banking:accounts:{user_id}:written"
+
+    def _mark_error(self, action: str, error: Exception):
+        self.errors += 1
+        self.healthy = False
+        logger.warning(f"Redis cache {action} failed: {error}")
+
+    async def get_or_load(
+        self,
+        user_id: str,
+        field: str,
+        loader: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        Return the cached payload for (user_id, field), loading it on a miss
+
+        Args:
+            user_id: Owner of the cached data
+            field: Entry name within the user's hash, e.g. "list:active"
+            loader: Coroutine function producing the serialized payload
+
+        Returns:
+            Serialized payload (JSON string)
+        """
+        if self._redis is None:
+            return await loader()
+
+        try:
+            cached = await self._redis.hget(self._key(user_id), field)
+        except redis.RedisError as e:
+            self._mark_error("read", e)
+            return await loader()
+
+        if cached is not None:
+            self.hits += 1
+            self.healthy = True
+            return cached
+
+        self.misses += 1
+
+        # Coalesce concurrent misses for the same entry in this process
+        local_key = f"{user_id}\x00{field}"
+        future = self._loading.get(local_key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(user_id, field, loader))
+            self._loading[local_key] = future
+            future.add_done_callback(lambda _: self._loading.pop(local_key, None))
+        return await asyncio.shield(future)
+
+    async def _load(
+        self,
+        user_id: str,
+        field: str,
+        loader: Callable[[], Awaitable[str]]
+    ) -> str:
+        key = self._key(user_id)
+        gen_key = self._gen_key(user_id)
+        lock_key = f"{key}:lock:{field}"
+        token = uuid.uuid4().hex
+
+        try:
+            generation = await self._redis.get(gen_key) or ""
+            locked = await self._redis.set(lock_key, token, nx=True, px=self.lock_ttl_ms)
+        except redis.RedisError as e:
+            self._mark_error("lock", e)
+            return await loader()
+
+        if not locked:
+            # Another replica is loading - wait briefly for its result
+            waited = 0.0
+            while waited < self.lock_wait_seconds:
+                await asyncio.sleep(0.05)
+                waited += 0.05
+                try:
+                    cached = await self._redis.hget(key, field)
+                except redis.RedisError as e:
+                    self._mark_error("read", e)
+                    break
+                if cached is not None:
+                    return cached
+            return await loader()
+
+        try:
+            payload = await loader()
+            await self._set_if_current(
+                keys=[key, gen_key],
+                args=[generation, field, payload, self.ttl_seconds]
+            )
+            self.healthy = True
+            return payload
+        except redis.RedisError as e:
+            self._mark_error("write", e)
+            return payload
+        finally:
+            try:
+                await self._release_lock(keys=[lock_key], args=[token])
+            except redis.RedisError:
+                pass
+
+    async def invalidate(self, user_id: str):
+        """Drop every cached entry for a user (call after any mutation)"""
+        now = time.monotonic()
+        self._written[user_id] = now + self.read_your_writes_seconds
+        if len(self._written) > 10000:
+            self._written = {k: v for k, v in self._written.items() if v > now}
+
+        if self._redis is None:
+            return
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.incr(self._gen_key(user_id))
+                pipe.expire(self._gen_key(user_id), max(self.ttl_seconds * 2, 3600))
+                pipe.delete(self._key(user_id))
+                pipe.set(self._written_key(user_id), 1, px=int(self.read_your_writes_seconds * 1000))
+                await pipe.execute()
+        except redis.RedisError as e:
+            self._mark_error("invalidate", e)
+
+    async def recently_written(self, user_id: str) -> bool:
+        """
+        Whether the user's data changed within the read-your-writes window
+
+        Checks this process first, then the marker shared by all replicas.
+        Errs on the side of True when Redis cannot be asked.
+        """
+        deadline = self._written.get(user_id)
+        if deadline is not None and deadline > time.monotonic():
+            return True
+        if self._redis is None:
+            return False
+        try:
+            return bool(await self._redis.exists(self._written_key(user_id)))
+        except redis.RedisError as e:
+            self._mark_error("read", e)
+            return True
+
+    def stats(self) -> Dict:
+        return {
+            "healthy": self.healthy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "loading": len(self._loading)
+        }
+
+
+# Global cache instance
+account_cache = AccountCache()
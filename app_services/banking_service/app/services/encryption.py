@@ -0,0 +1,355 @@
+"""
+Envelope encryption for sensitive account fields
+Encrypts values with per-tenant AES-256-GCM data keys that are cached in memory
+"""
+import asyncio
+import base64
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.models import EncryptionDataKey
+
+logger = logging.getLogger(__name__)
+
+# Ciphertext format: "v1.<key version>.<base64url(nonce + ciphertext + tag)>"
+FORMAT_PREFIX = "v1"
+NONCE_SIZE = 12
+
+# Master keys shorter than this, or copied from sample configuration, are refused
+MIN_MASTER_KEY_LENGTH = 32
+PLACEHOLDER_KEYS = {
+    "your-32-character-encryption-key",
+    "your-encryption-key",
+    "changeme",
+    "change-me",
+    "secret",
+}
+
+
+class EncryptionError(Exception):
+    """Raised when a value cannot be encrypted or decrypted"""
+
+
+def check_master_key(master_key: str):
+    """
+    Refuse master keys that are too short or published placeholders
+
+    Raises:
+        EncryptionError: If the key must not be used
+    """
+    if master_key.strip().lower() in PLACEHOLDER_KEYS:
+        raise EncryptionError("ENCRYPTION_KEY is a placeholder value; generate a random key or leave it unset")
+    if len(master_key) < MIN_MASTER_KEY_LENGTH:
+        raise EncryptionError(f"ENCRYPTION_KEY must be at least {MIN_MASTER_KEY_LENGTH} characters")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def key_version(token: str) -> int:
+    """Data key version an encrypted value was written with"""
+    try:
+        prefix, version, _ = token.split(".", 2)
+        if prefix != FORMAT_PREFIX:
+            raise ValueError(prefix)
+        return int(version)
+    except ValueError:
+        raise EncryptionError("Unrecognised ciphertext format")
+
+
+class EnvelopeEncryption:
+    """
+    Per-tenant envelope encryption
+
+    The master key (`ENCRYPTION_KEY`) is stretched once with HKDF into a
+    key-encryption key and never touches row data. Each tenant (user) gets
+    random 256-bit data keys, stored wrapped in `encryption_data_keys`;
+    values are encrypted with AES-GCM under the tenant's newest key, with
+    the tenant id as associated data so ciphertexts cannot be moved between
+    tenants. Encryption is off unless a master key is set; short or
+    placeholder keys are refused at startup.
+
+    Unwrapped data keys are kept in a bounded LRU for `cache_ttl` seconds,
+    so a batch of thousands of values costs one key lookup (and at most one
+    unwrap) rather than one per row. `rotate()` adds a new key version;
+    older versions keep decrypting until the values that still use them
+    are rewritten (see account_sync.reencrypt_account_numbers).
+    """
+
+    def __init__(
+        self,
+        master_key: Optional[str] = settings.ENCRYPTION_KEY,
+        cache_size: int = settings.ENCRYPTION_DATA_KEY_CACHE_SIZE,
+        cache_ttl_seconds: float = settings.ENCRYPTION_DATA_KEY_CACHE_TTL_SECONDS,
+        max_key_age_days: Optional[int] = settings.ENCRYPTION_DATA_KEY_MAX_AGE_DAYS
+    ):
+        self._kek: Optional[AESGCM] = None
+        if master_key:
+            check_master_key(master_key)
+            self._kek = AESGCM(HKDF(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=None,
+                info=b"banking_service/data-key-wrapping"
+            ).derive(master_key.encode()))
+
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl_seconds
+        self.max_key_age = max_key_age_days * 86400 if max_key_age_days else None
+
+        # (tenant_id, version) -> (cipher, cached_at)
+        self._keys: "OrderedDict[Tuple[str, int], Tuple[AESGCM, float]]" = OrderedDict()
+        # tenant_id -> (active version, key created_at epoch, cached_at)
+        self._active: Dict[str, Tuple[int, float, float]] = {}
+        # Striped so the lock table does not grow with the number of tenants
+        self._locks = [asyncio.Lock() for _ in range(64)]
+
+        self.unwraps = 0
+        self.keys_created = 0
+        self.cache_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._kek is not None
+
+    def _require_enabled(self):
+        if self._kek is None:
+            raise EncryptionError("ENCRYPTION_KEY is not configured")
+
+    def _wrap(self, tenant_id: str, version: int, data_key: bytes) -> str:
+        nonce = os.urandom(NONCE_SIZE)
+        aad = f"{tenant_id}:{version}".encode()
+        return base64.b64encode(nonce + self._kek.encrypt(nonce, data_key, aad)).decode()
+
+    def _unwrap(self, tenant_id: str, version: int, wrapped: str) -> AESGCM:
+        raw = base64.b64decode(wrapped)
+        aad = f"{tenant_id}:{version}".encode()
+        try:
+            data_key = self._kek.decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], aad)
+        except InvalidTag:
+            raise EncryptionError(f"Cannot unwrap data key {version} of tenant {tenant_id}")
+        self.unwraps += 1
+        return AESGCM(data_key)
+
+    def _cache_key(self, tenant_id: str, version: int, cipher: AESGCM):
+        self._keys[(tenant_id, version)] = (cipher, time.monotonic())
+        self._keys.move_to_end((tenant_id, version))
+        while len(self._keys) > self.cache_size:
+            self._keys.popitem(last=False)
+
+    def _cached_key(self, tenant_id: str, version: int) -> Optional[AESGCM]:
+        cached = self._keys.get((tenant_id, version))
+        if cached is None or time.monotonic() - cached[1] > self.cache_ttl:
+            return None
+        self._keys.move_to_end((tenant_id, version))
+        self.cache_hits += 1
+        return cached[0]
+
+    def _lock(self, tenant_id: str) -> asyncio.Lock:
+        return self._locks[hash(tenant_id) % len(self._locks)]
+
+    async def _get_key(self, db: AsyncSession, tenant_id: str, version: int) -> AESGCM:
+        cipher = self._cached_key(tenant_id, version)
+        if cipher is not None:
+            return cipher
+        async with self._lock(tenant_id):
+            cipher = self._cached_key(tenant_id, version)
+            if cipher is not None:
+                return cipher
+            wrapped = await db.scalar(
+                select(EncryptionDataKey.wrapped_key).where(
+                    EncryptionDataKey.tenant_id == tenant_id,
+                    EncryptionDataKey.version == version
+                )
+            )
+            if wrapped is None:
+                raise EncryptionError(f"Unknown data key {version} for tenant {tenant_id}")
+            cipher = self._unwrap(tenant_id, version, wrapped)
+            self._cache_key(tenant_id, version, cipher)
+            return cipher
+
+    async def _active_key(self, db: AsyncSession, tenant_id: str) -> Tuple[int, AESGCM]:
+        active = self._active.get(tenant_id)
+        if active is None or time.monotonic() - active[2] > self.cache_ttl or self._expired(active[1]):
+            async with self._lock(tenant_id):
+                active = self._active.get(tenant_id)
+                if active is None or time.monotonic() - active[2] > self.cache_ttl or self._expired(active[1]):
+                    active = await self._load_active(db, tenant_id)
+        return active[0], await self._get_key(db, tenant_id, active[0])
+
+    def _expired(self, created_at: float) -> bool:
+        return self.max_key_age is not None and time.time() - created_at > self.max_key_age
+
+    async def _load_active(self, db: AsyncSession, tenant_id: str) -> Tuple[int, float, float]:
+        """Read (or create) the newest data key; callers hold the tenant lock"""
+        row = (await db.execute(
+            select(EncryptionDataKey.version, EncryptionDataKey.wrapped_key, EncryptionDataKey.created_at)
+            .where(EncryptionDataKey.tenant_id == tenant_id)
+            .order_by(EncryptionDataKey.version.desc())
+            .limit(1)
+        )).first()
+
+        if row is None or self._expired(row.created_at.timestamp()):
+            version = await self._create_key(db, tenant_id, (row.version if row else 0) + 1)
+            return await self._load_active(db, tenant_id) if version is None else self._active[tenant_id]
+
+        if self._cached_key(tenant_id, row.version) is None:
+            self._cache_key(tenant_id, row.version, self._unwrap(tenant_id, row.version, row.wrapped_key))
+        active = (row.version, row.created_at.timestamp(), time.monotonic())
+        self._active[tenant_id] = active
+        return active
+
+    async def _create_key(self, db: AsyncSession, tenant_id: str, version: int) -> Optional[int]:
+        """
+        Insert a new data key version
+
+        Returns:
+            The version, or None if another replica created it first
+        """
+        data_key = AESGCM.generate_key(bit_length=256)
+        stmt = insert(EncryptionDataKey).values(
+            tenant_id=tenant_id,
+            version=version,
+            wrapped_key=self._wrap(tenant_id, version, data_key)
+        ).on_conflict_do_nothing(
+            constraint="uq_encryption_data_keys_tenant_version"
+        ).returning(EncryptionDataKey.created_at)
+
+        # Own transaction so the key survives even if the caller's rolls back
+        async with db.bind.connect() as conn:
+            created_at = await conn.scalar(stmt)
+            await conn.commit()
+        if created_at is None:
+            return None
+
+        self.keys_created += 1
+        self._cache_key(tenant_id, version, AESGCM(data_key))
+        self._active[tenant_id] = (version, created_at.timestamp(), time.monotonic())
+        logger.info(f"Created data key version {version} for tenant {tenant_id}")
+        return version
+
+    async def encrypt_many(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        values: Sequence[Optional[str]]
+    ) -> List[Optional[str]]:
+        """
+        Encrypt a batch of values for one tenant (None stays None)
+
+        Args:
+            db: Database session (used only on a key cache miss)
+            tenant_id: Tenant owning the values (our user ID)
+            values: Plaintext strings
+
+        Returns:
+            Ciphertext tokens in the same order
+        """
+        self._require_enabled()
+        if not any(value is not None for value in values):
+            return [None] * len(values)
+
+        version, cipher = await self._active_key(db, tenant_id)
+        prefix = f"{FORMAT_PREFIX}.{version}."
+        aad = tenant_id.encode()
+        encrypted = []
+        for value in values:
+            if value is None:
+                encrypted.append(None)
+                continue
+            nonce = os.urandom(NONCE_SIZE)
+            encrypted.append(prefix + _b64encode(nonce + cipher.encrypt(nonce, value.encode(), aad)))
+        return encrypted
+
+    async def decrypt_many(
+        self,
+        db: AsyncSession,
+        tenant_id: str,
+        tokens: Sequence[Optional[str]]
+    ) -> List[Optional[str]]:
+        """
+        Decrypt a batch of values of one tenant, whatever key versions they use
+
+        Raises:
+            EncryptionError: If a value is malformed, tampered with or from another tenant
+        """
+        self._require_enabled()
+        ciphers: Dict[int, AESGCM] = {}
+        aad = tenant_id.encode()
+        decrypted = []
+        for token in tokens:
+            if token is None:
+                decrypted.append(None)
+                continue
+            version = key_version(token)
+            if version not in ciphers:
+                ciphers[version] = await self._get_key(db, tenant_id, version)
+            raw = _b64decode(token.split(".", 2)[2])
+            try:
+                decrypted.append(ciphers[version].decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], aad).decode())
+            except InvalidTag:
+                raise EncryptionError(f"Cannot decrypt value for tenant {tenant_id}")
+        return decrypted
+
+    async def active_version(self, db: AsyncSession, tenant_id: str) -> int:
+        """Key version new values of the tenant are encrypted with"""
+        self._require_enabled()
+        return (await self._active_key(db, tenant_id))[0]
+
+    async def encrypt(self, db: AsyncSession, tenant_id: str, value: Optional[str]) -> Optional[str]:
+        return (await self.encrypt_many(db, tenant_id, [value]))[0]
+
+    async def decrypt(self, db: AsyncSession, tenant_id: str, token: Optional[str]) -> Optional[str]:
+        return (await self.decrypt_many(db, tenant_id, [token]))[0]
+
+    async def rotate(self, db: AsyncSession, tenant_id: str) -> int:
+        """
+        Start a new data key version for a tenant
+
+        New values use it immediately; existing values stay readable.
+
+        Returns:
+            The active version after rotation
+        """
+        self._require_enabled()
+        async with self._lock(tenant_id):
+            current = await db.scalar(
+                select(func.max(EncryptionDataKey.version))
+                .where(EncryptionDataKey.tenant_id == tenant_id)
+            )
+            version = await self._create_key(db, tenant_id, (current or 0) + 1)
+            if version is None:
+                # Lost the race to another replica; use its key
+                self._active.pop(tenant_id, None)
+                version = (await self._load_active(db, tenant_id))[0]
+            return version
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "cached_keys": len(self._keys),
+            "cache_hits": self.cache_hits,
+            "unwraps": self.unwraps,
+            "keys_created": self.keys_created
+        }
+
+
+# Global encryption instance
+encryption = EnvelopeEncryption()
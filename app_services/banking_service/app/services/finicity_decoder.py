@@ -0,0 +1,159 @@
+"""
+Finicity account decoding
+Streams XML (or reads JSON) account payloads straight into typed records
+"""
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+@dataclass(slots=True)
+class FinicityAccount:
+    """One Mastercard/Finicity account, reduced to the fields we store"""
+    id: str
+    name: str = "Unknown Account"
+    number_display: str = "****"
+    type: str = "unknown"
+    status: Optional[str] = None
+    customer_id: Optional[str] = None
+    institution_id: str = ""
+    institution_name: str = "Unknown"
+    institution_logo: Optional[str] = None
+    balance: Optional[Decimal] = None
+    available_balance: Optional[Decimal] = None
+    currency: str = "USD"
+    number: Optional[str] = None  # Full account number; stored encrypted, never cached
+
+    @classmethod
+    def from_fields(cls, fields: Dict[str, Any]) -> "FinicityAccount":
+        """Build a record from Finicity field names (JSON keys or XML tags)"""
+        available = fields.get("availableBalance")
+        if available is None:
+            available = fields.get("availableBalanceAmount")
+        if available is None and isinstance(fields.get("detail"), dict):
+            available = fields["detail"].get("availableBalanceAmount")
+        return cls(
+            id=str(fields["id"]),
+            name=fields.get("name") or "Unknown Account",
+            number_display=fields.get("accountNumberDisplay") or "****",
+            type=fields.get("type") or "unknown",
+            status=fields.get("status"),
+            customer_id=_str_or_none(fields.get("customerId")),
+            institution_id=str(fields.get("institutionId") or ""),
+            institution_name=fields.get("institutionName") or "Unknown",
+            institution_logo=fields.get("institutionLogo"),
+            balance=_decimal(fields.get("balance")),
+            available_balance=_decimal(available),
+            currency=fields.get("currency") or "USD",
+            number=_str_or_none(fields.get("number"))
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain JSON-safe dict (balances as strings, no account number), e.g. for caching"""
+        fields = asdict(self)
+        del fields["number"]
+        for name in ("balance", "available_balance"):
+            if fields[name] is not None:
+                fields[name] = str(fields[name])
+        return fields
+
+    @classmethod
+    def from_dict(cls, fields: Dict[str, Any]) -> "FinicityAccount":
+        """Inverse of to_dict"""
+        account = cls(**fields)
+        account.balance = _decimal(account.balance)
+        account.available_balance = _decimal(account.available_balance)
+        return account
+
+
+# Finicity tags we keep; everything else in an <account> is skipped
+_FIELDS = frozenset({
+    "id", "name", "accountNumberDisplay", "type", "status", "customerId",
+    "institutionId", "institutionName", "institutionLogo", "balance",
+    "availableBalance", "availableBalanceAmount", "currency", "number"
+})
+
+
+def _str_or_none(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _decimal(value: Any) -> Optional[Decimal]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, Decimal):
+        return value
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+class AccountStreamDecoder:
+    """
+    Incremental decoder for Finicity `<accounts>` / `<account>` XML
+
+    Feed response chunks as they arrive; each completed `<account>` is
+    yielded as a FinicityAccount and its subtree is cleared, so memory
+    stays flat regardless of payload size and no intermediate dict tree
+    is built. Fields of direct children win over same-named tags nested
+    deeper in the account (e.g. `detail/availableBalanceAmount`).
+    """
+
+    def __init__(self):
+        # Only "end" events: one Python step per element instead of two
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def feed(self, chunk: bytes) -> Iterator[FinicityAccount]:
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self) -> Iterator[FinicityAccount]:
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self) -> Iterator[FinicityAccount]:
+        for _, elem in self._parser.read_events():
+            if elem.tag != "account":
+                continue
+
+            fields = dict(elem.attrib)
+            nested = []
+            for child in elem:
+                if len(child):
+                    nested.append(child)
+                elif child.tag in _FIELDS:
+                    fields[child.tag] = child.text.strip() if child.text else None
+            for child in nested:
+                for leaf in child.iter():
+                    if leaf.tag in _FIELDS and not len(leaf):
+                        fields.setdefault(leaf.tag, leaf.text.strip() if leaf.text else None)
+
+            elem.clear()
+            if "id" in fields:
+                yield FinicityAccount.from_fields(fields)
+
+
+def decode_accounts_xml(chunks: Iterable[bytes]) -> List[FinicityAccount]:
+    """Decode a complete XML payload given as one or more byte chunks"""
+    if isinstance(chunks, (bytes, bytearray)):
+        chunks = (chunks,)
+    decoder = AccountStreamDecoder()
+    accounts = []
+    for chunk in chunks:
+        accounts.extend(decoder.feed(chunk))
+    accounts.extend(decoder.close())
+    return accounts
+
+
+def decode_accounts_json(payload: Any) -> List[FinicityAccount]:
+    """Decode a parsed JSON payload: an accounts list, a wrapper or one account"""
+    if isinstance(payload, dict):
+        if "accounts" in payload:
+            payload = payload["accounts"]
+        elif "account" in payload:
+            payload = payload["account"]
+    if isinstance(payload, dict):
+        payload = [payload]
+    return [FinicityAccount.from_fields(item) for item in payload or [] if "id" in item]
@@ -2,13 +2,21 @@
 Mastercard Open Finance API Client
 Handles authentication and API calls to Mastercard/Finicity
 """
+import asyncio
 import httpx
-import base64
 import logging
+import random
 import xml.etree.ElementTree as ET
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
+from decimal import Decimal
 from app.config import settings
+from app.services.finicity_decoder import (
+    AccountStreamDecoder,
+    FinicityAccount,
+    decode_accounts_json
+)
+from app.services.partner_cache import partner_cache
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +33,78 @@ class MastercardClient:
         
         self.access_token: Optional[str] = None
         self.token_expires_at: Optional[datetime] = None
+        self.token_refresh_margin = timedelta(seconds=settings.MASTERCARD_TOKEN_REFRESH_MARGIN_SECONDS)
+        self.token_fetches = 0
+        
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token_lock = asyncio.Lock()
+        self._renewal_task: Optional[asyncio.Task] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Shared pooled client, created lazily so keep-alive connections are reused"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=settings.MASTERCARD_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.MASTERCARD_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.MASTERCARD_KEEPALIVE_EXPIRY
+                ),
+                follow_redirects=True,
+                verify=True
+            )
+        return self._client
+    
+    async def startup(self):
+        """Open the connection pool and start proactive token renewal"""
+        self._get_client()
+        if self._renewal_task is None and self.partner_id and self.partner_secret:
+            self._renewal_task = asyncio.create_task(self._renew_token_loop())
+    
+    async def shutdown(self):
+        """Stop token renewal and close pooled connections"""
+        if self._renewal_task is not None:
+            self._renewal_task.cancel()
+            try:
+                await self._renewal_task
+            except asyncio.CancelledError:
+                pass
+            self._renewal_task = None
+        
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _token_valid(self, margin: timedelta = timedelta(0)) -> bool:
+        return bool(
+            self.access_token
+            and self.token_expires_at
+            and datetime.now() + margin < self.token_expires_at
+        )
+    
+    async def _renew_token_loop(self):
+        """
+        Renew the partner token before it expires
+        
+        Requests then never wait on a token fetch; if renewal fails the token
+        is still valid for the rest of the margin and renewal is retried.
+        """
+        while True:
+            try:
+                if self._token_valid(self.token_refresh_margin):
+                    delay = (self.token_expires_at - self.token_refresh_margin - datetime.now()).total_seconds()
+                    # Jitter so replicas do not renew in lockstep
+                    await asyncio.sleep(max(delay, 0) + random.uniform(0, 30))
+                    continue
+                
+                async with self._token_lock:
+                    if not self._token_valid(self.token_refresh_margin):
+                        await self._fetch_access_token()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Background Mastercard token renewal failed: {e}")
+                await asyncio.sleep(30)
     
     def _xml_element_to_dict(self, element: ET.Element) -> Dict:
         """Convert XML element to dictionary recursively"""
@@ -78,63 +158,62 @@ class MastercardClient:
     async def _get_access_token(self) -> str:
         """
         Get OAuth access token for API calls
-        Token is valid for 1 hour
+        Token is valid for 2 hours and renewed in the background before expiry
         """
         # Check if we have a valid cached token
-        if self.access_token and self.token_expires_at:
-            if datetime.now() < self.token_expires_at:
-                return self.access_token
-        
-        # Request new token
-        auth_string = f"{self.partner_id}:{self.partner_secret}"
-        auth_bytes = base64.b64encode(auth_string.encode())
+        if self._token_valid():
+            return self.access_token
         
-        # Create client with proper timeout and limits
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            follow_redirects=True,
-            verify=True
-        ) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/aggregation/v2/partners/authentication",
-                    headers={
-                        "Finicity-App-Key": self.app_key,
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "partnerId": self.partner_id,
-                        "partnerSecret": self.partner_secret
-                    }
-                )
-                response.raise_for_status()
-                
-                # Mastercard returns XML, not JSON
-                if 'xml' in response.headers.get('content-type', '').lower():
-                    # Parse XML response
-                    root = ET.fromstring(response.text)
-                    token_elem = root.find('.//token')
-                    if token_elem is not None:
-                        self.access_token = token_elem.text
-                    else:
-                        raise ValueError("No token found in XML response")
-                else:
-                    # Try JSON parsing
-                    data = response.json()
-                    self.access_token = data["token"]
-                
-                # Finicity tokens are valid for 2 hours
-                self.token_expires_at = datetime.now() + timedelta(hours=2, minutes=-5)
-                
-                logger.info("Successfully obtained Mastercard access token")
+        # Single-flight: concurrent callers wait for one fetch
+        async with self._token_lock:
+            if self._token_valid():
                 return self.access_token
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to get access token: {e}")
-                raise
-            except Exception as e:
-                logger.error(f"Error getting access token: {e}")
-                raise
+            return await self._fetch_access_token()
+    
+    async def _fetch_access_token(self) -> str:
+        """Request a new partner token (callers must hold _token_lock)"""
+        self.token_fetches += 1
+        client = self._get_client()
+        try:
+            response = await client.post(
+                f"{self.base_url}/aggregation/v2/partners/authentication",
+                headers={
+                    "Finicity-App-Key": self.app_key,
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "partnerId": self.partner_id,
+                    "partnerSecret": self.partner_secret
+                }
+            )
+            response.raise_for_status()
+            
+            # Mastercard returns XML, not JSON
+            if 'xml' in response.headers.get('content-type', '').lower():
+                # Parse XML response
+                root = ET.fromstring(response.text)
+                token_elem = root.find('.//token')
+                if token_elem is not None:
+                    self.access_token = token_elem.text
+                else:
+                    raise ValueError("No token found in XML response")
+            else:
+                # Try JSON parsing
+                data = response.json()
+                self.access_token = data["token"]
+            
+            # Finicity tokens are valid for 2 hours
+            self.token_expires_at = datetime.now() + timedelta(hours=2, minutes=-5)
+            
+            logger.info("Successfully obtained Mastercard access token")
+            return self.access_token
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to get access token: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Error getting access token: {e}")
+            raise
     
     async def create_customer(self, user_id: str, username: str) -> Dict:
         """
@@ -149,69 +228,62 @@ class MastercardClient:
         """
         token = await self._get_access_token()
         
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            follow_redirects=True,
-            verify=True
-        ) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/aggregation/v2/customers/testing",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key,
-                        "Content-Type": "application/json"
-                    },
-                    json={"username": username}
-                )
-                response.raise_for_status()
-                
-                # Parse XML or JSON response
-                data = self._parse_response(response)
-                
-                # Extract customer ID from different response formats
-                customer_id = None
-                if isinstance(data, dict):
-                    # XML format: {id: 'value', username: 'value', ...}
-                    customer_id = data.get('id') or data.get('customerId')
-                    # Create consistent response format
-                    result = {
-                        "id": customer_id,
-                        "username": data.get('username', username),
-                        "createdDate": data.get('createdDate', str(datetime.now()))
-                    }
-                else:
-                    result = data
-                
-                logger.info(f"Created Mastercard customer {customer_id} for user {user_id}")
-                return result
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to create customer: {e}")
-                raise
+        client = self._get_client()
+        try:
+            response = await client.post(
+                f"{self.base_url}/aggregation/v2/customers/testing",
+                headers={
+                    "Finicity-App-Token": token,
+                    "Finicity-App-Key": self.app_key,
+                    "Content-Type": "application/json"
+                },
+                json={"username": username}
+            )
+            response.raise_for_status()
+            
+            # Parse XML or JSON response
+            data = self._parse_response(response)
+            
+            # Extract customer ID from different response formats
+            customer_id = None
+            if isinstance(data, dict):
+                # XML format: {id: 'value', username: 'value', ...}
+                customer_id = data.get('id') or data.get('customerId')
+                # Create consistent response format
+                result = {
+                    "id": customer_id,
+                    "username": data.get('username', username),
+                    "createdDate": data.get('createdDate', str(datetime.now()))
+                }
+            else:
+                result = data
+            
+            logger.info(f"Created Mastercard customer {customer_id} for user {user_id}")
+            return result
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to create customer: {e}")
+            raise
     
     async def get_customer(self, customer_id: str) -> Dict:
         """Get customer details"""
         token = await self._get_access_token()
         
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            verify=True
-        ) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/aggregation/v1/customers/{customer_id}",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key
-                    }
-                )
-                response.raise_for_status()
-                return self._parse_response(response)
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to get customer: {e}")
-                raise
+        client = self._get_client()
+        try:
+            response = await client.get(
+                f"{self.base_url}/aggregation/v1/customers/{customer_id}",
+                headers={
+                    "Finicity-App-Token": token,
+                    "Finicity-App-Key": self.app_key
+                }
+            )
+            response.raise_for_status()
+            return self._parse_response(response)
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to get customer: {e}")
+            raise
     
     async def generate_connect_url(
         self, 
@@ -247,105 +319,126 @@ class MastercardClient:
         if webhook_url:
             payload["webhook"] = webhook_url
         
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            verify=True
-        ) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/connect/v2/generate",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key,
-                        "Content-Type": "application/json"
-                    },
-                    json=payload
-                )
-                response.raise_for_status()
-                
-                data = self._parse_response(response)
-                connect_url = data.get("link") or data.get("url")
-                
-                if not connect_url:
-                    logger.error(f"No connect URL in response: {data}")
-                    raise ValueError("No connect URL returned from API")
-                
-                logger.info(f"Generated Connect URL for customer {customer_id}")
-                return connect_url
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to generate Connect URL: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    logger.error(f"Response text: {e.response.text}")
-                raise
+        client = self._get_client()
+        try:
+            response = await client.post(
+                f"{self.base_url}/connect/v2/generate",
+                headers={
+                    "Finicity-App-Token": token,
+                    "Finicity-App-Key": self.app_key,
+                    "Content-Type": "application/json"
+                },
+                json=payload
+            )
+            response.raise_for_status()
+            
+            data = self._parse_response(response)
+            connect_url = data.get("link") or data.get("url")
+            
+            if not connect_url:
+                logger.error(f"No connect URL in response: {data}")
+                raise ValueError("No connect URL returned from API")
+            
+            logger.info(f"Generated Connect URL for customer {customer_id}")
+            # Accounts are about to change; don't serve pre-link listings
+            await partner_cache.invalidate(customer_id)
+            return connect_url
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to generate Connect URL: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response text: {e.response.text}")
+            raise
+    
+    async def _fetch_accounts(
+        self,
+        method: str,
+        url: str,
+        timeout: Optional[httpx.Timeout] = None
+    ) -> List[FinicityAccount]:
+        """
+        Call an accounts endpoint and decode the body into typed records
+        
+        JSON is requested first; XML bodies are decoded incrementally while
+        they stream in instead of being buffered and converted to dicts.
+        """
+        token = await self._get_access_token()
+        client = self._get_client()
+        
+        request = client.build_request(
+            method,
+            url,
+            headers={
+                "Finicity-App-Token": token,
+                "Finicity-App-Key": self.app_key,
+                "Accept": "application/json, application/xml;q=0.9"
+            },
+            timeout=timeout or client.timeout
+        )
+        response = await client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+            
+            content_type = response.headers.get('content-type', '').lower()
+            if 'xml' in content_type:
+                decoder = AccountStreamDecoder()
+                accounts = []
+                async for chunk in response.aiter_bytes():
+                    accounts.extend(decoder.feed(chunk))
+                accounts.extend(decoder.close())
+                return accounts
+            
+            await response.aread()
+            return decode_accounts_json(response.json(parse_float=Decimal))
+        finally:
+            await response.aclose()
     
-    async def get_customer_accounts(self, customer_id: str) -> List[Dict]:
+    async def get_customer_accounts(self, customer_id: str) -> List[FinicityAccount]:
         """
         Get all linked accounts for a customer
         
+        Served through the stale-while-revalidate partner cache.
+        
         Args:
             customer_id: Mastercard customer ID
         
         Returns:
-            List of account dictionaries
+            List of account records
         """
-        token = await self._get_access_token()
-        
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            verify=True
-        ) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key
-                    }
+        try:
+            accounts = await partner_cache.get(
+                customer_id,
+                "accounts",
+                lambda: self._fetch_accounts(
+                    "GET",
+                    f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts"
                 )
-                response.raise_for_status()
-                
-                data = self._parse_response(response)
-                
-                # Handle both XML and JSON response formats
-                accounts = []
-                if isinstance(data, dict):
-                    accounts = data.get("accounts", data.get("account", []))
-                    # Ensure it's a list
-                    if not isinstance(accounts, list):
-                        accounts = [accounts] if accounts else []
-                
-                logger.info(f"Retrieved {len(accounts)} accounts for customer {customer_id}")
-                return accounts
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to get accounts: {e}")
-                raise
+            )
+            logger.info(f"Retrieved {len(accounts)} accounts for customer {customer_id}")
+            return accounts
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to get accounts: {e}")
+            raise
     
-    async def get_account_details(self, customer_id: str, account_id: str) -> Dict:
-        """Get detailed information for a specific account"""
-        token = await self._get_access_token()
-        
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            verify=True
-        ) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts/{account_id}",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key
-                    }
+    async def get_account_details(self, customer_id: str, account_id: str) -> Optional[FinicityAccount]:
+        """Get detailed information for a specific account (cached like get_customer_accounts)"""
+        try:
+            accounts = await partner_cache.get(
+                customer_id,
+                f"account:{account_id}",
+                lambda: self._fetch_accounts(
+                    "GET",
+                    f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts/{account_id}"
                 )
-                response.raise_for_status()
-                return self._parse_response(response)
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to get account details: {e}")
-                raise
+            )
+            return self._pick_account(accounts, account_id)
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to get account details: {e}")
+            raise
     
-    async def refresh_account(self, customer_id: str, account_id: str) -> Dict:
+    async def refresh_account(self, customer_id: str, account_id: str) -> Optional[FinicityAccount]:
         """
         Refresh account data (balance, transactions)
         
@@ -354,31 +447,56 @@ class MastercardClient:
             account_id: Mastercard account ID
         
         Returns:
-            Updated account data
+            Updated account record, or None if the response did not include it
         """
-        token = await self._get_access_token()
+        try:
+            accounts = await self._fetch_accounts(
+                "POST",
+                f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts/{account_id}",
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+            logger.info(f"Refreshed account {account_id}")
+            # The customer's cached listing still has the old balance
+            await partner_cache.invalidate(customer_id)
+            await partner_cache.put(customer_id, f"account:{account_id}", accounts)
+            return self._pick_account(accounts, account_id)
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to refresh account: {e}")
+            raise
+    
+    async def refresh_customer_accounts(self, customer_id: str) -> List[FinicityAccount]:
+        """
+        Refresh every account of a customer in one call
         
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(60.0, connect=10.0),
-            verify=True
-        ) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts/{account_id}",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key
-                    }
-                )
-                response.raise_for_status()
-                
-                data = self._parse_response(response)
-                logger.info(f"Refreshed account {account_id}")
-                return data
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to refresh account: {e}")
-                raise
+        Args:
+            customer_id: Mastercard customer ID
+        
+        Returns:
+            Updated account records
+        """
+        try:
+            accounts = await self._fetch_accounts(
+                "POST",
+                f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts",
+                timeout=httpx.Timeout(120.0, connect=10.0)
+            )
+            logger.info(f"Refreshed {len(accounts)} accounts for customer {customer_id}")
+            await partner_cache.invalidate(customer_id)
+            await partner_cache.put(customer_id, "accounts", accounts)
+            return accounts
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to refresh customer accounts: {e}")
+            raise
+    
+    @staticmethod
+    def _pick_account(accounts: List[FinicityAccount], account_id: str) -> Optional[FinicityAccount]:
+        """The requested account from a response that may list several"""
+        for account in accounts:
+            if account.id == str(account_id):
+                return account
+        return accounts[0] if len(accounts) == 1 else None
     
     async def delete_account(self, customer_id: str, account_id: str) -> bool:
         """
@@ -393,26 +511,44 @@ class MastercardClient:
         """
         token = await self._get_access_token()
         
-        async with httpx.AsyncClient(
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            verify=True
-        ) as client:
-            try:
-                response = await client.delete(
-                    f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts/{account_id}",
-                    headers={
-                        "Finicity-App-Token": token,
-                        "Finicity-App-Key": self.app_key
-                    }
-                )
-                response.raise_for_status()
-                
-                logger.info(f"Deleted account {account_id} from Mastercard")
-                return True
-                
-            except httpx.HTTPError as e:
-                logger.error(f"Failed to delete account: {e}")
-                return False
+        client = self._get_client()
+        try:
+            response = await client.delete(
+                f"{self.base_url}/aggregation/v1/customers/{customer_id}/accounts/{account_id}",
+                headers={
+                    "Finicity-App-Token": token,
+                    "Finicity-App-Key": self.app_key
+                }
+            )
+            response.raise_for_status()
+            
+            logger.info(f"Deleted account {account_id} from Mastercard")
+            await partner_cache.invalidate(customer_id)
+            return True
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to delete account: {e}")
+            return False
+
+    
+    def stats(self) -> Dict:
+        """Token, connection pool and partner cache statistics"""
+        stats = {
+            "token_valid": self._token_valid(),
+            "token_expires_at": self.token_expires_at.isoformat() if self.token_expires_at else None,
+            "token_fetches": self.token_fetches,
+            "renewal_running": self._renewal_task is not None and not self._renewal_task.done(),
+            "cache": partner_cache.stats()
+        }
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        if pool is not None:
+            connections = list(pool.connections)
+            stats["pool"] = {
+                "connections": len(connections),
+                "idle": sum(1 for c in connections if c.is_idle()),
+                "max_connections": settings.MASTERCARD_MAX_CONNECTIONS
+            }
+        return stats
 
 
 # Global client instance
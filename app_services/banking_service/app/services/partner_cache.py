@@ -0,0 +1,262 @@
+"""
+Stale-while-revalidate cache for Mastercard account reads
+Serves recent partner responses from Redis and refreshes them in the background
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import redis.asyncio as redis
+
+from app.config import settings
+from app.services.cache import _RELEASE_LOCK
+from app.services.finicity_decoder import FinicityAccount
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[List[FinicityAccount]]]
+
+
+def _accounts(entry: Dict[str, Any]) -> List[FinicityAccount]:
+    return [FinicityAccount.from_dict(fields) for fields in entry["accounts"]]
+
+
+def _retry_after(error: httpx.HTTPStatusError, default: float) -> float:
+    try:
+        return max(float(error.response.headers.get("retry-after", default)), 1.0)
+    except ValueError:
+        return default
+
+
+class PartnerCache:
+    """
+    Stale-while-revalidate cache in front of Mastercard account reads
+
+    Entries of a customer live in one Redis hash (`banking:partner:{customer_id}`,
+    fields like "accounts" or "account:{id}") so they can be dropped together.
+    Each entry records when it stops being fresh and when it stops being
+    servable:
+
+    - fresh: returned without calling Mastercard
+    - stale: returned immediately while one background revalidation runs
+      (one per key across replicas, via a short Redis lock)
+    - expired or missing: loaded synchronously, concurrent callers share it
+
+    A 429 from Mastercard pushes the entry's stale window out by Retry-After
+    (or `rate_limit_extend_seconds`) and pauses revalidation until then, so
+    rate limiting degrades to slightly older data instead of errors.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        fresh_seconds: float = settings.MASTERCARD_CACHE_FRESH_SECONDS,
+        stale_seconds: float = settings.MASTERCARD_CACHE_STALE_SECONDS,
+        rate_limit_extend_seconds: float = settings.MASTERCARD_CACHE_RATE_LIMIT_EXTEND_SECONDS,
+        lock_ttl_ms: int = 30000
+    ):
+        self.redis_url = redis_url
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.rate_limit_extend_seconds = rate_limit_extend_seconds
+        self.lock_ttl_ms = lock_ttl_ms
+
+        self._redis: Optional[redis.Redis] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._revalidating: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    async def connect(self):
+        self._redis = redis.from_url(
+            self.redis_url,
+            decode_responses=True,
+            socket_timeout=1.0,
+            socket_connect_timeout=1.0
+        )
+        self._release_lock = self._redis.register_script(_RELEASE_LOCK)
+
+    async def close(self):
+        for task in list(self._revalidating.values()):
+            task.cancel()
+        await asyncio.gather(*self._revalidating.values(), return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    @staticmethod
+    def _key(customer_id: str) -> str:
+        return f"banking:partner:{customer_id}"
+
+    def _mark_error(self, action: str, error: Exception):
+        self.errors += 1
+        logger.warning(f"Partner cache {action} failed: {error}")
+
+    async def get(self, customer_id: str, field: str, loader: Loader) -> List[FinicityAccount]:
+        """
+        Return cached accounts for (customer_id, field), loading them if needed
+
+        Args:
+            customer_id: Mastercard customer ID
+            field: Entry name, e.g. "accounts" or "account:{id}"
+            loader: Coroutine function calling Mastercard
+
+        Raises:
+            httpx.HTTPError: If a synchronous load fails and nothing servable is cached
+        """
+        if self._redis is None:
+            return await loader()
+
+        entry = await self._read(customer_id, field)
+        now = time.time()
+        if entry is not None:
+            if now < entry["fresh_until"]:
+                self.hits += 1
+                return _accounts(entry)
+            if now < entry["stale_until"]:
+                self.stale_hits += 1
+                if now >= entry.get("backoff_until", 0):
+                    self._revalidate(customer_id, field, loader, entry)
+                return _accounts(entry)
+
+        self.misses += 1
+        inflight_key = f"{customer_id}\x00{field}"
+        future = self._inflight.get(inflight_key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(customer_id, field, loader, entry))
+            self._inflight[inflight_key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        return await asyncio.shield(future)
+
+    async def put(self, customer_id: str, field: str, accounts: List[FinicityAccount]):
+        """Store accounts just returned by Mastercard (e.g. after a refresh)"""
+        if self._redis is None:
+            return
+        now = time.time()
+        await self._write(customer_id, field, {
+            "fresh_until": now + self.fresh_seconds,
+            "stale_until": now + self.stale_seconds,
+            "accounts": [account.to_dict() for account in accounts]
+        })
+
+    async def invalidate(self, customer_id: str):
+        """Drop every cached entry of a customer"""
+        if self._redis is None:
+            return
+        try:
+            await self._redis.delete(self._key(customer_id))
+        except redis.RedisError as e:
+            self._mark_error("invalidate", e)
+
+    async def _read(self, customer_id: str, field: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await self._redis.hget(self._key(customer_id), field)
+        except redis.RedisError as e:
+            self._mark_error("read", e)
+            return None
+        return json.loads(cached) if cached is not None else None
+
+    async def _write(self, customer_id: str, field: str, entry: Dict[str, Any]):
+        # Keep entries past their stale window so a 429 can still revive them
+        ttl = int(entry["stale_until"] - time.time() + self.rate_limit_extend_seconds) + 1
+        key = self._key(customer_id)
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, field, json.dumps(entry))
+                # The hash lives as long as its longest-lived entry
+                pipe.expire(key, ttl, gt=True)
+                pipe.expire(key, ttl, nx=True)
+                await pipe.execute()
+        except redis.RedisError as e:
+            self._mark_error("write", e)
+
+    async def _load(
+        self,
+        customer_id: str,
+        field: str,
+        loader: Loader,
+        entry: Optional[Dict[str, Any]]
+    ) -> List[FinicityAccount]:
+        try:
+            accounts = await loader()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429 and entry is not None:
+                # Serve the expired entry rather than fail
+                await self._extend(customer_id, field, entry, e)
+                return _accounts(entry)
+            raise
+        await self.put(customer_id, field, accounts)
+        return accounts
+
+    async def _extend(
+        self,
+        customer_id: str,
+        field: str,
+        entry: Dict[str, Any],
+        error: httpx.HTTPStatusError
+    ):
+        self.rate_limited += 1
+        backoff = _retry_after(error, self.rate_limit_extend_seconds)
+        now = time.time()
+        entry["backoff_until"] = now + backoff
+        entry["stale_until"] = max(entry["stale_until"], now + max(backoff, self.rate_limit_extend_seconds))
+        logger.warning(f"Mastercard rate limited customer {customer_id}, serving cached {field} for {backoff:.0f}s")
+        await self._write(customer_id, field, entry)
+
+    def _revalidate(self, customer_id: str, field: str, loader: Loader, entry: Dict[str, Any]):
+        key = f"{customer_id}\x00{field}"
+        if key in self._revalidating:
+            return
+        task = asyncio.create_task(self._run_revalidation(customer_id, field, loader, entry))
+        self._revalidating[key] = task
+        task.add_done_callback(lambda _: self._revalidating.pop(key, None))
+
+    async def _run_revalidation(
+        self,
+        customer_id: str,
+        field: str,
+        loader: Loader,
+        entry: Dict[str, Any]
+    ):
+        lock_key = f"{self._key(customer_id)}:revalidating:{field}"
+        token = uuid.uuid4().hex
+        try:
+            if not await self._redis.set(lock_key, token, nx=True, px=self.lock_ttl_ms):
+                return  # Another replica is revalidating this entry
+        except redis.RedisError as e:
+            self._mark_error("lock", e)
+            return
+
+        try:
+            self.revalidations += 1
+            await self._load(customer_id, field, loader, entry)
+        except Exception as e:
+            logger.warning(f"Background revalidation of {field} for customer {customer_id} failed: {e}")
+        finally:
+            try:
+                await self._release_lock(keys=[lock_key], args=[token])
+            except redis.RedisError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors
+        }
+
+
+# Global partner cache instance
+partner_cache = PartnerCache()
@@ -0,0 +1,122 @@
+"""
+Envelope encryption benchmark
+Measures account-number encryption cost for a bulk sync against per-row key derivation
+
+Needs the banking database (DATABASE_URL) with migration 004 applied. Usage
+(from app_services/banking_service):
+    python -m benchmarks.bench_encryption
+    python -m benchmarks.bench_encryption --rows 10000 --baseline-rows 200
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from sqlalchemy import delete
+
+from app.database.connection import SessionLocal, dispose_engine
+from app.database.models import EncryptionDataKey, LinkedBankAccount
+from app.services import account_sync
+from app.services.encryption import EnvelopeEncryption
+from app.services.finicity_decoder import FinicityAccount
+
+MASTER_KEY = "benchmark-master-key-not-for-production"
+
+
+def per_row_kdf(tenant_id: str, value: str) -> bytes:
+    """Naive scheme: derive a key from the master secret for every value"""
+    salt = os.urandom(16)
+    key = PBKDF2HMAC(
+        algorithm=hashes.SHA256(), length=32, salt=salt, iterations=600_000
+    ).derive(MASTER_KEY.encode())
+    nonce = os.urandom(12)
+    return salt + nonce + AESGCM(key).encrypt(nonce, value.encode(), tenant_id.encode())
+
+
+def report(name: str, rows: int, seconds: float, note: str = ""):
+    print(f"{name:<34} {rows:>7} {seconds * 1000:>10.1f} {rows / seconds:>12,.0f} {note}")
+
+
+async def run(args):
+    tenant_id = f"bench-{uuid.uuid4().hex[:8]}"
+    numbers = [f"{i:012d}" for i in range(args.rows)]
+    accounts = [
+        FinicityAccount(id=f"{tenant_id}-{i}", number=number, balance=None)
+        for i, number in enumerate(numbers)
+    ]
+
+    print(f"{'scenario':<34} {'rows':>7} {'total ms':>10} {'rows/s':>12}")
+    try:
+        # Baseline 1: KDF per value (measured on a sample, extrapolated)
+        start = time.perf_counter()
+        for value in numbers[:args.baseline_rows]:
+            per_row_kdf(tenant_id, value)
+        seconds = time.perf_counter() - start
+        report("per-row PBKDF2", args.baseline_rows, seconds,
+               f"(~{seconds / args.baseline_rows * args.rows:,.0f}s for {args.rows})")
+
+        async with SessionLocal() as db:
+            # Baseline 2: data key fetched and unwrapped for every value
+            uncached = EnvelopeEncryption(master_key=MASTER_KEY, cache_size=0)
+            await uncached.encrypt(db, tenant_id, numbers[0])
+            start = time.perf_counter()
+            for value in numbers[:args.baseline_rows]:
+                await uncached.encrypt(db, tenant_id, value)
+            seconds = time.perf_counter() - start
+            report("per-row key fetch + unwrap", args.baseline_rows, seconds,
+                   f"(~{seconds / args.baseline_rows * args.rows:,.0f}s for {args.rows})")
+
+            # Cached data key, batch API
+            service = EnvelopeEncryption(master_key=MASTER_KEY)
+            start = time.perf_counter()
+            tokens = await service.encrypt_many(db, tenant_id, numbers)
+            report("encrypt_many (cold key cache)", args.rows, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            tokens = await service.encrypt_many(db, tenant_id, numbers)
+            report("encrypt_many (warm key cache)", args.rows, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            decrypted = await service.decrypt_many(db, tenant_id, tokens)
+            report("decrypt_many", args.rows, time.perf_counter() - start)
+            assert decrypted == numbers
+
+            # Full sync: one upsert of every account, with and without encryption
+            original = account_sync.encryption
+            for name, instance in (
+                ("upsert sync, no encryption", EnvelopeEncryption(master_key=None)),
+                ("upsert sync, encrypted", service),
+            ):
+                account_sync.encryption = instance
+                try:
+                    start = time.perf_counter()
+                    await account_sync.upsert_linked_accounts(db, tenant_id, tenant_id, accounts)
+                    await db.commit()
+                    report(name, args.rows, time.perf_counter() - start)
+                finally:
+                    account_sync.encryption = original
+                await db.execute(delete(LinkedBankAccount).where(LinkedBankAccount.user_id == tenant_id))
+                await db.commit()
+
+            print(f"\nkey unwraps: {service.unwraps}, keys created: {service.keys_created}")
+    finally:
+        async with SessionLocal() as db:
+            await db.execute(delete(LinkedBankAccount).where(LinkedBankAccount.user_id == tenant_id))
+            await db.execute(delete(EncryptionDataKey).where(EncryptionDataKey.tenant_id == tenant_id))
+            await db.commit()
+        await dispose_engine()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark envelope encryption for account sync")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--baseline-rows", type=int, default=100, help="Sample size for per-row baselines")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
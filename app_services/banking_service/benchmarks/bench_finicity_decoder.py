@@ -0,0 +1,125 @@
+"""
+Finicity decoder benchmark
+Compares the dict-tree XML parser with the streaming account decoder
+
+Usage (from app_services/banking_service):
+    python -m benchmarks.bench_finicity_decoder
+    python -m benchmarks.bench_finicity_decoder --accounts 1000 10000 50000 --repeat 5
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, List
+
+import httpx
+
+from app.services.finicity_decoder import decode_accounts_json, decode_accounts_xml
+from app.services.mastercard_client import MastercardClient
+
+CHUNK_SIZE = 64 * 1024
+
+
+def account_fields(i: int) -> dict:
+    return {
+        "id": str(5000000000 + i),
+        "number": f"{i:010d}",
+        "accountNumberDisplay": f"{i % 10000:04d}",
+        "name": f"Checking {i}",
+        "balance": f"{1000 + i % 997}.{i % 100:02d}",
+        "type": "checking",
+        "aggregationStatusCode": "0",
+        "status": "active",
+        "customerId": "1005061234",
+        "institutionId": "101732",
+        "balanceDate": "1607450357",
+        "aggregationSuccessDate": "1607450357",
+        "aggregationAttemptDate": "1607450357",
+        "createdDate": "1607450357",
+        "currency": "USD",
+        "lastTransactionDate": "1607450357",
+        "institutionLoginId": "1007302745",
+        "displayPosition": str(i % 10),
+        "detail": {
+            "availableBalanceAmount": f"{900 + i % 997}.{i % 100:02d}",
+            "interestYtdAmount": "0.00",
+            "periodInterestRate": "0.00"
+        }
+    }
+
+
+def xml_fixture(count: int) -> bytes:
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?><accounts found="{count}" displaying="{count}">']
+    for i in range(count):
+        parts.append("<account>")
+        for tag, value in account_fields(i).items():
+            if isinstance(value, dict):
+                inner = "".join(f"<{k}>{v}</{k}>" for k, v in value.items())
+                parts.append(f"<{tag}>{inner}</{tag}>")
+            else:
+                parts.append(f"<{tag}>{value}</{tag}>")
+        parts.append("</account>")
+    parts.append("</accounts>")
+    return "".join(parts).encode()
+
+
+def json_fixture(count: int) -> bytes:
+    return json.dumps({"accounts": [account_fields(i) for i in range(count)]}).encode()
+
+
+def legacy_decode(body: bytes) -> List[dict]:
+    """The previous code path: full text, dict tree, list promotion"""
+    response = httpx.Response(200, headers={"content-type": "application/xml"}, content=body)
+    data = MastercardClient()._parse_response(response)
+    accounts = data.get("accounts", data.get("account", []))
+    return accounts if isinstance(accounts, list) else [accounts]
+
+
+def streaming_decode(body: bytes):
+    chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    return decode_accounts_xml(chunks)
+
+
+def json_decode(body: bytes):
+    return decode_accounts_json(json.loads(body))
+
+
+def measure(fn: Callable, body: bytes, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(body)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Finicity account decoders")
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'accounts':>9} {'decoder':<14} {'payload':>10} {'best ms':>10} {'peak MiB':>10}")
+    for count in args.accounts:
+        xml_body = xml_fixture(count)
+        json_body = json_fixture(count)
+        for name, fn, body in (
+            ("legacy-xml", legacy_decode, xml_body),
+            ("streaming-xml", streaming_decode, xml_body),
+            ("json", json_decode, json_body),
+        ):
+            seconds, peak, decoded = measure(fn, body, args.repeat)
+            assert decoded == count, f"{name} decoded {decoded} of {count} accounts"
+            print(
+                f"{count:>9} {name:<14} {len(body) / 2**20:>8.1f}MB "
+                f"{seconds * 1000:>10.1f} {peak / 2**20:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Finicity stand-in server
+Serves the Mastercard/Finicity endpoints MastercardClient uses, for local load tests
+
+Usage (from app_services/banking_service):
+    python -m benchmarks.finicity_stub --port 9100 --format mixed --latency-ms 80 --error-rate 0.01
+
+Point banking_service at it with:
+    MASTERCARD_BASE_URL=http://localhost:9100 MASTERCARD_PARTNER_ID=stub \\
+    MASTERCARD_PARTNER_SECRET=stub MASTERCARD_APP_KEY=stub uvicorn app.main:app --port 8007
+
+Latency and error injection can be changed while a test runs:
+    curl -X PUT localhost:9100/_stub/config -H 'content-type: application/json' \\
+         -d '{"latency_ms": 250, "error_rate": 0.05, "error_status": 429}'
+"""
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from fastapi import FastAPI, Request, Response
+
+
+@dataclass
+class StubConfig:
+    """Runtime behaviour of the stub; every field can be changed via PUT /_stub/config"""
+    format: str = "mixed"  # json, xml or mixed (XML whenever the client accepts it, at random)
+    latency_ms: float = 50.0
+    latency_jitter_ms: float = 25.0
+    refresh_latency_ms: float = 500.0  # Extra delay of account refresh calls
+    error_rate: float = 0.0  # Fraction of calls answered with error_status
+    error_status: int = 500
+    accounts_per_customer: int = 3
+
+
+config = StubConfig()
+app = FastAPI(title="Finicity stub")
+
+_customers: Dict[str, str] = {}  # customer id -> username
+_accounts: Dict[str, Dict[str, dict]] = {}  # customer id -> account id -> fields
+_counts: Dict[str, int] = {}
+
+# Random per process so restarted stubs do not reuse linked account ids
+_FIRST_CUSTOMER_ID = random.randrange(1, 9000) * 10**6
+
+
+def _account(customer_id: str, index: int) -> dict:
+    return {
+        "id": f"{customer_id}{index:03d}",
+        "number": f"{random.randrange(10**9):010d}",
+        "accountNumberDisplay": f"{random.randrange(10000):04d}",
+        "name": f"Stub Checking {index}",
+        "type": "checking" if index % 2 == 0 else "savings",
+        "status": "active",
+        "customerId": customer_id,
+        "institutionId": "101732",
+        "institutionName": "FinBank Stub",
+        "balance": _amount(),
+        "currency": "USD",
+        "detail": {"availableBalanceAmount": _amount()}
+    }
+
+
+def _amount() -> str:
+    return str(Decimal(random.randrange(1_000, 5_000_000)) / 100)
+
+
+def _customer_accounts(customer_id: str) -> Dict[str, dict]:
+    if customer_id not in _accounts:
+        _accounts[customer_id] = {
+            account["id"]: account
+            for account in (_account(customer_id, i) for i in range(config.accounts_per_customer))
+        }
+    return _accounts[customer_id]
+
+
+def _to_xml(tag: str, value) -> str:
+    if isinstance(value, dict):
+        inner = "".join(_to_xml(k, v) for k, v in value.items())
+        return f"<{tag}>{inner}</{tag}>"
+    if isinstance(value, list):
+        return "".join(_to_xml(tag, item) for item in value)
+    return f"<{tag}>{escape(str(value))}</{tag}>"
+
+
+def _render(request: Request, root: str, body: dict) -> Response:
+    """JSON or XML according to config.format and the Accept header"""
+    accept = request.headers.get("accept", "")
+    use_xml = config.format == "xml" or (
+        config.format == "mixed" and ("xml" in accept or not accept) and random.random() < 0.5
+    )
+    if use_xml:
+        inner = "".join(_to_xml(k, v) for k, v in body.items())
+        content = f'<?xml version="1.0" encoding="UTF-8"?><{root}>{inner}</{root}>'
+        return Response(content, media_type="application/xml")
+    return Response(json.dumps(body), media_type="application/json")
+
+
+async def _simulate(name: str, extra_ms: float = 0.0) -> Optional[Response]:
+    """Apply latency and error injection; returns the error response, if any"""
+    _counts[name] = _counts.get(name, 0) + 1
+    delay = config.latency_ms + extra_ms + random.uniform(0, config.latency_jitter_ms)
+    await asyncio.sleep(delay / 1000)
+    if config.error_rate and random.random() < config.error_rate:
+        headers = {"Retry-After": "1"} if config.error_status == 429 else None
+        return Response(
+            json.dumps({"code": config.error_status, "message": "Injected by stub"}),
+            status_code=config.error_status,
+            media_type="application/json",
+            headers=headers
+        )
+    return None
+
+
+@app.post("/aggregation/v2/partners/authentication")
+async def authenticate(request: Request):
+    if error := await _simulate("authenticate"):
+        return error
+    # Token responses are XML, like the real API
+    token = uuid.uuid4().hex
+    return Response(f"<access><token>{token}</token></access>", media_type="application/xml")
+
+
+@app.post("/aggregation/v2/customers/testing")
+async def create_customer(request: Request):
+    if error := await _simulate("create_customer"):
+        return error
+    payload = await request.json()
+    customer_id = str(_FIRST_CUSTOMER_ID + len(_customers))
+    _customers[customer_id] = payload.get("username", "")
+    return _render(request, "customer", {
+        "id": customer_id,
+        "username": _customers[customer_id],
+        "createdDate": "1607450357"
+    })
+
+
+@app.get("/aggregation/v1/customers/{customer_id}")
+async def get_customer(customer_id: str, request: Request):
+    if error := await _simulate("get_customer"):
+        return error
+    return _render(request, "customer", {
+        "id": customer_id,
+        "username": _customers.get(customer_id, f"user_{customer_id}")
+    })
+
+
+@app.post("/connect/v2/generate")
+async def generate_connect_url(request: Request):
+    if error := await _simulate("generate_connect_url"):
+        return error
+    payload = await request.json()
+    return Response(
+        json.dumps({"link": f"https://connect.stub.local/?customerId={payload.get('customerId')}"}),
+        media_type="application/json"
+    )
+
+
+@app.get("/aggregation/v1/customers/{customer_id}/accounts")
+async def get_accounts(customer_id: str, request: Request):
+    if error := await _simulate("get_accounts"):
+        return error
+    return _render(request, "accounts", {"account": list(_customer_accounts(customer_id).values())})
+
+
+@app.post("/aggregation/v1/customers/{customer_id}/accounts")
+async def refresh_accounts(customer_id: str, request: Request):
+    if error := await _simulate("refresh_accounts", config.refresh_latency_ms):
+        return error
+    accounts = _customer_accounts(customer_id)
+    for account in accounts.values():
+        account["balance"] = _amount()
+    return _render(request, "accounts", {"account": list(accounts.values())})
+
+
+@app.get("/aggregation/v1/customers/{customer_id}/accounts/{account_id}")
+async def get_account(customer_id: str, account_id: str, request: Request):
+    if error := await _simulate("get_account"):
+        return error
+    account = _customer_accounts(customer_id).get(account_id)
+    if account is None:
+        return Response(status_code=404)
+    return _render(request, "accounts", {"account": [account]})
+
+
+@app.post("/aggregation/v1/customers/{customer_id}/accounts/{account_id}")
+async def refresh_account(customer_id: str, account_id: str, request: Request):
+    if error := await _simulate("refresh_account", config.refresh_latency_ms):
+        return error
+    account = _customer_accounts(customer_id).get(account_id)
+    if account is None:
+        return Response(status_code=404)
+    account["balance"] = _amount()
+    return _render(request, "accounts", {"account": [account]})
+
+
+@app.delete("/aggregation/v1/customers/{customer_id}/accounts/{account_id}")
+async def delete_account(customer_id: str, account_id: str):
+    if error := await _simulate("delete_account"):
+        return error
+    _customer_accounts(customer_id).pop(account_id, None)
+    return Response(status_code=204)
+
+
+@app.get("/_stub/config")
+async def get_config():
+    return {"config": asdict(config), "calls": _counts}
+
+
+@app.put("/_stub/config")
+async def update_config(request: Request):
+    for key, value in (await request.json()).items():
+        if hasattr(config, key):
+            setattr(config, key, type(getattr(config, key))(value))
+    return {"config": asdict(config)}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local Finicity stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--format", choices=["json", "xml", "mixed"], default=config.format)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--latency-jitter-ms", type=float, default=config.latency_jitter_ms)
+    parser.add_argument("--refresh-latency-ms", type=float, default=config.refresh_latency_ms)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--error-status", type=int, default=config.error_status)
+    parser.add_argument("--accounts-per-customer", type=int, default=config.accounts_per_customer)
+    args = parser.parse_args(argv)
+
+    for key, value in vars(args).items():
+        if hasattr(config, key):
+            setattr(config, key, value)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Banking service load test
+Drives connect, callback, list and refresh at a target rate and reports latency and DB pool usage
+
+Start the Finicity stub and banking_service against it (see benchmarks.finicity_stub), then
+(from app_services/banking_service):
+    python -m benchmarks.load_banking --rps 100 --duration 60 --users 200
+    python -m benchmarks.load_banking --mix list=8,refresh=1,connect=0.5,callback=0.5 --json
+
+Requests are started on an open-loop schedule (a slow service does not slow
+the arrival rate down); starts that would exceed --max-in-flight are counted
+as "shed" instead. The DB pool is sampled from GET /health while the test runs.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+OPERATIONS = ("connect", "callback", "list", "refresh")
+
+
+@dataclass
+class VirtualUser:
+    user_id: str
+    account_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Results:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: Dict[str, Counter] = field(default_factory=lambda: defaultdict(Counter))
+    pool_samples: List[dict] = field(default_factory=list)
+    shed: int = 0
+    started: int = 0
+    elapsed: float = 0.0
+
+    def record(self, operation: str, seconds: float, status: str):
+        self.latencies[operation].append(seconds)
+        self.statuses[operation][status] += 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}, expected one of {OPERATIONS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.api = f"{args.base_url.rstrip('/')}/api/v1"
+        self.results = Results()
+        run_id = uuid.uuid4().hex[:8]
+        self.users = [VirtualUser(f"load-{run_id}-{i}") for i in range(args.users)]
+        self._in_flight = 0
+
+    async def connect(self, client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+        return await client.post(
+            f"{self.api}/{user.user_id}/bank-accounts/connect",
+            json={"redirect_uri": "https://example.com/callback"}
+        )
+
+    async def callback(self, client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+        response = await client.get(f"{self.api}/{user.user_id}/bank-accounts/callback")
+        if response.status_code == 200:
+            user.account_ids = [account["id"] for account in response.json().get("accounts", [])]
+        return response
+
+    async def list(self, client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+        return await client.get(f"{self.api}/{user.user_id}/bank-accounts")
+
+    async def refresh(self, client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+        account_id = random.choice(user.account_ids)
+        return await client.post(
+            f"{self.api}/{user.user_id}/bank-accounts/{account_id}/refresh",
+            params={"wait": str(not self.args.async_refresh).lower()}
+        )
+
+    async def _timed(self, client: httpx.AsyncClient, operation: str, user: VirtualUser):
+        self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await getattr(self, operation)(client, user)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finally:
+            self._in_flight -= 1
+        self.results.record(operation, time.perf_counter() - start, status)
+
+    async def _seed_user(self, client: httpx.AsyncClient, user: VirtualUser):
+        await self._timed(client, "connect", user)
+        await self._timed(client, "callback", user)
+
+    def _pick(self, mix: Dict[str, float]) -> Optional[tuple]:
+        operation = random.choices(list(mix), weights=list(mix.values()))[0]
+        user = random.choice(self.users)
+        if operation == "refresh" and not user.account_ids:
+            linked = [u for u in self.users if u.account_ids]
+            if not linked:
+                return None
+            user = random.choice(linked)
+        return operation, user
+
+    async def _sample_pool(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                response = await client.get(f"{self.args.base_url.rstrip('/')}/health")
+                pool = response.json().get("database_pool")
+                if pool:
+                    self.results.pool_samples.append(pool)
+            except (httpx.HTTPError, ValueError):
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.args.pool_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> Results:
+        args = self.args
+        limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self._sample_pool(client, stop))
+
+            if not args.skip_seed:
+                # Link every virtual user first so list/refresh hit real rows
+                seed_limit = asyncio.Semaphore(args.max_in_flight)
+
+                async def seed(user):
+                    async with seed_limit:
+                        await self._seed_user(client, user)
+
+                await asyncio.gather(*(seed(user) for user in self.users))
+                self.results.latencies.clear()
+                self.results.statuses.clear()
+
+            mix = args.mix
+            total = int(args.rps * args.duration)
+            tasks = []
+            start = time.perf_counter()
+            for i in range(total):
+                delay = start + i / args.rps - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self._in_flight >= args.max_in_flight:
+                    self.results.shed += 1
+                    continue
+                picked = self._pick(mix)
+                if picked is None:
+                    continue
+                self.results.started += 1
+                tasks.append(asyncio.create_task(self._timed(client, *picked)))
+
+            await asyncio.gather(*tasks)
+            self.results.elapsed = time.perf_counter() - start
+            stop.set()
+            await sampler
+        return self.results
+
+
+def summarize(results: Results) -> dict:
+    operations = {}
+    for operation, values in sorted(results.latencies.items()):
+        values = sorted(values)
+        statuses = results.statuses[operation]
+        operations[operation] = {
+            "count": len(values),
+            "errors": sum(n for status, n in statuses.items() if not status.startswith("2")),
+            "statuses": dict(statuses),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000 if values else 0.0
+        }
+
+    pool = {}
+    if results.pool_samples:
+        capacity = results.pool_samples[0]["size"] + results.pool_samples[0]["max_overflow"]
+        checked_out = [sample["checked_out"] for sample in results.pool_samples]
+        pool = {
+            "capacity": capacity,
+            "samples": len(checked_out),
+            "peak_checked_out": max(checked_out),
+            "mean_checked_out": sum(checked_out) / len(checked_out),
+            "peak_overflow": max(sample["overflow"] for sample in results.pool_samples),
+            # Share of samples where every connection was in use (requests queue on pool_timeout)
+            "saturated_pct": 100 * sum(n >= capacity for n in checked_out) / len(checked_out)
+        }
+
+    return {
+        "requests": results.started,
+        "shed": results.shed,
+        "elapsed_s": results.elapsed,
+        "achieved_rps": results.started / results.elapsed if results.elapsed else 0.0,
+        "operations": operations,
+        "db_pool": pool
+    }
+
+
+def print_summary(summary: dict, target_rps: float):
+    print(
+        f"\n{summary['requests']} requests in {summary['elapsed_s']:.1f}s "
+        f"({summary['achieved_rps']:.1f} rps achieved, target {target_rps:g}), {summary['shed']} shed"
+    )
+    print(f"\n{'operation':<10} {'count':>7} {'errors':>7} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name, op in summary["operations"].items():
+        print(
+            f"{name:<10} {op['count']:>7} {op['errors']:>7} "
+            f"{op['p50_ms']:>7.1f}ms {op['p90_ms']:>7.1f}ms {op['p95_ms']:>7.1f}ms "
+            f"{op['p99_ms']:>7.1f}ms {op['max_ms']:>7.1f}ms"
+        )
+        failures = {status: n for status, n in op["statuses"].items() if not status.startswith("2")}
+        if failures:
+            print(f"{'':<10} failures: {failures}")
+
+    pool = summary["db_pool"]
+    if pool:
+        print(
+            f"\nDB pool: peak {pool['peak_checked_out']}/{pool['capacity']} checked out "
+            f"(mean {pool['mean_checked_out']:.1f}, peak overflow {pool['peak_overflow']}), "
+            f"saturated in {pool['saturated_pct']:.0f}% of {pool['samples']} samples"
+        )
+    else:
+        print("\nDB pool: no samples (is /health reporting database_pool?)")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test banking_service")
+    parser.add_argument("--base-url", default="http://localhost:8007")
+    parser.add_argument("--rps", type=float, default=50.0, help="Target request starts per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of steady load")
+    parser.add_argument("--users", type=int, default=100, help="Virtual users (linked before the run)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("connect=1,callback=1,list=6,refresh=2"))
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--pool-interval", type=float, default=0.5, help="Seconds between /health samples")
+    parser.add_argument("--async-refresh", action="store_true", help="Use refresh?wait=false")
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = summarize(asyncio.run(LoadTest(args).run()))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, args.rps)
+
+
+if __name__ == "__main__":
+    main()
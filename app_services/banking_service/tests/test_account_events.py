@@ -0,0 +1,58 @@
+"""
+Mastercard event batches
+Run from app_services/banking_service: python -m pytest tests
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services import account_events as account_events_module
+from app.services.account_events import AccountEventQueue
+
+
+class FakeSession:
+    """Just enough of an AsyncSession for apply_batch"""
+
+    class _Result:
+        def all(self):
+            return []
+
+    async def execute(self, statement):
+        return self._Result()
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_account_pulls_are_bounded(monkeypatch):
+    in_flight, peak = 0, 0
+
+    class FakeClient:
+        async def get_customer_accounts(self, customer_id):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return []
+
+    async def apply_balance_updates(db, accounts):
+        return set()
+
+    @asynccontextmanager
+    async def session():
+        yield FakeSession()
+
+    monkeypatch.setattr(account_events_module, "mastercard_client", FakeClient())
+    monkeypatch.setattr(account_events_module, "SessionLocal", session)
+    monkeypatch.setattr(account_events_module, "apply_balance_updates", apply_balance_updates)
+
+    bodies = [
+        json.dumps({"customerId": f"customer-{i}", "eventType": "done"}).encode()
+        for i in range(20)
+    ]
+    assert await AccountEventQueue(fetch_concurrency=3).apply_batch(bodies) == 20
+    assert peak == 3
@@ -0,0 +1,37 @@
+"""
+Balance refresh jobs
+Run from app_services/banking_service: python -m pytest tests
+"""
+import fakeredis
+import pytest
+
+from app.services.balance_refresher import BalanceRefresher
+
+
+@pytest.mark.asyncio
+async def test_job_status_is_visible_from_every_replica(monkeypatch):
+    server = fakeredis.FakeServer()
+    queuing, polled = BalanceRefresher(concurrency=1), BalanceRefresher()
+    queuing._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    polled._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    refreshed = []
+
+    async def refresh_customer(customer_id):
+        refreshed.append(customer_id)
+
+    monkeypatch.setattr(queuing, "_refresh_customer", refresh_customer)
+
+    job = await queuing.enqueue("user-1", "account-1", "customer-1")
+    assert (await polled.get_job(job.id)).status == "queued"
+
+    await queuing.start(scheduler=False)
+    await queuing._queue.join()
+    await queuing.stop()
+
+    seen = await polled.get_job(job.id)
+    assert refreshed == ["customer-1"]
+    assert seen.status == "completed"
+    assert seen.user_id == "user-1"
+    assert seen.finished_at is not None
+    assert await polled.get_job("unknown") is None
@@ -0,0 +1,110 @@
+"""
+Mastercard client and partner cache
+Run from app_services/banking_service: python -m pytest tests
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import fakeredis
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.services import account_events as account_events_module
+from app.services.account_events import AccountEventQueue
+from app.services.mastercard_client import MastercardClient
+from app.services.partner_cache import partner_cache
+
+CUSTOMER_ID = "1005061234"
+ACCOUNT_ID = "5011648377"
+
+
+class FakeMastercard:
+    """Serves the accounts endpoints from one in-memory balance"""
+
+    def __init__(self, balance: str):
+        self.balance = balance
+        self.calls = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append((request.method, request.url.path))
+        account = {"id": ACCOUNT_ID, "customerId": CUSTOMER_ID, "name": "Checking", "balance": self.balance}
+        return httpx.Response(200, json={"accounts": [account]})
+
+
+class FakeSession:
+    """Just enough of an AsyncSession for apply_batch"""
+
+    class _Result:
+        def all(self):
+            return [(CUSTOMER_ID, "user-1")]
+
+    async def execute(self, statement):
+        return self._Result()
+
+    async def commit(self):
+        pass
+
+
+@pytest_asyncio.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(partner_cache, "_redis", fakeredis.FakeAsyncRedis(decode_responses=True))
+    mastercard = FakeMastercard("100.00")
+    client = MastercardClient()
+    client.base_url = "https://mastercard.test"
+    client.app_key = "app-key"
+    client.access_token = "token"
+    client.token_expires_at = datetime.now() + timedelta(hours=1)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(mastercard.handler))
+    client.mastercard = mastercard
+    yield client
+    await client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_refresh_account_replaces_cached_customer_accounts(client):
+    accounts = await client.get_customer_accounts(CUSTOMER_ID)
+    assert accounts[0].balance == Decimal("100.00")
+
+    client.mastercard.balance = "250.00"
+    refreshed = await client.refresh_account(CUSTOMER_ID, ACCOUNT_ID)
+    assert refreshed.balance == Decimal("250.00")
+
+    accounts = await client.get_customer_accounts(CUSTOMER_ID)
+    assert accounts[0].balance == Decimal("250.00")
+
+
+@pytest.mark.asyncio
+async def test_webhook_after_refresh_keeps_refreshed_balance(client, monkeypatch):
+    await client.get_customer_accounts(CUSTOMER_ID)
+    client.mastercard.balance = "250.00"
+    await client.refresh_account(CUSTOMER_ID, ACCOUNT_ID)
+
+    stored = {}
+
+    async def upsert_linked_accounts(db, user_id, mastercard_customer_id, accounts):
+        stored.update({account.id: account.balance for account in accounts})
+        return accounts
+
+    async def apply_balance_updates(db, accounts):
+        return set()
+
+    async def invalidate(user_id):
+        pass
+
+    @asynccontextmanager
+    async def session():
+        yield FakeSession()
+
+    monkeypatch.setattr(account_events_module, "mastercard_client", client)
+    monkeypatch.setattr(account_events_module, "SessionLocal", session)
+    monkeypatch.setattr(account_events_module, "upsert_linked_accounts", upsert_linked_accounts)
+    monkeypatch.setattr(account_events_module, "apply_balance_updates", apply_balance_updates)
+    monkeypatch.setattr(account_events_module.account_cache, "invalidate", invalidate)
+    monkeypatch.setattr(account_events_module.audit_writer, "log", lambda **kwargs: None)
+
+    # Connect finished without a payload: the consumer re-reads the customer's accounts
+    body = b'{"customerId": "%s", "eventType": "done"}' % CUSTOMER_ID.encode()
+    assert await AccountEventQueue().apply_batch([body]) == 1
+    assert stored == {ACCOUNT_ID: Decimal("250.00")}
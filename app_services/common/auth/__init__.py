@@ -2,9 +2,13 @@
 Common auth module for WSO2 IS integration
 """
 from .wso2_client import WSO2IdentityClient, WSO2ClientError
+from .cache import TTLCache, ScimIdCache, UserInfoCache, SingleFlight
+from .resilience import ResiliencePolicy, CircuitBreaker, RetryBudget
+from .token_verifier import JWKSCache, TokenVerifier, TokenVerificationError
 from .models import (
     UserRegistrationRequest,
     UserRegistrationResponse,
+    BulkUserResult,
     TokenRequest,
     TokenResponse,
     AddressInfo,
@@ -21,6 +25,7 @@ from .models import (
 __all__ = [
     "UserRegistrationRequest",
     "UserRegistrationResponse",
+    "BulkUserResult",
     "TokenRequest",
     "TokenResponse",
     "AddressInfo",
@@ -33,5 +38,15 @@ __all__ = [
     "EmailVerificationRequest",
     "EmailVerificationResponse",
     "WSO2IdentityClient",
-    "WSO2ClientError"
+    "WSO2ClientError",
+    "JWKSCache",
+    "TokenVerifier",
+    "TokenVerificationError",
+    "TTLCache",
+    "ScimIdCache",
+    "UserInfoCache",
+    "SingleFlight",
+    "ResiliencePolicy",
+    "CircuitBreaker",
+    "RetryBudget"
 ]
@@ -0,0 +1,155 @@
+"""
+Bulk user import into WSO2 IS via SCIM2 /Bulk
+
+Usage:
+    python -m common.auth.bulk_import users.csv
+    python -m common.auth.bulk_import users.ndjson --chunk-size 200 --concurrency 8
+
+CSV columns: username, password, email, first_name, last_name and optionally
+phone, street, locality, region, postal_code, country.
+NDJSON lines use the UserRegistrationRequest shape (address as a nested object).
+
+Per-user results are written as NDJSON to stdout (or --output), a summary
+to stderr. Input is streamed, so files of any size import in flat memory.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from pathlib import Path
+from typing import Iterator, Dict, Any, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from common.config import config
+from .models import UserRegistrationRequest, BulkUserResult
+from .wso2_client import WSO2IdentityClient
+
+ADDRESS_FIELDS = ("street", "locality", "region", "postal_code", "country")
+
+
+def read_csv(path: Path) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, registration dict) per CSV row, nesting address columns"""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            record = {k: v for k, v in row.items() if v not in (None, "")}
+            address = {
+                field: record.pop(field)
+                for field in ADDRESS_FIELDS
+                if field in record
+            }
+            if address:
+                record["address"] = address
+            yield reader.line_num, record
+
+
+def read_ndjson(path: Path) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (line number, parsed value) per non-empty line
+
+    A line that is not valid JSON yields its ValueError instead, so one bad
+    line fails on its own rather than ending the import.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = e
+            yield line_number, record
+
+
+def validated(
+    records: Iterator[Tuple[int, Any]],
+    output: TextIO,
+    summary: Dict[str, int]
+) -> Iterator[UserRegistrationRequest]:
+    """Yield valid requests; report invalid rows straight to the output"""
+    for line_number, record in records:
+        if isinstance(record, ValueError):
+            error = f"Invalid JSON: {record}"
+        elif not isinstance(record, dict):
+            error = f"Expected a JSON object, got {type(record).__name__}"
+        else:
+            try:
+                request = UserRegistrationRequest(**record)
+            except ValidationError as e:
+                error = e.errors(include_url=False, include_context=False, include_input=False)
+            else:
+                yield request
+                continue
+
+        summary["failed"] += 1
+        result = BulkUserResult(
+            username=str(record.get("username", "")) if isinstance(record, dict) else "",
+            status="failed",
+            status_code=400,
+            line=line_number,
+            error=error
+        )
+        output.write(result.model_dump_json() + "\n")
+
+
+async def run_import(args: argparse.Namespace) -> Dict[str, int]:
+    reader = read_ndjson if args.format == "ndjson" else read_csv
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    summary = {"success": 0, "failed": 0}
+
+    try:
+        async with WSO2IdentityClient(
+            base_url=args.base_url,
+            admin_user=args.admin_user,
+            admin_pass=args.admin_pass,
+            max_connections=args.concurrency
+        ) as client:
+            results = client.register_users_bulk(
+                validated(reader(args.input), output, summary),
+                chunk_size=args.chunk_size,
+                max_concurrency=args.concurrency
+            )
+            async for result in results:
+                summary[result.status] += 1
+                output.write(result.model_dump_json() + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk import users into WSO2 IS")
+    parser.add_argument("input", type=Path, help="CSV or NDJSON file")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="Input format (default: from file extension)"
+    )
+    parser.add_argument(
+        "--base-url",
+        default=f"https://{config.WSO2_IS_HOST}:{config.WSO2_IS_PORT}"
+    )
+    parser.add_argument("--admin-user", default=config.WSO2_ADMIN_USERNAME)
+    parser.add_argument("--admin-pass", default=config.WSO2_ADMIN_PASSWORD)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", type=Path, help="Results file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.format is None:
+        args.format = "ndjson" if args.input.suffix in (".ndjson", ".jsonl") else "csv"
+
+    summary = asyncio.run(run_import(args))
+    print(
+        f"Imported {summary['success']} users, {summary['failed']} failed",
+        file=sys.stderr
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Caches for WSO2 IS lookups
+In-process LRU+TTL cache with optional Redis backing shared across replicas
+"""
+import asyncio
+import hashlib
+import jwt
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Hashable, Callable, Awaitable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def token_hash(token: str) -> str:
+    """SHA-256 hex digest used as a cache key so raw tokens are never stored"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after a TTL.
+
+    Not thread-safe; intended for use from a single asyncio event loop.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or `default` if missing or expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class ScimIdCache:
+    """
+    Username -> SCIM user id cache.
+
+    Lookups check the in-process LRU first, then Redis (if a `redis.asyncio`
+    client is supplied) so replicas share resolved ids. Redis errors are
+    logged and treated as misses - the cache never fails a request.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 3600.0,
+        redis_client: Optional[Any] = None,
+        key_prefix: str = "wso2:scim_id:"
+    ):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+        self.redis_hits = 0
+        self.invalidations = 0
+
+    async def get(self, username: str) -> Optional[str]:
+        user_id = self.local.get(username)
+        if user_id is not None or self.redis is None:
+            return user_id
+
+        try:
+            user_id = await self.redis.get(self.key_prefix + username)
+        except Exception as e:
+            logger.warning(f"SCIM id cache Redis lookup failed: {e}")
+            return None
+
+        if user_id is not None:
+            if isinstance(user_id, bytes):
+                user_id = user_id.decode()
+            self.redis_hits += 1
+            self.local.set(username, user_id)
+        return user_id
+
+    async def set(self, username: str, user_id: str) -> None:
+        self.local.set(username, user_id)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.key_prefix + username, user_id, ex=int(self.ttl))
+            except Exception as e:
+                logger.warning(f"SCIM id cache Redis write failed: {e}")
+
+    async def invalidate(self, username: str) -> None:
+        self.invalidations += 1
+        self.local.delete(username)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self.key_prefix + username)
+            except Exception as e:
+                logger.warning(f"SCIM id cache Redis delete failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.local.stats()
+        # A local miss answered by Redis is still a cache hit overall
+        stats["redis_hits"] = self.redis_hits
+        stats["misses"] -= self.redis_hits
+        stats["invalidations"] = self.invalidations
+        stats["redis_enabled"] = self.redis is not None
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight call.
+
+    Every caller awaiting a key gets the same result (or exception). The
+    shared call is shielded, so one caller being cancelled does not cancel
+    it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced
+        }
+
+
+class _NegativeEntry:
+    """Cached failure for a revoked or invalid token"""
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class UserInfoCache:
+    """
+    Userinfo claims cache keyed by a SHA-256 hash of the access token.
+
+    Entries live until the token's `exp` (capped at `max_ttl`); opaque tokens
+    without a readable `exp` use `default_ttl`. Failures with a status in
+    `negative_statuses` (revoked/invalid tokens) are cached for
+    `negative_ttl` so bad tokens do not reach the IdP on every request.
+    Concurrent lookups for the same token share one upstream call.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        default_ttl: float = 300.0,
+        max_ttl: float = 3600.0,
+        negative_ttl: float = 30.0,
+        negative_statuses: tuple = (400, 401, 403)
+    ):
+        self.local = TTLCache(maxsize=maxsize, ttl=default_ttl)
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.negative_statuses = negative_statuses
+        self.inflight = SingleFlight()
+        self.negative_hits = 0
+
+    @staticmethod
+    def token_key(access_token: str) -> str:
+        """Cache key for a token - the raw token is never stored"""
+        return token_hash(access_token)
+
+    def ttl_for(self, access_token: str) -> float:
+        """Seconds until the token expires, capped at max_ttl"""
+        try:
+            exp = jwt.decode(access_token, options={"verify_signature": False}).get("exp")
+        except jwt.InvalidTokenError:
+            exp = None
+
+        if exp is None:
+            return self.default_ttl
+        return min(self.max_ttl, float(exp) - time.time())
+
+    async def get_or_fetch(
+        self,
+        access_token: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Return cached claims for the token, calling `fetch` on a miss.
+
+        Raises:
+            Exception: The (possibly cached) error raised by `fetch`
+        """
+        key = self.token_key(access_token)
+        entry = self.local.get(key)
+        if isinstance(entry, _NegativeEntry):
+            self.negative_hits += 1
+            raise entry.error.with_traceback(None)
+        if entry is not None:
+            return dict(entry)
+
+        async def load() -> Dict[str, Any]:
+            try:
+                claims = await fetch()
+            except Exception as e:
+                if getattr(e, "status_code", None) in self.negative_statuses:
+                    ttl = min(self.negative_ttl, self.ttl_for(access_token))
+                    self.local.set(key, _NegativeEntry(e), ttl=max(ttl, 1.0))
+                raise
+            self.local.set(key, claims, ttl=self.ttl_for(access_token))
+            return claims
+
+        return dict(await self.inflight.do(key, load))
+
+    def invalidate(self, access_token: str) -> None:
+        """Drop cached claims, e.g. after the token is revoked"""
+        self.local.delete(self.token_key(access_token))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.local.stats()
+        stats["negative_hits"] = self.negative_hits
+        stats["single_flight"] = self.inflight.stats()
+        return stats
@@ -2,7 +2,7 @@
 Auth models for user registration and JWT token handling
 """
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional
+from typing import Optional, Any
 import re
 
 
@@ -93,6 +93,16 @@ class UserRegistrationResponse(BaseModel):
     jwt_scopes_hint: str
 
 
+class BulkUserResult(BaseModel):
+    """Per-user outcome of a bulk registration"""
+    username: str
+    status: str  # success or failed
+    status_code: int
+    user_id: Optional[str] = None
+    line: Optional[int] = None  # Input line, for rows rejected before import
+    error: Optional[Any] = None
+
+
 class TokenRequest(BaseModel):
     """OAuth2 token request"""
     username: str
@@ -0,0 +1,311 @@
+"""
+Resilience layer for WSO2 IS calls
+Per-endpoint circuit breakers, jittered retries under a shared retry budget,
+and per-call deadlines so a slow IdP fails fast instead of piling up workers
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+import httpx
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+meter = metrics.get_meter("common.auth.resilience")
+
+# Gauge values for breaker state
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Upstream statuses that mean the IdP is unhealthy (4xx are caller errors)
+FAILURE_STATUSES = frozenset({500, 502, 503, 504})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Call rejected because the endpoint's circuit breaker is open"""
+    def __init__(self, endpoint: str, retry_after: float):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"Circuit open for '{endpoint}', retry after {retry_after:.1f}s")
+
+
+class DeadlineExceededError(Exception):
+    """The per-call deadline elapsed before a response was received"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open after `recovery_timeout` seconds;
+    half_open lets `half_open_max_calls` trial calls through and closes on
+    success or reopens on failure.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        on_state_change: Optional[Callable[[str, str, str], None]] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.rejected = 0
+
+    def _transition(self, new_state: str) -> None:
+        old_state, self.state = self.state, new_state
+        if new_state == "open":
+            self.opened_at = time.monotonic()
+        if new_state == "half_open":
+            self.half_open_calls = 0
+        logger.warning(f"WSO2 IS circuit '{self.name}': {old_state} -> {new_state}")
+        if self.on_state_change:
+            self.on_state_change(self.name, old_state, new_state)
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; counts it as a trial call when half-open"""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self._transition("half_open")
+
+        if self.state == "half_open":
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.rejected += 1
+                return False
+            self.half_open_calls += 1
+
+        return True
+
+    def release(self) -> None:
+        """Return a trial slot taken by allow() for a call that ended without an outcome"""
+        if self.state == "half_open" and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            self._transition("closed")
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or (
+            self.state == "closed" and self.consecutive_failures >= self.failure_threshold
+        ):
+            self._transition("open")
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of overall traffic.
+
+    Every request deposits `ratio` tokens, every retry spends one, and a
+    floor of `min_per_second` tokens accrues over time so low-traffic
+    clients can still retry. Retries stop once the budget is empty, which
+    keeps retry storms from multiplying load on a struggling IdP.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_per_second: float = 5.0,
+        max_balance: float = 100.0
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self._updated_at = time.monotonic()
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(
+            self.max_balance,
+            self.balance + (now - self._updated_at) * self.min_per_second
+        )
+        self._updated_at = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self.balance >= 1.0:
+            self.balance -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+
+class ResiliencePolicy:
+    """
+    Runs HTTP calls under a deadline, circuit breaker and retry budget.
+
+    Breakers are created per endpoint group on first use. Only calls marked
+    idempotent are retried, with full-jitter exponential backoff that never
+    sleeps past the deadline. `deadline` should match the HTTP client's
+    timeout; calls that legitimately run longer pass their own.
+    """
+
+    def __init__(
+        self,
+        deadline: float = 10.0,
+        max_attempts: int = 3,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        retry_budget: Optional[RetryBudget] = None
+    ):
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+
+        self._transitions = meter.create_counter(
+            "wso2_client.circuit_breaker.transitions",
+            description="Circuit breaker state changes per endpoint"
+        )
+        self._retry_counter = meter.create_counter(
+            "wso2_client.retries",
+            description="Retried WSO2 IS calls per endpoint"
+        )
+        meter.create_observable_gauge(
+            "wso2_client.circuit_breaker.state",
+            callbacks=[self._observe_states],
+            description="Circuit breaker state (0=closed, 1=half_open, 2=open)"
+        )
+
+    def _observe_states(self, options):
+        return [
+            metrics.Observation(STATE_VALUES[breaker.state], {"endpoint": name})
+            for name, breaker in self.breakers.items()
+        ]
+
+    def _on_state_change(self, endpoint: str, old_state: str, new_state: str) -> None:
+        self._transitions.add(1, {"endpoint": endpoint, "from": old_state, "to": new_state})
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                failure_threshold=self.failure_threshold,
+                recovery_timeout=self.recovery_timeout,
+                on_state_change=self._on_state_change
+            )
+        return self.breakers[endpoint]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def call(
+        self,
+        endpoint: str,
+        send: Callable[[float], Awaitable[httpx.Response]],
+        idempotent: bool = False,
+        deadline: Optional[float] = None
+    ) -> httpx.Response:
+        """
+        Execute `send(timeout)` under the policy.
+
+        Args:
+            endpoint: Breaker group, e.g. "token", "scim", "userinfo"
+            send: Performs one attempt; receives the seconds left before the deadline
+            idempotent: Whether failed attempts may be retried
+            deadline: Overall seconds for all attempts (defaults to policy deadline)
+
+        Raises:
+            CircuitOpenError: Breaker is open, no request was sent
+            DeadlineExceededError: Deadline elapsed before a response arrived
+            httpx.RequestError: Last transport error when retries are exhausted
+        """
+        breaker = self.breaker(endpoint)
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        self.retry_budget.deposit()
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(endpoint, breaker.retry_after())
+
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"Deadline exceeded calling '{endpoint}'")
+
+            try:
+                response = await send(remaining)
+            except httpx.RequestError as e:
+                breaker.record_failure()
+                if isinstance(e, httpx.TimeoutException) and time.monotonic() >= expires_at:
+                    raise DeadlineExceededError(f"Deadline exceeded calling '{endpoint}'") from e
+                error, response = e, None
+            except BaseException:
+                # Cancelled (or failed outside the transport): no verdict on the
+                # endpoint, but a half-open trial slot must not stay taken
+                breaker.release()
+                raise
+            else:
+                if response.status_code in FAILURE_STATUSES:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in RETRYABLE_STATUSES:
+                    return response
+                error = None
+
+            attempt += 1
+            delay = self._backoff(attempt)
+            can_retry = (
+                idempotent
+                and attempt < self.max_attempts
+                and time.monotonic() + delay < expires_at
+                and self.retry_budget.try_spend()
+            )
+            if not can_retry:
+                if error is not None:
+                    raise error
+                return response
+
+            self.retries += 1
+            self._retry_counter.add(1, {"endpoint": endpoint})
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "retry_budget_balance": round(self.retry_budget.balance, 2),
+            "retry_budget_exhausted": self.retry_budget.exhausted,
+            "breakers": {
+                name: {
+                    "state": breaker.state,
+                    "consecutive_failures": breaker.consecutive_failures,
+                    "rejected": breaker.rejected,
+                    "retry_after": round(breaker.retry_after(), 2) if breaker.state == "open" else 0.0
+                }
+                for name, breaker in self.breakers.items()
+            }
+        }
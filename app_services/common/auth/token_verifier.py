@@ -0,0 +1,211 @@
+"""
+Offline JWT verification for WSO2 IS tokens
+Verifies signature, expiry, audience and issuer locally against cached JWKS keys
+"""
+import asyncio
+import jwt
+import logging
+import time
+from typing import Optional, Dict, Any, Callable, Awaitable, Sequence
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+from .wso2_client import WSO2ClientError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenVerificationError(WSO2ClientError):
+    """Token failed local verification (bad signature, expired, wrong audience...)"""
+    def __init__(self, detail: Any):
+        super().__init__(401, detail)
+
+
+class JWKSCache:
+    """
+    In-memory cache of the WSO2 IS signing keys.
+
+    Keys are refreshed when the cache is older than `ttl` or when a token
+    arrives with an unknown `kid` (key rotation). Unknown-kid refreshes are
+    rate limited by `min_refresh_interval` so garbage tokens cannot be used
+    to hammer the IdP. If a refresh fails, previously fetched keys stay in use.
+    """
+
+    def __init__(
+        self,
+        fetch_jwks: Callable[[], Awaitable[Dict[str, Any]]],
+        ttl: float = 3600.0,
+        min_refresh_interval: float = 30.0
+    ):
+        self._fetch_jwks = fetch_jwks
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at: float = float("-inf")  # Never fetched; monotonic time can start near 0
+        self._next_attempt_at: float = float("-inf")  # Backoff after a failed fetch
+        self._lock = asyncio.Lock()
+
+    async def get_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        """
+        Return the signing key for `kid`, refreshing the key set if needed.
+
+        Raises:
+            TokenVerificationError: If no matching key exists after refresh
+        """
+        if time.monotonic() - self._fetched_at > self.ttl and self._may_fetch():
+            await self.refresh()
+
+        key = self._lookup(kid)
+        if (
+            key is None
+            and time.monotonic() - self._fetched_at > self.min_refresh_interval
+            and self._may_fetch()
+        ):
+            # Possibly a rotated key - fetch the key set again
+            await self.refresh()
+            key = self._lookup(kid)
+
+        if key is None:
+            raise TokenVerificationError(f"Unknown signing key: {kid}")
+        return key
+
+    def _may_fetch(self) -> bool:
+        return time.monotonic() >= self._next_attempt_at
+
+    def _lookup(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        if kid is None:
+            # Tokens without a kid are only accepted when there is a single key
+            if len(self._keys) == 1:
+                return next(iter(self._keys.values()))
+            return None
+        return self._keys.get(kid)
+
+    async def refresh(self) -> None:
+        """Fetch the JWKS document; concurrent callers share one fetch"""
+        fetched_at = self._fetched_at
+        async with self._lock:
+            if self._fetched_at != fetched_at or not self._may_fetch():
+                # Another task refreshed (or failed to) while we waited for the lock
+                return
+
+            try:
+                jwks = await self._fetch_jwks()
+            except Exception as e:
+                # Back off for min_refresh_interval, keep stale keys
+                self._next_attempt_at = time.monotonic() + self.min_refresh_interval
+                logger.warning(f"JWKS refresh failed, keeping {len(self._keys)} cached keys: {e}")
+                return
+
+            keys = {}
+            for key_data in jwks.get("keys", []):
+                try:
+                    key = jwt.PyJWK(key_data)
+                except jwt.PyJWKError as e:
+                    logger.debug(f"Skipping unusable JWKS key {key_data.get('kid')}: {e}")
+                    continue
+                keys[key_data.get("kid") or key.key_id] = key
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            logger.info(f"Loaded {len(keys)} WSO2 IS signing keys")
+
+
+class TokenVerifier:
+    """
+    Verifies WSO2 IS issued JWTs (access and id tokens) without calling the IdP.
+
+    Usage in FastAPI:
+    ```python
+    verifier = wso2_client.create_token_verifier(audience="my-client-id")
+
+    @router.get("/me")
+    async def me(claims: dict = Depends(verifier.as_dependency())):
+        return {"sub": claims["sub"]}
+    ```
+    """
+
+    def __init__(
+        self,
+        jwks_cache: JWKSCache,
+        issuer: Optional[str] = None,
+        audience: Optional[str] = None,
+        algorithms: Sequence[str] = ("RS256",),
+        leeway: float = 30.0
+    ):
+        self.jwks_cache = jwks_cache
+        self.issuer = issuer
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.leeway = leeway
+
+    async def verify(self, token: str, audience: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Verify a JWT and return its claims.
+
+        Args:
+            token: Encoded JWT
+            audience: Expected audience, overriding the verifier default
+
+        Returns:
+            Verified token claims
+
+        Raises:
+            TokenVerificationError: If the token is malformed or fails verification
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError as e:
+            raise TokenVerificationError(f"Malformed token: {e}")
+
+        if header.get("alg") not in self.algorithms:
+            raise TokenVerificationError(f"Unsupported token algorithm: {header.get('alg')}")
+
+        key = await self.jwks_cache.get_key(header.get("kid"))
+        audience = audience or self.audience
+
+        try:
+            return jwt.decode(
+                token,
+                key=key.key,
+                algorithms=self.algorithms,
+                audience=audience,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={
+                    "require": ["exp", "iat", "sub"],
+                    "verify_aud": audience is not None,
+                    "verify_iss": self.issuer is not None
+                }
+            )
+        except jwt.ExpiredSignatureError:
+            raise TokenVerificationError("Token has expired")
+        except jwt.InvalidTokenError as e:
+            raise TokenVerificationError(f"Invalid token: {e}")
+
+    def as_dependency(self) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        """
+        Build a FastAPI dependency that verifies the Bearer token.
+
+        Returns the verified claims, or raises 401 with a WWW-Authenticate header.
+        """
+        bearer = HTTPBearer(auto_error=False)
+
+        async def verify_bearer_token(
+            credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
+        ) -> Dict[str, Any]:
+            if credentials is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Missing bearer token",
+                    headers={"WWW-Authenticate": "Bearer"}
+                )
+            try:
+                return await self.verify(credentials.credentials)
+            except TokenVerificationError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=e.detail,
+                    headers={"WWW-Authenticate": 'Bearer error="invalid_token"'}
+                )
+
+        return verify_bearer_token
@@ -2,13 +2,19 @@
 WSO2 Identity Server API Client
 Handles user registration, authentication, and token operations
 """
+import asyncio
 import httpx
 import base64
+import importlib.util
 import jwt
-from typing import Optional, Dict, Any
+import logging
+from typing import (
+    Optional, Dict, Any, List, Iterable, AsyncIterable, AsyncIterator, Union, TYPE_CHECKING
+)
 from .models import (
     UserRegistrationRequest,
     UserRegistrationResponse,
+    BulkUserResult,
     TokenRequest,
     TokenResponse,
     PasswordResetRequest,
@@ -20,6 +26,35 @@ from .models import (
     EmailVerificationRequest,
     EmailVerificationResponse
 )
+from .cache import ScimIdCache, UserInfoCache, SingleFlight, TTLCache, token_hash
+from .resilience import ResiliencePolicy, CircuitOpenError, DeadlineExceededError
+
+if TYPE_CHECKING:
+    from .token_verifier import TokenVerifier
+
+logger = logging.getLogger(__name__)
+
+
+async def _chunked(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    size: int
+) -> AsyncIterator[List[Any]]:
+    """Group a sync or async iterable into lists of at most `size` items"""
+    chunk = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
 
 
 class WSO2ClientError(Exception):
@@ -34,20 +69,74 @@ class WSO2IdentityClient:
     """
     WSO2 Identity Server API Client
     Handles user registration, authentication, and token operations
+
+    All calls share one keep-alive connection pool (optionally HTTP/2).
+    Create one instance per process and tie it to the app lifespan:
+
+    ```python
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await wso2_client.startup()
+        yield
+        await wso2_client.shutdown()
+    ```
     """
-    
+
     def __init__(
         self,
         base_url: str = "https://wso2is:9443",
         admin_user: str = "admin",
         admin_pass: str = "admin",
-        verify_ssl: bool = False
+        verify_ssl: bool = False,
+        http2: bool = False,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+        bulk_timeout: float = 300.0,
+        scim_id_cache: Optional[ScimIdCache] = None,
+        userinfo_cache: Optional[UserInfoCache] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        refresh_grace_seconds: float = 10.0
     ):
         self.base_url = base_url
         self.admin_user = admin_user
         self.admin_pass = admin_pass
         self.verify_ssl = verify_ssl
         self.auth_header = self._create_basic_auth()
+        
+        # Shared connection pool settings (see startup/shutdown)
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        # SCIM /Bulk chunks are not idempotent and IS may take minutes on a
+        # large one; a shorter deadline would report users it goes on to create as failed
+        self.bulk_timeout = bulk_timeout
+        
+        # Circuit breakers, retry budget and per-call deadlines
+        self.resilience = resilience or ResiliencePolicy(deadline=timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._requests_total = 0
+        self._requests_in_flight = 0
+        self._transport_errors = 0
+        
+        # Username -> SCIM id, avoids a SCIM filter search before each PATCH
+        self.scim_id_cache = scim_id_cache or ScimIdCache()
+        
+        # Access token hash -> userinfo claims, valid until the token expires
+        self.userinfo_cache = userinfo_cache or UserInfoCache()
+        
+        # Single-flight refresh_token calls plus a short grace cache of results
+        self._refresh_flight = SingleFlight()
+        self._refresh_grace = TTLCache(maxsize=10000, ttl=refresh_grace_seconds)
+        
+        # Set by create_token_verifier(); used to verify id_tokens offline
+        self.token_verifier: Optional["TokenVerifier"] = None
     
     def _create_basic_auth(self) -> str:
         """Create Basic Auth header"""
@@ -55,24 +144,222 @@ class WSO2IdentityClient:
         encoded = base64.b64encode(credentials.encode()).decode()
         return f"Basic {encoded}"
     
-    async def register_user(
-        self, 
-        user: UserRegistrationRequest
-    ) -> UserRegistrationResponse:
+    # ========================================================================
+    # Connection pool lifecycle
+    # ========================================================================
+    
+    async def startup(self) -> None:
         """
-        Register new user via SCIM2 API.
-        Phone and address stored as user attributes - appear in JWT when scopes requested.
+        Open the shared connection pool.
         
-        Args:
-            user: User registration details
+        Call from the FastAPI lifespan/startup hook. Calling it is optional -
+        the pool is opened lazily on first request - but doing it up front
+        keeps pool creation off the first user request.
+        """
+        self._get_client()
+    
+    async def shutdown(self) -> None:
+        """Close the shared connection pool and all keep-alive connections"""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+            logger.info("Closed WSO2 IS connection pool")
+    
+    async def __aenter__(self) -> "WSO2IdentityClient":
+        await self.startup()
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.shutdown()
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared AsyncClient, creating the pool on first use"""
+        if self._client is None or self._client.is_closed:
+            http2 = self.http2
+            if http2 and importlib.util.find_spec("h2") is None:
+                logger.warning(
+                    "HTTP/2 requested for WSO2 IS but the 'h2' package is not "
+                    "installed; falling back to HTTP/1.1 keep-alive"
+                )
+                http2 = False
             
+            self._client = httpx.AsyncClient(
+                verify=self.verify_ssl,
+                http2=http2,
+                limits=self.limits,
+                timeout=self.timeout
+            )
+            logger.info(
+                f"Opened WSO2 IS connection pool to {self.base_url} "
+                f"(http2={http2}, max_connections={self.limits.max_connections})"
+            )
+        return self._client
+    
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        idempotent: Optional[bool] = None,
+        deadline: Optional[float] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request through the shared connection pool.
+        
+        The call runs under the resilience policy: the endpoint's circuit
+        breaker, the per-call deadline and - for idempotent requests only
+        (GET by default) - jittered retries within the retry budget.
+        
+        Raises:
+            WSO2ClientError: 503 if the circuit is open, 504 on deadline
+            httpx.RequestError: Transport failure after retries
+        """
+        client = self._get_client()
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD", "OPTIONS")
+        read_timeout = max(self.timeout.read, deadline or 0.0)
+        
+        async def send(remaining: float) -> httpx.Response:
+            self._requests_total += 1
+            self._requests_in_flight += 1
+            try:
+                return await client.request(
+                    method,
+                    url,
+                    timeout=httpx.Timeout(
+                        min(remaining, read_timeout),
+                        connect=min(remaining, self.timeout.connect)
+                    ),
+                    **kwargs
+                )
+            except httpx.RequestError:
+                self._transport_errors += 1
+                raise
+            finally:
+                self._requests_in_flight -= 1
+        
+        try:
+            return await self.resilience.call(
+                endpoint, send, idempotent=idempotent, deadline=deadline
+            )
+        except CircuitOpenError as e:
+            raise WSO2ClientError(
+                503,
+                {"error": "WSO2 IS temporarily unavailable", "endpoint": e.endpoint,
+                 "retry_after": round(e.retry_after, 1)}
+            )
+        except DeadlineExceededError as e:
+            raise WSO2ClientError(504, str(e))
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of connection pool usage for metrics scraping.
+        
+        Connection counts are read from httpx/httpcore internals: they are
+        zero until the pool has been opened, and None if a library upgrade
+        moved those internals (the other fields are still reported).
+        """
+        stats = {
+            "open": self._client is not None and not self._client.is_closed,
+            "http2_enabled": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "requests_total": self._requests_total,
+            "requests_in_flight": self._requests_in_flight,
+            "transport_errors": self._transport_errors,
+            "connections": 0,
+            "connections_idle": 0,
+            "connections_active": 0,
+            "connections_http2": 0
+        }
+        
+        counts = ("connections", "connections_idle", "connections_active", "connections_http2")
+        try:
+            pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+            for connection in getattr(pool, "connections", []):
+                stats["connections"] += 1
+                if connection.is_idle():
+                    stats["connections_idle"] += 1
+                else:
+                    stats["connections_active"] += 1
+                if "HTTP/2" in connection.info():
+                    stats["connections_http2"] += 1
+        except (AttributeError, TypeError) as e:
+            logger.debug(f"Connection pool internals unavailable: {e}")
+            stats.update(dict.fromkeys(counts))
+        
+        return stats
+    
+    def resilience_stats(self) -> Dict[str, Any]:
+        """Circuit breaker states and retry budget usage per endpoint"""
+        return self.resilience.stats()
+    
+    # ========================================================================
+    # Offline token verification
+    # ========================================================================
+    
+    async def get_jwks(self) -> Dict[str, Any]:
+        """
+        Fetch the JSON Web Key Set used to sign WSO2 IS tokens.
+        
         Returns:
-            UserRegistrationResponse with user_id and available claims
+            JWKS document ({"keys": [...]})
             
         Raises:
-            WSO2ClientError: If registration fails
+            WSO2ClientError: If the key set cannot be fetched
+        """
+        try:
+            response = await self._request(
+                "GET",
+                f"{self.base_url}/oauth2/jwks",
+                endpoint="jwks",
+                headers={"Accept": "application/json"}
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                raise WSO2ClientError(response.status_code, "Failed to fetch JWKS")
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+    
+    def create_token_verifier(
+        self,
+        audience: Optional[str] = None,
+        issuer: Optional[str] = None,
+        jwks_ttl: float = 3600.0,
+        leeway: float = 30.0
+    ) -> "TokenVerifier":
         """
+        Create a local JWT verifier backed by this client's JWKS endpoint.
         
+        The verifier is also kept on the client so that authenticate()
+        verifies id_token signatures instead of decoding them blindly.
+        
+        Args:
+            audience: Expected `aud` claim (usually the OAuth2 client ID)
+            issuer: Expected `iss` claim (config.WSO2_IS_ISSUER); not checked when omitted,
+                since IS signs tokens with its own hostname rather than base_url
+            jwks_ttl: Seconds before cached signing keys are refetched
+            leeway: Allowed clock skew in seconds for exp/nbf/iat
+            
+        Returns:
+            TokenVerifier usable directly or as a FastAPI dependency
+        """
+        from .token_verifier import JWKSCache, TokenVerifier
+        
+        self.token_verifier = TokenVerifier(
+            JWKSCache(self.get_jwks, ttl=jwks_ttl),
+            issuer=issuer or None,
+            audience=audience,
+            leeway=leeway
+        )
+        return self.token_verifier
+    
+    def _build_scim_user(self, user: UserRegistrationRequest) -> Dict[str, Any]:
+        """Build the SCIM2 User resource for a registration request"""
         # Build SCIM2 payload
         scim_user = {
             "schemas": ["urn:ietf:params:scim:schemas:core:2.0:User"],
@@ -124,54 +411,232 @@ class WSO2IdentityClient:
             if address_data:
                 scim_user["addresses"] = [address_data]
         
+        return scim_user
+    
+    async def register_user(
+        self, 
+        user: UserRegistrationRequest
+    ) -> UserRegistrationResponse:
+        """
+        Register new user via SCIM2 API.
+        Phone and address stored as user attributes - appear in JWT when scopes requested.
+        
+        Args:
+            user: User registration details
+            
+        Returns:
+            UserRegistrationResponse with user_id and available claims
+            
+        Raises:
+            WSO2ClientError: If registration fails
+        """
+        scim_user = self._build_scim_user(user)
+        
         # Send request to WSO2 IS
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/scim2/Users",
-                    json=scim_user,
-                    headers={
-                        "Authorization": self.auth_header,
-                        "Content-Type": "application/scim+json",
-                        "Accept": "application/scim+json"
-                    },
-                    timeout=30.0
-                )
+        try:
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/scim2/Users",
+                endpoint="scim",
+                json=scim_user,
+                headers={
+                    "Authorization": self.auth_header,
+                    "Content-Type": "application/scim+json",
+                    "Accept": "application/scim+json"
+                }
+            )
+            
+            if response.status_code == 201:
+                user_data = response.json()
+                await self.scim_id_cache.set(user_data.get("userName"), user_data.get("id"))
                 
-                if response.status_code == 201:
-                    user_data = response.json()
-                    
-                    # Build claims availability info
-                    claims_available = {
-                        "profile": ["given_name", "family_name", "email"],
-                        "phone": ["phone_number"] if user.phone else [],
-                        "address": [
-                            "street_address", "locality", "region", 
-                            "postal_code", "country", "formatted"
-                        ] if user.address else []
-                    }
-                    
-                    return UserRegistrationResponse(
-                        status="success",
-                        message="User registered successfully",
-                        user_id=user_data.get("id"),
-                        username=user_data.get("userName"),
-                        claims_available=claims_available,
-                        jwt_scopes_hint="Use scopes: openid profile email phone address"
-                    )
+                # Build claims availability info
+                claims_available = {
+                    "profile": ["given_name", "family_name", "email"],
+                    "phone": ["phone_number"] if user.phone else [],
+                    "address": [
+                        "street_address", "locality", "region", 
+                        "postal_code", "country", "formatted"
+                    ] if user.address else []
+                }
                 
-                elif response.status_code == 409:
-                    raise WSO2ClientError(
-                        409,
-                        {"error": "User already exists", "username": user.username}
+                return UserRegistrationResponse(
+                    status="success",
+                    message="User registered successfully",
+                    user_id=user_data.get("id"),
+                    username=user_data.get("userName"),
+                    claims_available=claims_available,
+                    jwt_scopes_hint="Use scopes: openid profile email phone address"
+                )
+            
+            elif response.status_code == 409:
+                raise WSO2ClientError(
+                    409,
+                    {"error": "User already exists", "username": user.username}
+                )
+            
+            else:
+                error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
+                raise WSO2ClientError(response.status_code, error_data)
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+    
+    async def register_users_bulk(
+        self,
+        users: Union[Iterable[UserRegistrationRequest], AsyncIterable[UserRegistrationRequest]],
+        chunk_size: int = 100,
+        max_concurrency: int = 4
+    ) -> AsyncIterator[BulkUserResult]:
+        """
+        Register many users through the SCIM2 /Bulk endpoint.
+        
+        Input is consumed lazily and at most `max_concurrency` chunks of
+        `chunk_size` users are in flight, so memory stays flat for large
+        imports. Results are yielded per user as each chunk completes
+        (chunk completion order, not input order).
+        
+        Args:
+            users: Iterable or async iterable of registration requests
+            chunk_size: Users per SCIM Bulk request (WSO2 default max is 1000)
+            max_concurrency: Bulk requests sent in parallel
+            
+        Yields:
+            BulkUserResult for every input user
+        """
+        pending = set()
+        try:
+            async for chunk in _chunked(users, chunk_size):
+                if len(pending) >= max_concurrency:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
                     )
-                
-                else:
-                    error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
-                    raise WSO2ClientError(response.status_code, error_data)
+                    for task in done:
+                        for result in task.result():
+                            yield result
+                pending.add(asyncio.create_task(self._register_bulk_chunk(chunk)))
+            
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    for result in task.result():
+                        yield result
+        finally:
+            # Consumer stopped early or failed - don't leave chunks running
+            for task in pending:
+                task.cancel()
+    
+    async def _register_bulk_chunk(
+        self,
+        chunk: List[UserRegistrationRequest]
+    ) -> List[BulkUserResult]:
+        """Send one SCIM2 Bulk request and map operations back to users"""
+        operations = [
+            {
+                "method": "POST",
+                "path": "/Users",
+                "bulkId": f"user-{index}",
+                "data": self._build_scim_user(user)
+            }
+            for index, user in enumerate(chunk)
+        ]
+        
+        try:
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/scim2/Bulk",
+                endpoint="scim",
+                deadline=self.bulk_timeout,
+                json={
+                    "schemas": ["urn:ietf:params:scim:api:messages:2.0:BulkRequest"],
+                    "Operations": operations
+                },
+                headers={
+                    "Authorization": self.auth_header,
+                    "Content-Type": "application/scim+json",
+                    "Accept": "application/scim+json"
+                }
+            )
+        except httpx.RequestError as e:
+            error = f"Failed to connect to WSO2 IS: {str(e)}"
+            return [
+                BulkUserResult(username=user.username, status="failed", status_code=503, error=error)
+                for user in chunk
+            ]
+        except WSO2ClientError as e:
+            return [
+                BulkUserResult(
+                    username=user.username,
+                    status="failed",
+                    status_code=e.status_code,
+                    error=e.detail
+                )
+                for user in chunk
+            ]
+        
+        if response.status_code != 200:
+            error = response.json() if "json" in response.headers.get("content-type", "") else response.text
+            return [
+                BulkUserResult(
+                    username=user.username,
+                    status="failed",
+                    status_code=response.status_code,
+                    error=error
+                )
+                for user in chunk
+            ]
+        
+        outcomes = {
+            op.get("bulkId"): op
+            for op in response.json().get("Operations", [])
+        }
+        
+        results = []
+        for index, user in enumerate(chunk):
+            op = outcomes.get(f"user-{index}")
+            if op is None:
+                results.append(BulkUserResult(
+                    username=user.username,
+                    status="failed",
+                    status_code=500,
+                    error="No result returned for operation"
+                ))
+                continue
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            # WSO2 returns {"code": 201}; RFC 7644 examples use "201"
+            op_status = op.get("status")
+            try:
+                code = int(op_status.get("code") if isinstance(op_status, dict) else op_status)
+            except (TypeError, ValueError):
+                results.append(BulkUserResult(
+                    username=user.username,
+                    status="failed",
+                    status_code=500,
+                    error=f"Missing or invalid operation status: {op_status!r}"
+                ))
+                continue
+            
+            if code == 201:
+                user_id = (op.get("location") or "").rstrip("/").rsplit("/", 1)[-1] or None
+                if user_id:
+                    await self.scim_id_cache.set(user.username, user_id)
+                results.append(BulkUserResult(
+                    username=user.username,
+                    status="success",
+                    status_code=code,
+                    user_id=user_id
+                ))
+            else:
+                results.append(BulkUserResult(
+                    username=user.username,
+                    status="failed",
+                    status_code=code,
+                    error=op.get("response")
+                ))
+        
+        return results
     
     async def authenticate(
         self,
@@ -192,61 +657,74 @@ class WSO2IdentityClient:
         
         scope_string = " ".join(token_request.scopes)
         
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/oauth2/token",
-                    data={
-                        "grant_type": "password",
-                        "username": token_request.username,
-                        "password": token_request.password,
-                        "scope": scope_string
-                    },
-                    auth=(token_request.client_id, token_request.client_secret),
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                    timeout=30.0
-                )
+        try:
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/oauth2/token",
+                endpoint="token",
+                data={
+                    "grant_type": "password",
+                    "username": token_request.username,
+                    "password": token_request.password,
+                    "scope": scope_string
+                },
+                auth=(token_request.client_id, token_request.client_secret),
+                headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            
+            if response.status_code == 200:
+                token_data = response.json()
                 
-                if response.status_code == 200:
-                    token_data = response.json()
-                    
-                    # Decode ID token to show claims (without verification for inspection)
-                    id_token = token_data.get("id_token")
-                    decoded_claims = None
-                    if id_token:
-                        try:
+                # Decode ID token claims - verified against JWKS when a
+                # token verifier is configured, otherwise for inspection only
+                id_token = token_data.get("id_token")
+                decoded_claims = None
+                if id_token:
+                    try:
+                        if self.token_verifier is not None:
+                            decoded_claims = await self.token_verifier.verify(
+                                id_token,
+                                audience=token_request.client_id
+                            )
+                        else:
                             decoded_claims = jwt.decode(
                                 id_token,
                                 options={"verify_signature": False}
                             )
-                        except Exception:
-                            decoded_claims = None
-                    
-                    return TokenResponse(
-                        access_token=token_data.get("access_token"),
-                        id_token=id_token,
-                        refresh_token=token_data.get("refresh_token"),
-                        expires_in=token_data.get("expires_in"),
-                        token_type=token_data.get("token_type"),
-                        scope=token_data.get("scope"),
-                        decoded_claims=decoded_claims
-                    )
+                    except WSO2ClientError as e:
+                        logger.warning(f"id_token failed verification: {e.detail}")
+                        decoded_claims = None
+                    except Exception:
+                        decoded_claims = None
                 
-                elif response.status_code == 401:
-                    raise WSO2ClientError(401, "Invalid credentials")
-                
-                else:
-                    error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
-                    raise WSO2ClientError(response.status_code, error_data)
+                return TokenResponse(
+                    access_token=token_data.get("access_token"),
+                    id_token=id_token,
+                    refresh_token=token_data.get("refresh_token"),
+                    expires_in=token_data.get("expires_in"),
+                    token_type=token_data.get("token_type"),
+                    scope=token_data.get("scope"),
+                    decoded_claims=decoded_claims
+                )
+            
+            elif response.status_code == 401:
+                raise WSO2ClientError(401, "Invalid credentials")
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            else:
+                error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
+                raise WSO2ClientError(response.status_code, error_data)
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
     
     async def get_userinfo(self, access_token: str) -> Dict[str, Any]:
         """
         Get user info from /userinfo endpoint.
         Returns claims based on scopes used during authentication.
         
+        Results are cached per token until it expires (see UserInfoCache);
+        revoked/invalid tokens are negatively cached for a short time.
+        
         Args:
             access_token: OAuth2 access token
             
@@ -256,23 +734,31 @@ class WSO2IdentityClient:
         Raises:
             WSO2ClientError: If request fails
         """
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/oauth2/userinfo",
-                    headers={"Authorization": f"Bearer {access_token}"}
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    raise WSO2ClientError(
-                        response.status_code,
-                        "Failed to fetch user info"
-                    )
+        return await self.userinfo_cache.get_or_fetch(
+            access_token,
+            lambda: self._fetch_userinfo(access_token)
+        )
+    
+    async def _fetch_userinfo(self, access_token: str) -> Dict[str, Any]:
+        """Call /oauth2/userinfo, bypassing the cache"""
+        try:
+            response = await self._request(
+                "GET",
+                f"{self.base_url}/oauth2/userinfo",
+                endpoint="userinfo",
+                headers={"Authorization": f"Bearer {access_token}"}
+            )
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            if response.status_code == 200:
+                return response.json()
+            else:
+                raise WSO2ClientError(
+                    response.status_code,
+                    "Failed to fetch user info"
+                )
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
     
     async def refresh_token(
         self,
@@ -283,6 +769,12 @@ class WSO2IdentityClient:
         """
         Refresh access token using refresh token.
         
+        Concurrent refreshes of the same refresh token with the same client
+        credentials share one upstream call, and the result is kept for
+        `refresh_grace_seconds` so late duplicates get the same new token
+        pair instead of failing on a rotated (already used) refresh token.
+        Failures are not cached.
+        
         Args:
             refresh_token: OAuth2 refresh token
             client_id: OAuth2 client ID
@@ -294,38 +786,124 @@ class WSO2IdentityClient:
         Raises:
             WSO2ClientError: If refresh fails
         """
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/oauth2/token",
-                    data={
-                        "grant_type": "refresh_token",
-                        "refresh_token": refresh_token
-                    },
-                    auth=(client_id, client_secret),
-                    headers={"Content-Type": "application/x-www-form-urlencoded"}
-                )
+        # The secret is part of the key: a caller only shares a result it
+        # could have obtained itself, so client authentication is never skipped
+        key = token_hash(f"{client_id}\0{client_secret}\0{refresh_token}")
+        refreshed = self._refresh_grace.get(key)
+        if refreshed is not None:
+            return refreshed.model_copy()
+        
+        async def refresh() -> TokenResponse:
+            token = await self._refresh_token(refresh_token, client_id, client_secret)
+            self._refresh_grace.set(key, token)
+            return token
+        
+        token = await self._refresh_flight.do(key, refresh)
+        return token.model_copy()
+    
+    async def _refresh_token(
+        self,
+        refresh_token: str,
+        client_id: str,
+        client_secret: str
+    ) -> TokenResponse:
+        """Call the refresh_token grant, bypassing single-flight"""
+        try:
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/oauth2/token",
+                endpoint="token",
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": refresh_token
+                },
+                auth=(client_id, client_secret),
+                headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            
+            if response.status_code == 200:
+                token_data = response.json()
                 
-                if response.status_code == 200:
-                    token_data = response.json()
-                    
-                    return TokenResponse(
-                        access_token=token_data.get("access_token"),
-                        id_token=token_data.get("id_token", ""),
-                        refresh_token=token_data.get("refresh_token"),
-                        expires_in=token_data.get("expires_in"),
-                        token_type=token_data.get("token_type"),
-                        scope=token_data.get("scope"),
-                        decoded_claims=None
-                    )
-                else:
-                    raise WSO2ClientError(
-                        response.status_code,
-                        "Failed to refresh token"
-                    )
+                return TokenResponse(
+                    access_token=token_data.get("access_token"),
+                    id_token=token_data.get("id_token", ""),
+                    refresh_token=token_data.get("refresh_token"),
+                    expires_in=token_data.get("expires_in"),
+                    token_type=token_data.get("token_type"),
+                    scope=token_data.get("scope"),
+                    decoded_claims=None
+                )
+            else:
+                raise WSO2ClientError(
+                    response.status_code,
+                    "Failed to refresh token"
+                )
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+    
+    async def _resolve_user_id(self, username: str) -> str:
+        """
+        Resolve a username to its SCIM user id, using the SCIM id cache.
+        
+        Raises:
+            WSO2ClientError: If the user does not exist or the search fails
+        """
+        user_id = await self.scim_id_cache.get(username)
+        if user_id is not None:
+            return user_id
+        
+        response = await self._request(
+            "GET",
+            f"{self.base_url}/scim2/Users",
+            endpoint="scim",
+            params={"filter": f"userName eq {username}"},
+            headers={
+                "Authorization": self.auth_header,
+                "Accept": "application/scim+json"
+            }
+        )
+        
+        if response.status_code != 200:
+            raise WSO2ClientError(response.status_code, "Failed to find user")
+        
+        users = response.json().get("Resources", [])
+        if not users:
+            raise WSO2ClientError(404, f"User '{username}' not found")
+        
+        user_id = users[0].get("id")
+        await self.scim_id_cache.set(username, user_id)
+        return user_id
+    
+    async def _patch_user(self, username: str, operations: list) -> httpx.Response:
+        """
+        Apply SCIM2 PATCH operations to a user by username.
+        
+        A 404 means the cached SCIM id is stale (user deleted or recreated):
+        the entry is invalidated and the PATCH retried once with a fresh id.
+        """
+        for attempt in range(2):
+            user_id = await self._resolve_user_id(username)
+            response = await self._request(
+                "PATCH",
+                f"{self.base_url}/scim2/Users/{user_id}",
+                endpoint="scim",
+                json={
+                    "schemas": ["urn:ietf:params:scim:api:messages:2.0:PatchOp"],
+                    "Operations": operations
+                },
+                headers={
+                    "Authorization": self.auth_header,
+                    "Content-Type": "application/scim+json",
+                    "Accept": "application/scim+json"
+                }
+            )
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            if response.status_code != 404:
+                break
+            await self.scim_id_cache.invalidate(username)
+        
+        return response
     
     async def reset_password(
         self,
@@ -343,61 +921,31 @@ class WSO2IdentityClient:
         Raises:
             WSO2ClientError: If password reset fails
         """
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                # First, get user ID by username
-                response = await client.get(
-                    f"{self.base_url}/scim2/Users",
-                    params={"filter": f"userName eq {reset_request.username}"},
-                    headers={
-                        "Authorization": self.auth_header,
-                        "Accept": "application/scim+json"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    raise WSO2ClientError(response.status_code, "Failed to find user")
-                
-                users = response.json().get("Resources", [])
-                if not users:
-                    raise WSO2ClientError(404, f"User '{reset_request.username}' not found")
-                
-                user_id = users[0].get("id")
-                
-                # Update password via SCIM2 PATCH
-                patch_response = await client.patch(
-                    f"{self.base_url}/scim2/Users/{user_id}",
-                    json={
-                        "schemas": ["urn:ietf:params:scim:api:messages:2.0:PatchOp"],
-                        "Operations": [{
-                            "op": "replace",
-                            "value": {
-                                "password": reset_request.new_password,
-                                "active": True
-                            }
-                        }]
-                    },
-                    headers={
-                        "Authorization": self.auth_header,
-                        "Content-Type": "application/scim+json",
-                        "Accept": "application/scim+json"
-                    },
-                    timeout=30.0
-                )
-                
-                if patch_response.status_code == 200:
-                    return PasswordResetResponse(
-                        status="success",
-                        message="Password reset successfully",
-                        username=reset_request.username
-                    )
-                else:
-                    error_data = patch_response.json() if "application/json" in patch_response.headers.get("content-type", "") else patch_response.text
-                    raise WSO2ClientError(patch_response.status_code, error_data)
+        try:
+            # Update password via SCIM2 PATCH
+            patch_response = await self._patch_user(
+                reset_request.username,
+                [{
+                    "op": "replace",
+                    "value": {
+                        "password": reset_request.new_password,
+                        "active": True
+                    }
+                }]
+            )
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            if patch_response.status_code == 200:
+                return PasswordResetResponse(
+                    status="success",
+                    message="Password reset successfully",
+                    username=reset_request.username
+                )
+            else:
+                error_data = patch_response.json() if "application/json" in patch_response.headers.get("content-type", "") else patch_response.text
+                raise WSO2ClientError(patch_response.status_code, error_data)
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
     
     async def update_profile(
         self,
@@ -417,121 +965,88 @@ class WSO2IdentityClient:
         Raises:
             WSO2ClientError: If update fails
         """
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                # First, get user ID by username
-                response = await client.get(
-                    f"{self.base_url}/scim2/Users",
-                    params={"filter": f"userName eq {username}"},
-                    headers={
-                        "Authorization": self.auth_header,
-                        "Accept": "application/scim+json"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    raise WSO2ClientError(response.status_code, "Failed to find user")
-                
-                users = response.json().get("Resources", [])
-                if not users:
-                    raise WSO2ClientError(404, f"User '{username}' not found")
-                
-                user_id = users[0].get("id")
-                
-                # Build PATCH operations for provided fields
-                operations = []
-                updated_fields = []
-                
-                if update_request.email is not None:
-                    operations.append({
-                        "op": "replace",
-                        "path": "emails",
-                        "value": [update_request.email]
-                    })
-                    updated_fields.append("email")
-                
-                if update_request.first_name is not None or update_request.last_name is not None:
-                    name_value = {}
-                    if update_request.first_name is not None:
-                        name_value["givenName"] = update_request.first_name
-                        updated_fields.append("first_name")
-                    if update_request.last_name is not None:
-                        name_value["familyName"] = update_request.last_name
-                        updated_fields.append("last_name")
-                    
-                    operations.append({
-                        "op": "replace",
-                        "path": "name",
-                        "value": name_value
-                    })
-                
-                if update_request.phone is not None:
-                    operations.append({
-                        "op": "replace",
-                        "path": "phoneNumbers",
-                        "value": [update_request.phone]
-                    })
-                    updated_fields.append("phone")
-                
-                if update_request.address is not None:
-                    address_value = {
-                        "formatted": update_request.address.to_formatted()
-                    }
-                    if update_request.address.street:
-                        address_value["streetAddress"] = update_request.address.street
-                    if update_request.address.locality:
-                        address_value["locality"] = update_request.address.locality
-                    if update_request.address.region:
-                        address_value["region"] = update_request.address.region
-                    if update_request.address.postal_code:
-                        address_value["postalCode"] = update_request.address.postal_code
-                    if update_request.address.country:
-                        address_value["country"] = update_request.address.country
-                    
-                    operations.append({
-                        "op": "replace",
-                        "path": "addresses",
-                        "value": [address_value]
-                    })
-                    updated_fields.append("address")
+        try:
+            # Build PATCH operations for provided fields
+            operations = []
+            updated_fields = []
+            
+            if update_request.email is not None:
+                operations.append({
+                    "op": "replace",
+                    "path": "emails",
+                    "value": [update_request.email]
+                })
+                updated_fields.append("email")
+            
+            if update_request.first_name is not None or update_request.last_name is not None:
+                name_value = {}
+                if update_request.first_name is not None:
+                    name_value["givenName"] = update_request.first_name
+                    updated_fields.append("first_name")
+                if update_request.last_name is not None:
+                    name_value["familyName"] = update_request.last_name
+                    updated_fields.append("last_name")
                 
-                if not operations:
-                    return UserProfileUpdateResponse(
-                        status="success",
-                        message="No fields to update",
-                        username=username,
-                        updated_fields=[]
-                    )
+                operations.append({
+                    "op": "replace",
+                    "path": "name",
+                    "value": name_value
+                })
+            
+            if update_request.phone is not None:
+                operations.append({
+                    "op": "replace",
+                    "path": "phoneNumbers",
+                    "value": [update_request.phone]
+                })
+                updated_fields.append("phone")
+            
+            if update_request.address is not None:
+                address_value = {
+                    "formatted": update_request.address.to_formatted()
+                }
+                if update_request.address.street:
+                    address_value["streetAddress"] = update_request.address.street
+                if update_request.address.locality:
+                    address_value["locality"] = update_request.address.locality
+                if update_request.address.region:
+                    address_value["region"] = update_request.address.region
+                if update_request.address.postal_code:
+                    address_value["postalCode"] = update_request.address.postal_code
+                if update_request.address.country:
+                    address_value["country"] = update_request.address.country
                 
-                # Update via SCIM2 PATCH
-                patch_response = await client.patch(
-                    f"{self.base_url}/scim2/Users/{user_id}",
-                    json={
-                        "schemas": ["urn:ietf:params:scim:api:messages:2.0:PatchOp"],
-                        "Operations": operations
-                    },
-                    headers={
-                        "Authorization": self.auth_header,
-                        "Content-Type": "application/scim+json",
-                        "Accept": "application/scim+json"
-                    },
-                    timeout=30.0
+                operations.append({
+                    "op": "replace",
+                    "path": "addresses",
+                    "value": [address_value]
+                })
+                updated_fields.append("address")
+            
+            if not operations:
+                return UserProfileUpdateResponse(
+                    status="success",
+                    message="No fields to update",
+                    username=username,
+                    updated_fields=[]
                 )
-                
-                if patch_response.status_code == 200:
-                    return UserProfileUpdateResponse(
-                        status="success",
-                        message="Profile updated successfully",
-                        username=username,
-                        updated_fields=updated_fields
-                    )
-                else:
-                    error_data = patch_response.json() if "application/json" in patch_response.headers.get("content-type", "") else patch_response.text
-                    raise WSO2ClientError(patch_response.status_code, error_data)
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            # Update via SCIM2 PATCH
+            patch_response = await self._patch_user(username, operations)
+            
+            if patch_response.status_code == 200:
+                return UserProfileUpdateResponse(
+                    status="success",
+                    message="Profile updated successfully",
+                    username=username,
+                    updated_fields=updated_fields
+                )
+            else:
+                error_data = patch_response.json() if "application/json" in patch_response.headers.get("content-type", "") else patch_response.text
+                raise WSO2ClientError(patch_response.status_code, error_data)
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
     
     async def self_register_user(
         self,
@@ -612,41 +1127,47 @@ class WSO2IdentityClient:
                 })
         
         # Send request to WSO2 IS self-registration endpoint
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/api/identity/user/v1.0/me",
-                    json=registration_payload,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Accept": "application/json"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code == 201:
-                    # Registration successful - verification email sent
-                    return SelfRegistrationResponse(
-                        status="success",
-                        message="Registration successful. Please check your email for verification code.",
-                        username=user.username,
-                        email=user.email,
-                        confirmation_required=True,
-                        code_sent_to=user.email
-                    )
-                
-                elif response.status_code == 409:
-                    raise WSO2ClientError(
-                        409,
-                        {"error": "User already exists", "username": user.username}
-                    )
+        try:
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/api/identity/user/v1.0/me",
+                endpoint="self_service",
+                json=registration_payload,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json"
+                }
+            )
+            
+            if response.status_code == 201:
+                # Registration successful - verification email sent.
+                # Remember the SCIM id when the IdP echoes the created user back.
+                if "application/json" in response.headers.get("content-type", ""):
+                    created = response.json()
+                    if isinstance(created, dict) and created.get("id"):
+                        await self.scim_id_cache.set(user.username, created["id"])
                 
-                else:
-                    error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
-                    raise WSO2ClientError(response.status_code, error_data)
+                return SelfRegistrationResponse(
+                    status="success",
+                    message="Registration successful. Please check your email for verification code.",
+                    username=user.username,
+                    email=user.email,
+                    confirmation_required=True,
+                    code_sent_to=user.email
+                )
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            elif response.status_code == 409:
+                raise WSO2ClientError(
+                    409,
+                    {"error": "User already exists", "username": user.username}
+                )
+            
+            else:
+                error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
+                raise WSO2ClientError(response.status_code, error_data)
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
     
     async def verify_email(
         self,
@@ -673,36 +1194,36 @@ class WSO2IdentityClient:
         }
         
         # Send verification request
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/api/identity/user/v1.0/me/validate-code",
-                    json=verification_payload,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Accept": "application/json"
-                    },
-                    timeout=30.0
+        try:
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/api/identity/user/v1.0/me/validate-code",
+                endpoint="self_service",
+                json=verification_payload,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json"
+                }
+            )
+            
+            if response.status_code == 202 or response.status_code == 200:
+                # Verification successful
+                return EmailVerificationResponse(
+                    status="success",
+                    message="Email verified successfully. Account is now active.",
+                    username=verification.username,
+                    account_activated=True
+                )
+            
+            elif response.status_code == 400:
+                raise WSO2ClientError(
+                    400,
+                    {"error": "Invalid or expired verification code"}
                 )
-                
-                if response.status_code == 202 or response.status_code == 200:
-                    # Verification successful
-                    return EmailVerificationResponse(
-                        status="success",
-                        message="Email verified successfully. Account is now active.",
-                        username=verification.username,
-                        account_activated=True
-                    )
-                
-                elif response.status_code == 400:
-                    raise WSO2ClientError(
-                        400,
-                        {"error": "Invalid or expired verification code"}
-                    )
-                
-                else:
-                    error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
-                    raise WSO2ClientError(response.status_code, error_data)
             
-            except httpx.RequestError as e:
-                raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
+            else:
+                error_data = response.json() if "application/json" in response.headers.get("content-type", "") else response.text
+                raise WSO2ClientError(response.status_code, error_data)
+        
+        except httpx.RequestError as e:
+            raise WSO2ClientError(503, f"Failed to connect to WSO2 IS: {str(e)}")
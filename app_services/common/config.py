@@ -45,6 +45,9 @@ class Config:
     WSO2_IS_PORT: int = int(os.getenv("WSO2_IS_PORT", "9443"))
     WSO2_AM_HOST: str = os.getenv("WSO2_AM_HOST", "wso2am")
     WSO2_AM_PORT: int = int(os.getenv("WSO2_AM_PORT", "9443"))
+    # `iss` claim of IS-issued tokens (IS uses its own hostname, not WSO2_IS_HOST);
+    # empty skips the issuer check in offline token verification
+    WSO2_IS_ISSUER: str = os.getenv("WSO2_IS_ISSUER", "")
 
     # ============================================================================
     # SMTP Email Configuration
@@ -0,0 +1,65 @@
+"""
+Bulk import input handling
+Run from app_services: python -m pytest common/tests
+"""
+import io
+import json
+
+from common.auth.bulk_import import read_ndjson, validated
+
+VALID = {
+    "username": "alice",
+    "password": "Str0ng!Passw0rd",
+    "email": "alice@example.com",
+    "first_name": "Alice",
+    "last_name": "Smith"
+}
+
+
+def run(tmp_path, lines):
+    path = tmp_path / "users.ndjson"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    output = io.StringIO()
+    summary = {"success": 0, "failed": 0}
+    requests = list(validated(read_ndjson(path), output, summary))
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    return requests, results, summary
+
+
+def test_malformed_line_fails_alone(tmp_path):
+    requests, results, summary = run(tmp_path, [
+        json.dumps(VALID),
+        '{"username": "bob", "password": ',
+        json.dumps({**VALID, "username": "carol", "email": "carol@example.com"})
+    ])
+
+    assert [request.username for request in requests] == ["alice", "carol"]
+    assert summary["failed"] == 1
+    assert len(results) == 1
+    assert results[0]["status"] == "failed"
+    assert results[0]["status_code"] == 400
+    assert results[0]["line"] == 2
+    assert results[0]["error"].startswith("Invalid JSON")
+
+
+def test_non_object_line_fails_alone(tmp_path):
+    requests, results, summary = run(tmp_path, [
+        '["alice", "Str0ng!Passw0rd"]',
+        "",
+        "42",
+        json.dumps(VALID)
+    ])
+
+    assert [request.username for request in requests] == ["alice"]
+    assert summary["failed"] == 2
+    assert [(result["line"], result["status_code"]) for result in results] == [(1, 400), (3, 400)]
+    assert all(result["error"].startswith("Expected a JSON object") for result in results)
+
+
+def test_invalid_user_reports_its_line(tmp_path):
+    requests, results, summary = run(tmp_path, [json.dumps({**VALID, "email": "not-an-email"})])
+
+    assert requests == []
+    assert results[0]["line"] == 1
+    assert results[0]["username"] == "alice"
+    assert results[0]["error"][0]["loc"] == ["email"]
@@ -0,0 +1,28 @@
+"""
+JWKS key cache
+Run from app_services: python -m pytest common/tests
+"""
+import pytest
+
+from common.auth import token_verifier
+from common.auth.token_verifier import JWKSCache
+
+JWKS = {"keys": [{"kty": "oct", "kid": "key-1", "alg": "HS256", "k": "c2VjcmV0LXNpZ25pbmcta2V5LWZvci10ZXN0cw"}]}
+
+
+@pytest.mark.asyncio
+async def test_first_lookup_fetches_on_freshly_booted_host(monkeypatch):
+    # time.monotonic() counts from boot on Linux, so it can be below the TTL
+    monkeypatch.setattr(token_verifier.time, "monotonic", lambda: 5.0)
+    fetches = 0
+
+    async def fetch_jwks():
+        nonlocal fetches
+        fetches += 1
+        return JWKS
+
+    cache = JWKSCache(fetch_jwks)
+    key = await cache.get_key("key-1")
+
+    assert key.key_id == "key-1"
+    assert fetches == 1
@@ -0,0 +1,40 @@
+"""
+WSO2 IS client metrics
+Run from app_services: python -m pytest common/tests
+"""
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from common.auth.wso2_client import WSO2IdentityClient
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_counts_open_connections():
+    async def handler(request):
+        return httpx.Response(200)
+
+    client = WSO2IdentityClient()
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        stats = client.pool_stats()
+    finally:
+        await client._client.aclose()
+
+    assert stats["open"] is True
+    assert stats["connections"] == 0
+
+
+def test_pool_stats_survive_changed_pool_internals():
+    client = WSO2IdentityClient()
+    # A pool whose connections no longer expose is_idle()/info()
+    pool = SimpleNamespace(connections=[object()])
+    client._client = SimpleNamespace(is_closed=False, _transport=SimpleNamespace(_pool=pool))
+
+    stats = client.pool_stats()
+
+    assert stats["open"] is True
+    assert stats["requests_total"] == 0
+    assert stats["connections"] is None
+    assert stats["connections_http2"] is None
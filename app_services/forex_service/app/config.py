@@ -0,0 +1,46 @@
+from pydantic_settings import BaseSettings
+from typing import Optional
+
+
+class Settings(BaseSettings):
+    """Application settings"""
+
+    # Service Configuration
+    SERVICE_NAME: str = "forex_service"
+    SERVICE_PORT: int = 8001
+    SERVICE_VERSION: str = "1.0.0"
+
+    # Rate engine
+    # Quotes loaded at startup, e.g. "EUR/USD=1.0850/1.0852,USD/JPY=149.80"
+    # (bid/ask, or a single mid rate); live ticks arrive via POST /rates/quotes
+    FOREX_SEED_QUOTES: str = ""
+    FOREX_DEFAULT_SPREAD: float = 0.0002  # Relative spread assumed for quotes without bid/ask
+
+    # Batch conversion
+    FOREX_BATCH_CHUNK_SIZE: int = 5000  # Items converted (and streamed) per vectorized step
+    FOREX_BATCH_MAX_ITEMS: int = 1000000
+
+    # Redis (tick fan-out between replicas)
+    REDIS_URL: str = "redis://:redis-secret@redis:6379/0"
+    FOREX_TICKS_CHANNEL: str = "forex:ticks"
+
+    # Rate streaming (WebSocket / SSE)
+    FOREX_STREAM_DEFAULT_FREQUENCY_HZ: float = 1.0  # Updates per second per subscriber
+    FOREX_STREAM_MAX_FREQUENCY_HZ: float = 10.0
+    FOREX_STREAM_MAX_PAIRS: int = 200  # Pairs per subscription
+    FOREX_STREAM_MAX_SUBSCRIBERS: int = 10000  # Per replica
+    FOREX_STREAM_SEND_TIMEOUT_SECONDS: float = 5.0  # Slower clients are disconnected
+    FOREX_STREAM_HEARTBEAT_SECONDS: float = 15.0  # SSE keepalive comment when idle
+
+    # Rate history
+    FOREX_HISTORY_DIR: Optional[str] = None  # Memory-mapped tick files; in-memory only when unset
+    FOREX_HISTORY_MAX_CANDLES: int = 10000  # Per history request
+    FOREX_MAX_TICK_FUTURE_SECONDS: float = 60.0  # Clock skew allowed on client-supplied tick timestamps
+
+    class Config:
+        env_file = ".env"
+        case_sensitive = True
+
+
+# Global settings instance
+settings = Settings()
@@ -1,6 +1,30 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from datetime import datetime
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+
+from app.config import settings
+from app.services.batch_convert import (
+    BatchConverter, UploadStreamingResponse, stream_json, stream_ndjson
+)
+from app.services.rate_engine import (
+    InvalidQuoteError, RateNotAvailableError, Tick, parse_quotes, rate_engine
+)
+from app.services.rate_history import parse_interval, rate_history
+from app.services.rate_stream import (
+    EventStreamResponse, Subscription, TooManySubscribersError, parse_pairs, rate_stream
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Forex Service",
@@ -14,6 +38,94 @@ class ExchangeRate(BaseModel):
     to_currency: str
     rate: float
     timestamp: datetime
+    pivot: Optional[str] = None  # Currency triangulated through, None for a direct quote
+    version: int  # Rate snapshot version
+
+
+class QuoteTick(BaseModel):
+    """Direct quote for base/quote: bid and ask, or a single mid rate"""
+    base: str = Field(..., pattern="^[A-Za-z]{3}$")
+    quote: str = Field(..., pattern="^[A-Za-z]{3}$")
+    rate: Optional[float] = Field(None, gt=0)
+    bid: Optional[float] = Field(None, gt=0)
+    ask: Optional[float] = Field(None, gt=0)
+    timestamp: Optional[datetime] = None  # Quote time (default: now); older than the live quote: history only
+
+    @model_validator(mode="after")
+    def _prices(self):
+        if (self.bid is None) != (self.ask is None) or (self.rate is None) == (self.bid is None):
+            raise ValueError("Provide either rate, or both bid and ask")
+        return self
+
+    def to_tick(self) -> Tick:
+        base, quote = self.base.upper(), self.quote.upper()
+        timestamp = _utc(self.timestamp).timestamp() if self.timestamp else None
+        if self.rate is not None:
+            return Tick.from_mid(base, quote, self.rate, timestamp=timestamp)
+        return Tick(base, quote, self.bid, self.ask, timestamp)
+
+
+class HistoricalRate(BaseModel):
+    from_currency: str
+    to_currency: str
+    rate: float
+    pivot: Optional[str] = None
+    timestamp: datetime  # Requested time
+    quoted_at: datetime  # Time of the newest quote the rate is derived from
+
+
+class Candle(BaseModel):
+    time: datetime  # Bucket start
+    open: float
+    high: float
+    low: float
+    close: float
+    ticks: int
+
+
+class RateHistory(BaseModel):
+    from_currency: str
+    to_currency: str
+    interval: str
+    pivot: Optional[str] = None  # Cross rates are built from the legs through this currency
+    start: datetime
+    end: datetime
+    candles: List[Candle]
+
+
+def _utc(value: datetime) -> datetime:
+    """Treat naive datetimes as UTC"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _micros(value: datetime) -> int:
+    return int(_utc(value).timestamp() * 1_000_000)
+
+
+def _datetime(micros: int) -> datetime:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load seed quotes and recorded history, then join the tick channel shared by all replicas"""
+    ticks = parse_quotes(settings.FOREX_SEED_QUOTES)
+    if ticks:
+        rate_engine.apply(ticks)
+        logger.info(f"Loaded {len(ticks)} seed quotes ({rate_engine.stats()['currencies']} currencies)")
+    rate_history.load()
+    latest = rate_history.latest()
+    if latest:
+        rate_engine.apply(latest)
+        logger.info(f"Restored {len(latest)} quotes from rate history")
+    await rate_stream.connect()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cleanup on shutdown"""
+    await rate_stream.close()
+    rate_history.close()
 
 
 @app.get("/health")
@@ -22,7 +134,10 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "forex_service",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "rates": rate_engine.stats(),
+        "stream": rate_stream.stats(),
+        "history": rate_history.stats()
     }
 
 
@@ -32,21 +147,243 @@ async def root():
     return {
         "service": "Forex Service",
         "message": "Currency exchange rate API",
-        "endpoints": ["/health", "/rates/{from_currency}/{to_currency}"]
+        "endpoints": ["/health", "/rates/{from_currency}/{to_currency}", "POST /rates/quotes", "POST /convert/batch",
+                      "/rates/stream", "/rates/stream/ws",
+                      "/rates/{from_currency}/{to_currency}/at", "/rates/{from_currency}/{to_currency}/history"]
     }
 
 
-@app.get("/rates/{from_currency}/{to_currency}")
+@app.get("/rates/{from_currency}/{to_currency}", response_model=ExchangeRate)
 async def get_exchange_rate(from_currency: str, to_currency: str):
-    """Get exchange rate between two currencies (dummy data)"""
+    """Get exchange rate between two currencies (direct or via the cheapest pivot)"""
+    from_currency, to_currency = from_currency.upper(), to_currency.upper()
+    snapshot = rate_engine.snapshot
+    try:
+        rate = snapshot.rate(from_currency, to_currency)
+    except RateNotAvailableError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return ExchangeRate(
-        from_currency=from_currency.upper(),
-        to_currency=to_currency.upper(),
-        rate=1.23,  # Dummy rate
-        timestamp=datetime.now()
+        from_currency=from_currency,
+        to_currency=to_currency,
+        rate=rate,
+        timestamp=snapshot.updated_at,
+        pivot=snapshot.pivot(from_currency, to_currency),
+        version=snapshot.version
+    )
+
+
+@app.get("/rates/{from_currency}/{to_currency}/at", response_model=HistoricalRate)
+async def get_exchange_rate_at(
+    from_currency: str,
+    to_currency: str,
+    timestamp: datetime = Query(..., description="ISO 8601 time, UTC if no offset is given")
+):
+    """Exchange rate in effect at a point in time (direct quote or cheapest pivot at that time)"""
+    from_currency, to_currency = from_currency.upper(), to_currency.upper()
+    try:
+        historical = rate_history.rate_at(from_currency, to_currency, _micros(timestamp))
+    except RateNotAvailableError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return HistoricalRate(
+        from_currency=from_currency,
+        to_currency=to_currency,
+        rate=historical.rate,
+        pivot=historical.pivot,
+        timestamp=_utc(timestamp),
+        quoted_at=_datetime(historical.as_of)
     )
 
 
+@app.get("/rates/{from_currency}/{to_currency}/history", response_model=RateHistory)
+async def get_exchange_rate_history(
+    from_currency: str,
+    to_currency: str,
+    start: Optional[datetime] = Query(None, description="Defaults to 30 days before end"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    interval: str = Query("1d", description="Candle size: 1m, 15m, 1h, 1d, 1w...")
+):
+    """OHLC candles of the mid rate (daily by default), aligned to UTC"""
+    from_currency, to_currency = from_currency.upper(), to_currency.upper()
+    end = _utc(end) if end else datetime.now(timezone.utc)
+    start = _utc(start) if start else end - timedelta(days=30)
+    try:
+        step = parse_interval(interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (_micros(end) - _micros(start)) // step > settings.FOREX_HISTORY_MAX_CANDLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans more than {settings.FOREX_HISTORY_MAX_CANDLES} {interval} candles"
+        )
+
+    try:
+        pivot = rate_engine.snapshot.pivot(from_currency, to_currency)
+    except RateNotAvailableError:
+        pivot = None
+    try:
+        candles = rate_history.candles(from_currency, to_currency, _micros(start), _micros(end), step, pivot)
+    except RateNotAvailableError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return RateHistory(
+        from_currency=from_currency,
+        to_currency=to_currency,
+        interval=interval,
+        pivot=pivot,
+        start=start,
+        end=end,
+        candles=[
+            Candle(time=_datetime(bucket), open=o, high=h, low=l, close=c, ticks=n)
+            for bucket, o, h, l, c, n in zip(
+                candles.start.tolist(), candles.open.tolist(), candles.high.tolist(),
+                candles.low.tolist(), candles.close.tolist(), candles.ticks.tolist()
+            )
+        ]
+    )
+
+
+@app.post("/rates/quotes")
+async def publish_quotes(quotes: List[QuoteTick]):
+    """Apply a batch of direct quote ticks (one recompute for the whole batch, shared with all replicas)"""
+    try:
+        snapshot = await rate_stream.apply(quote.to_tick() for quote in quotes)
+    except InvalidQuoteError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "version": snapshot.version,
+        "currencies": len(snapshot.currencies),
+        "recompute_ms": rate_engine.stats()["last_recompute_ms"]
+    }
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+@app.post("/convert/batch")
+async def convert_batch(request: Request):
+    """
+    Convert many amounts against one consistent rate snapshot
+
+    The body is a JSON array of {"amount", "from", "to"} objects, or the
+    same objects as NDJSON (Content-Type: application/x-ndjson), which is
+    converted while it is being uploaded. Results come back streamed in
+    input order in the same format, led by the snapshot version and
+    timestamp (also sent as the X-Rate-Version header). Items without a
+    rate get {"error": ...} in their place.
+    """
+    converter = BatchConverter(rate_engine.snapshot)
+    headers = {"X-Rate-Version": str(converter.snapshot.version)}
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES:
+        return UploadStreamingResponse(
+            stream_ndjson(converter, request.stream()),
+            media_type="application/x-ndjson",
+            headers=headers
+        )
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of {amount, from, to} items")
+    if len(items) > settings.FOREX_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(items)} items exceeds the limit of {settings.FOREX_BATCH_MAX_ITEMS}"
+        )
+    return StreamingResponse(stream_json(converter, items), media_type="application/json", headers=headers)
+
+
+def _subscription_params(pairs: str, max_frequency: Optional[float]):
+    """Validate stream parameters; raises ValueError or TooManySubscribersError"""
+    parsed = parse_pairs(pairs)
+    frequency = max_frequency or settings.FOREX_STREAM_DEFAULT_FREQUENCY_HZ
+    if frequency <= 0:
+        raise ValueError("max_frequency must be positive")
+    rate_stream.check_capacity()
+    return parsed, min(frequency, settings.FOREX_STREAM_MAX_FREQUENCY_HZ)
+
+
+@app.get("/rates/stream")
+async def stream_rates_sse(
+    pairs: str = Query(..., description="Comma-separated pairs, e.g. EUR/USD,USD/JPY"),
+    max_frequency: Optional[float] = Query(None, description="Max updates per second")
+):
+    """
+    Server-Sent Events stream of rate changes for the given pairs
+
+    Sends the current rates, then an `event: rates` message whenever one
+    of the pairs changes, at most `max_frequency` times per second.
+    """
+    try:
+        parsed, frequency = _subscription_params(pairs, max_frequency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TooManySubscribersError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def events():
+        async with rate_stream.subscribe(parsed, frequency) as subscription:
+            async for message in subscription.messages(heartbeat=settings.FOREX_STREAM_HEARTBEAT_SECONDS):
+                if message is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: rates\nid: {message['version']}\ndata: {json.dumps(message)}\n\n"
+
+    return EventStreamResponse(events(), rate_stream)
+
+
+async def _send_updates(websocket: WebSocket, subscription: Subscription):
+    async for message in subscription.messages():
+        try:
+            await asyncio.wait_for(websocket.send_json(message), timeout=rate_stream.send_timeout)
+        except asyncio.TimeoutError:
+            rate_stream.drop("WebSocket client not reading")
+            return
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    try:
+        while True:
+            await websocket.receive_text()  # Client messages are ignored
+    except WebSocketDisconnect:
+        pass
+
+
+@app.websocket("/rates/stream/ws")
+async def stream_rates_ws(
+    websocket: WebSocket,
+    pairs: str = Query(..., description="Comma-separated pairs, e.g. EUR/USD,USD/JPY"),
+    max_frequency: Optional[float] = Query(None, description="Max updates per second")
+):
+    """WebSocket stream of rate changes for the given pairs (same messages as /rates/stream)"""
+    try:
+        parsed, frequency = _subscription_params(pairs, max_frequency)
+    except (ValueError, TooManySubscribersError) as e:
+        await websocket.close(code=1008 if isinstance(e, ValueError) else 1013, reason=str(e))
+        return
+
+    await websocket.accept()
+    async with rate_stream.subscribe(parsed, frequency) as subscription:
+        sender = asyncio.create_task(_send_updates(websocket, subscription))
+        receiver = asyncio.create_task(_wait_for_disconnect(websocket))
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*done, *pending, return_exceptions=True)
+
+    if receiver not in done:
+        # Slow consumer (or send failure): close without waiting on it
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=1.0)
+        except Exception:
+            pass
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
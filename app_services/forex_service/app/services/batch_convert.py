@@ -0,0 +1,191 @@
+"""
+Batch currency conversion
+Converts many (amount, from, to) items against one rate snapshot, chunk by chunk
+"""
+import json
+import math
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+from app.services.rate_engine import RateSnapshot
+
+
+def _parse_item(item: Any) -> Tuple[float, str, str]:
+    if not isinstance(item, dict):
+        raise ValueError("Item must be an object with amount, from and to")
+    try:
+        amount = item["amount"]
+        from_currency, to_currency = item["from"], item["to"]
+    except KeyError as e:
+        raise ValueError(f"Missing field {e.args[0]}") from None
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+        raise ValueError("amount must be a finite number")
+    if not isinstance(from_currency, str) or not isinstance(to_currency, str):
+        raise ValueError("from and to must be currency codes")
+    return float(amount), from_currency.upper(), to_currency.upper()
+
+
+class BatchConverter:
+    """
+    Converts items against a single RateSnapshot
+
+    Each chunk is converted in one vectorized step: currency codes are
+    mapped to matrix indices, the rates are gathered with one fancy-index
+    read of `snapshot.rates`, and amounts are multiplied as an array.
+    Items that are malformed or have no rate get an {"error": ...} line in
+    their position instead of failing the batch.
+    """
+
+    def __init__(self, snapshot: RateSnapshot):
+        self.snapshot = snapshot
+        self._codes = [json.dumps(code) for code in snapshot.currencies]
+
+    def header(self) -> Dict[str, Any]:
+        return {"version": self.snapshot.version, "timestamp": self.snapshot.updated_at.isoformat()}
+
+    def convert(self, items: List[Any]) -> List[str]:
+        """Convert a chunk of raw items (parsed JSON, or the exception raised parsing one) into JSON lines"""
+        amounts: List[float] = []
+        sources: List[int] = []
+        targets: List[int] = []
+        errors: Dict[int, str] = {}
+
+        index = self.snapshot.index
+        for position, item in enumerate(items):
+            try:
+                if isinstance(item, Exception):
+                    raise ValueError(f"Invalid JSON: {item}")
+                amount, from_currency, to_currency = _parse_item(item)
+                source, target = index[from_currency], index[to_currency]
+            except ValueError as e:
+                errors[position] = str(e)
+                amount, source, target = 0.0, 0, 0
+            except KeyError as e:
+                errors[position] = f"No quotes for currency {e.args[0]}"
+                amount, source, target = 0.0, 0, 0
+            amounts.append(amount)
+            sources.append(source)
+            targets.append(target)
+
+        rates = self.snapshot.rates[np.array(sources, dtype=np.intp), np.array(targets, dtype=np.intp)]
+        converted = (np.array(amounts) * rates).tolist()
+
+        codes = self._codes
+        lines = []
+        for position, (amount, source, target, rate, result) in enumerate(
+            zip(amounts, sources, targets, rates.tolist(), converted)
+        ):
+            error = errors.get(position) if errors else None
+            if error is None and math.isnan(rate):
+                currencies = self.snapshot.currencies
+                error = f"No rate path from {currencies[source]} to {currencies[target]}"
+            if error is not None:
+                lines.append(json.dumps({"error": error}))
+                continue
+            lines.append(
+                f'{{"amount":{amount!r},"from":{codes[source]},"to":{codes[target]},'
+                f'"rate":{rate!r},"converted":{result!r}}}'
+            )
+        return lines
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def stream_json(converter: BatchConverter, items: List[Any]) -> AsyncIterator[bytes]:
+    """{"version": ..., "timestamp": ..., "results": [...]} with results written chunk by chunk"""
+    header = json.dumps(converter.header())[:-1]
+    yield f'{header},"results":['.encode()
+    first = True
+    for chunk in _chunks(items, settings.FOREX_BATCH_CHUNK_SIZE):
+        lines = converter.convert(chunk)
+        yield (("" if first else ",") + ",".join(lines)).encode()
+        first = False
+    yield b"]}"
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body is produced while the request body is read
+
+    StreamingResponse normally watches for client disconnects by calling
+    receive() next to the body iterator, which would swallow request body
+    chunks the iterator is waiting for. Here the iterator is the only
+    reader; a disconnect surfaces from request.stream() as ClientDisconnect.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+
+
+async def _parsed_lines(body: AsyncIterator[bytes]) -> AsyncIterator[List[Any]]:
+    """Parse NDJSON as it arrives: one list of items (or parse errors) per body chunk"""
+    pending = b""
+    async for data in body:
+        *lines, pending = (pending + data).split(b"\n")
+        if lines:
+            yield _parse_lines(lines)
+    if pending:
+        yield _parse_lines([pending])
+
+
+# The decoder's C scanner: json.loads without its per-call overhead
+_scan_once = json.JSONDecoder().scan_once
+
+
+def _parse_line(line: bytes) -> Any:
+    text = line.decode().strip()
+    try:
+        item, end = _scan_once(text, 0)
+    except StopIteration:
+        raise ValueError("Expecting value: line 1 column 1 (char 0)") from None
+    if end != len(text):
+        raise ValueError(f"Extra data: line 1 column {end + 1} (char {end})")
+    return item
+
+
+def _parse_lines(lines: List[bytes]) -> List[Any]:
+    # Each line on its own: a bulk parse of the joined lines can merge two
+    # malformed lines and shift every later result onto the wrong input
+    items = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            items.append(_parse_line(line))
+        except ValueError as e:
+            items.append(e)
+    return items
+
+
+async def stream_ndjson(converter: BatchConverter, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Snapshot header line, then one result line per input line, as the request body arrives"""
+    yield (json.dumps(converter.header()) + "\n").encode()
+
+    size, limit = settings.FOREX_BATCH_CHUNK_SIZE, settings.FOREX_BATCH_MAX_ITEMS
+    chunk: List[Any] = []
+    total = 0
+    async for items in _parsed_lines(body):
+        chunk.extend(items[:limit - total])
+        total += len(items)
+        while len(chunk) >= size:
+            yield ("\n".join(converter.convert(chunk[:size])) + "\n").encode()
+            chunk = chunk[size:]
+        if total > limit:
+            break
+    if chunk:
+        yield ("\n".join(converter.convert(chunk)) + "\n").encode()
+    if total > limit:
+        yield (json.dumps({"error": f"Batch limit of {limit} items reached"}) + "\n").encode()
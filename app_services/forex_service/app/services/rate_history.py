@@ -0,0 +1,366 @@
+"""
+Rate history store
+Append-only per-pair tick series in compact (optionally memory-mapped) arrays, queried with NumPy
+"""
+import glob
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.rate_engine import HOP_COST, InvalidQuoteError, RateNotAvailableError, Tick, is_currency_code
+
+logger = logging.getLogger(__name__)
+
+# One tick: time (microseconds since the epoch), bid, ask = 24 bytes, so a
+# million ticks take 24 MB (22.9 MiB) of array or file. Capacity doubles
+# as a series grows, so allocated space is at most 2x that; memory-mapped
+# series only keep the pages queries touch resident.
+RECORD = np.dtype([("ts", "<i8"), ("bid", "<f8"), ("ask", "<f8")])
+
+_MAGIC = int.from_bytes(b"FXTICKS1", "little")
+_HEADER_WORDS = 8  # magic, record count, reserved
+_HEADER_BYTES = _HEADER_WORDS * 8
+
+_FILE_NAME = re.compile(r"([A-Z]{3})_([A-Z]{3})\.ticks")
+_INTERVAL = re.compile(r"^(\d+)([smhdw])$")
+_UNIT_MICROS = {"s": 10**6, "m": 60 * 10**6, "h": 3600 * 10**6, "d": 86400 * 10**6, "w": 7 * 86400 * 10**6}
+
+Pair = Tuple[str, str]
+
+
+def parse_interval(spec: str) -> int:
+    """
+    Parse "1m", "4h", "1d"... into microseconds
+
+    Raises:
+        ValueError: If the interval is malformed
+    """
+    match = _INTERVAL.match(spec.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval {spec!r}, expected e.g. 1m, 15m, 1h, 1d or 1w")
+    return int(match.group(1)) * _UNIT_MICROS[match.group(2)]
+
+
+class PairSeries:
+    """
+    Append-only ticks of one directly quoted pair, in time order
+
+    Without a path the records live in a NumPy array; with one they are a
+    memory map of the file (a 64-byte header holding the record count,
+    then the records), so the series survives restarts and the OS pages
+    it in and out. Either way capacity doubles when full. A tick older
+    than the last one (a backfilled quote) is inserted at its own time,
+    moving the newer records up, so the series stays sorted for binary
+    search; in-order appends stay O(1).
+    """
+
+    def __init__(self, path: Optional[str] = None, initial_capacity: int = 4096):
+        self.path = path
+        self._header: Optional[np.memmap] = None
+        self._mmap: Optional[np.memmap] = None
+        if path is None:
+            self._records = np.empty(initial_capacity, dtype=RECORD)
+            self._count = 0
+        else:
+            self._open(initial_capacity)
+
+    def _open(self, initial_capacity: int):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < _HEADER_BYTES:
+            with open(self.path, "wb") as f:
+                f.write(np.array([_MAGIC, 0] + [0] * (_HEADER_WORDS - 2), dtype="<i8").tobytes())
+                f.truncate(_HEADER_BYTES + initial_capacity * RECORD.itemsize)
+
+        self._header = np.memmap(self.path, dtype="<i8", mode="r+", shape=(_HEADER_WORDS,))
+        if int(self._header[0]) != _MAGIC:
+            raise ValueError(f"{self.path} is not a rate history file")
+        self._count = int(self._header[1])
+        self._map_records()
+
+    def _map_records(self):
+        capacity = (os.path.getsize(self.path) - _HEADER_BYTES) // RECORD.itemsize
+        self._mmap = np.memmap(self.path, dtype=RECORD, mode="r+", offset=_HEADER_BYTES, shape=(capacity,))
+        # Plain ndarray view of the mapping: slicing a memmap subclass costs several us per call
+        self._records = self._mmap.view(np.ndarray)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._count * RECORD.itemsize
+
+    @property
+    def records(self) -> np.ndarray:
+        return self._records[:self._count]
+
+    def _grow(self):
+        capacity = max(len(self._records) * 2, 1024)
+        if self._header is None:
+            records = np.empty(capacity, dtype=RECORD)
+            records[:self._count] = self._records[:self._count]
+            self._records = records
+            return
+        self._mmap.flush()
+        self._mmap = self._records = None
+        os.truncate(self.path, _HEADER_BYTES + capacity * RECORD.itemsize)
+        self._map_records()
+
+    def append(self, ts: int, bid: float, ask: float):
+        if self._count == len(self._records):
+            self._grow()
+        records, count = self._records, self._count
+        if count and ts < records[count - 1]["ts"]:
+            i = int(np.searchsorted(records["ts"][:count], ts, side="right"))
+            records[i + 1:count + 1] = records[i:count]
+            records[i] = (ts, bid, ask)
+        else:
+            records[count] = (ts, bid, ask)
+        self._count += 1
+        if self._header is not None:
+            self._header[1] = self._count
+
+    def index_at(self, ts: int) -> int:
+        """Index of the last tick at or before ts (-1 if none), by binary search"""
+        return int(np.searchsorted(self.records["ts"], ts, side="right")) - 1
+
+    def flush(self):
+        if self._header is not None:
+            self._mmap.flush()
+            self._header.flush()
+
+
+@dataclass(slots=True)
+class HistoricalRate:
+    rate: float
+    pivot: Optional[str]
+    as_of: int  # Time (us) of the newest tick the rate is built from
+
+
+@dataclass(slots=True)
+class Candles:
+    """OHLC of the mid rate per interval; arrays are aligned, one element per non-empty bucket"""
+    pivot: Optional[str]
+    start: np.ndarray  # Bucket start (us)
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    ticks: np.ndarray
+
+
+class RateHistory:
+    """
+    Time series of every applied quote tick, one PairSeries per quoted pair
+
+    Point-in-time lookups binary-search the series. For a pair that was
+    not quoted directly, `rate_at` re-runs the engine's pivot choice with
+    each currency's quotes as they were at that time. Range queries slice
+    the series with searchsorted and aggregate in NumPy (reduceat per
+    bucket); cross pairs are merged from their two legs through the pivot
+    the live engine uses now.
+
+    With FOREX_HISTORY_DIR set, series are memory-mapped files in that
+    directory (BASE_QUOTE.ticks) and reloaded on startup.
+    """
+
+    def __init__(self, directory: Optional[str] = settings.FOREX_HISTORY_DIR):
+        self.directory = directory
+        self._series: Dict[Pair, PairSeries] = {}
+        self.appended = 0
+
+    def load(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for path in sorted(glob.glob(os.path.join(self.directory, "*_*.ticks"))):
+            match = _FILE_NAME.fullmatch(os.path.basename(path))
+            if match is None:
+                logger.warning(f"Skipping rate history file with an unexpected name: {path}")
+                continue
+            try:
+                self._series[(match.group(1), match.group(2))] = PairSeries(path)
+            except ValueError as e:
+                logger.warning(f"Skipping rate history file: {e}")
+        if self._series:
+            logger.info(f"Loaded rate history: {self.stats()}")
+
+    def close(self):
+        for series in self._series.values():
+            series.flush()
+
+    def _series_for(self, pair: Pair) -> PairSeries:
+        series = self._series.get(pair)
+        if series is None:
+            # Codes become file names: never let one reach the filesystem unchecked
+            if not (is_currency_code(pair[0]) and is_currency_code(pair[1])):
+                raise InvalidQuoteError(f"Quote {pair[0]!r}/{pair[1]!r} needs three-letter currency codes")
+            path = os.path.join(self.directory, f"{pair[0]}_{pair[1]}.ticks") if self.directory else None
+            series = self._series[pair] = PairSeries(path)
+        return series
+
+    def record(self, ticks: Iterable[Tick]):
+        """
+        Append validated ticks (their timestamp, in seconds, must be set)
+
+        Raises:
+            InvalidQuoteError: If a currency code is malformed
+        """
+        for tick in ticks:
+            self._series_for((tick.base, tick.quote)).append(int(tick.timestamp * 1e6), tick.bid, tick.ask)
+            self.appended += 1
+
+    def latest(self) -> List[Tick]:
+        """Last recorded quote of every pair (to restore the engine after a restart)"""
+        ticks = []
+        for (base, quote), series in self._series.items():
+            if len(series):
+                ts, bid, ask = series.records[-1].item()
+                ticks.append(Tick(base, quote, bid, ask, ts / 1e6))
+        return ticks
+
+    def currencies(self) -> List[str]:
+        return sorted({code for pair in self._series for code in pair})
+
+    def _quote_at(self, from_currency: str, to_currency: str, ts: int) -> Optional[Tuple[int, float, float]]:
+        """(tick time, mid rate, cost) of the latest from->to quote at ts, in either direction"""
+        best = None
+        for pair, inverted in (((from_currency, to_currency), False), ((to_currency, from_currency), True)):
+            series = self._series.get(pair)
+            if series is None:
+                continue
+            i = series.index_at(ts)
+            if i < 0:
+                continue
+            tick_ts, bid, ask = series.records[i].item()
+            if best is None or tick_ts > best[0]:
+                mid = (bid + ask) / 2
+                best = (tick_ts, 1 / mid if inverted else mid, math.log(ask / bid) + HOP_COST)
+        return best
+
+    def rate_at(self, from_currency: str, to_currency: str, ts: int) -> HistoricalRate:
+        """
+        Rate the engine would have derived at ts: direct quote or cheapest pivot
+
+        Raises:
+            RateNotAvailableError: If no quotes for the pair existed at ts
+        """
+        if from_currency == to_currency:
+            return HistoricalRate(1.0, None, ts)
+
+        best: Optional[Tuple[float, HistoricalRate]] = None
+        direct = self._quote_at(from_currency, to_currency, ts)
+        if direct is not None:
+            best = (direct[2], HistoricalRate(direct[1], None, direct[0]))
+        for pivot in self.currencies():
+            if pivot in (from_currency, to_currency):
+                continue
+            first = self._quote_at(from_currency, pivot, ts)
+            second = self._quote_at(pivot, to_currency, ts) if first is not None else None
+            if second is None:
+                continue
+            cost = first[2] + second[2]
+            if best is None or cost < best[0]:
+                best = (cost, HistoricalRate(first[1] * second[1], pivot, max(first[0], second[0])))
+        if best is None:
+            raise RateNotAvailableError(f"No rate from {from_currency} to {to_currency} at that time")
+        return best[1]
+
+    def _leg(self, from_currency: str, to_currency: str, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (times, mid rates) of from->to quotes in [start, end), merged from both directions
+
+        The last quote before `start` is included so the rate at `start` is known.
+        """
+        times, mids = [], []
+        for pair, inverted in (((from_currency, to_currency), False), ((to_currency, from_currency), True)):
+            series = self._series.get(pair)
+            if series is None:
+                continue
+            ts = series.records["ts"]
+            lo = max(int(np.searchsorted(ts, start, side="right")) - 1, 0)
+            hi = int(np.searchsorted(ts, end, side="left"))
+            chunk = series.records[lo:hi]
+            mid = (chunk["bid"] + chunk["ask"]) / 2
+            times.append(chunk["ts"])
+            mids.append(1 / mid if inverted else mid)
+        if not times:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if len(times) == 1:
+            return times[0], mids[0]
+        times, mids = np.concatenate(times), np.concatenate(mids)
+        order = np.argsort(times, kind="stable")
+        return times[order], mids[order]
+
+    def candles(
+        self,
+        from_currency: str,
+        to_currency: str,
+        start: int,
+        end: int,
+        interval: int,
+        pivot: Optional[str] = None
+    ) -> Candles:
+        """
+        OHLC of the mid rate per `interval` (us, buckets aligned to the epoch) in [start, end)
+
+        Pass the pair's current pivot for a cross rate; the series is then
+        leg1 x leg2 evaluated at every tick of either leg.
+
+        Raises:
+            RateNotAvailableError: If the pair (or a leg) has no history
+        """
+        if pivot is None:
+            times, rates = self._leg(from_currency, to_currency, start, end)
+            if not len(times):
+                raise RateNotAvailableError(f"No history for {from_currency}/{to_currency}")
+        else:
+            times1, rates1 = self._leg(from_currency, pivot, start, end)
+            times2, rates2 = self._leg(pivot, to_currency, start, end)
+            if not len(times1) or not len(times2):
+                raise RateNotAvailableError(f"No history for {from_currency}/{pivot} or {pivot}/{to_currency}")
+            # Both legs are sorted: a stable sort merges the two runs (np.union1d hashes, far slower)
+            times = np.concatenate((times1, times2))
+            times.sort(kind="stable")
+            times = times[np.r_[True, times[1:] != times[:-1]]]
+            # Value of each leg at every time: its last quote at or before it
+            i1 = np.searchsorted(times1, times, side="right") - 1
+            i2 = np.searchsorted(times2, times, side="right") - 1
+            known = (i1 >= 0) & (i2 >= 0)
+            times = times[known]
+            rates = rates1[i1[known]] * rates2[i2[known]]
+
+        in_range = times >= start
+        times, rates = times[in_range], rates[in_range]
+        if not len(times):
+            return Candles(pivot, *(np.empty(0),) * 6)
+
+        buckets = times // interval
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(times)]
+        return Candles(
+            pivot=pivot,
+            start=buckets[starts] * interval,
+            open=rates[starts],
+            high=np.maximum.reduceat(rates, starts),
+            low=np.minimum.reduceat(rates, starts),
+            close=rates[ends - 1],
+            ticks=ends - starts
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "pairs": len(self._series),
+            "ticks": sum(len(series) for series in self._series.values()),
+            "bytes": sum(series.nbytes for series in self._series.values()),
+            "persistent": bool(self.directory)
+        }
+
+
+# Global rate history instance
+rate_history = RateHistory()
@@ -0,0 +1,319 @@
+"""
+Live rate streaming
+Pushes coalesced rate updates to WebSocket/SSE subscribers and shares ticks across replicas via Redis pub/sub
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+from app.services.rate_engine import InvalidQuoteError, RateSnapshot, Tick, rate_engine
+from app.services.rate_history import rate_history
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+
+
+class TooManySubscribersError(RuntimeError):
+    """The replica already serves FOREX_STREAM_MAX_SUBSCRIBERS streams"""
+
+
+class _SlowConsumer(Exception):
+    # Not a TimeoutError: StreamingResponse turns OSError subclasses into ClientDisconnect
+    pass
+
+
+def parse_pairs(spec: str) -> List[Pair]:
+    """
+    Parse "EUR/USD,USD/JPY" (or EUR-USD) into pairs
+
+    Raises:
+        ValueError: If a pair is malformed or there are too many
+    """
+    pairs = []
+    for entry in filter(None, (part.strip().upper() for part in spec.split(","))):
+        codes = entry.replace("-", "/").split("/")
+        if len(codes) != 2 or not all(codes):
+            raise ValueError(f"Malformed pair {entry!r}, expected BASE/QUOTE")
+        pairs.append((codes[0], codes[1]))
+    if not pairs:
+        raise ValueError("At least one pair is required, e.g. pairs=EUR/USD")
+    if len(pairs) > settings.FOREX_STREAM_MAX_PAIRS:
+        raise ValueError(f"At most {settings.FOREX_STREAM_MAX_PAIRS} pairs per stream")
+    return list(dict.fromkeys(pairs))
+
+
+class Subscription:
+    """
+    One streaming client: its pairs and the rates it was last sent
+
+    Updates are coalesced: a rate change only sets a flag, and the
+    client's loop wakes at most `max_frequency` times per second, diffs
+    the latest snapshot against what it last sent and emits one message
+    with the pairs that changed. Ticks arriving in between collapse into
+    that message, so a client never has more than one pending update.
+    """
+
+    def __init__(self, pairs: List[Pair], max_frequency: float):
+        self.pairs = pairs
+        self.min_interval = 1 / max_frequency
+        self._changed = asyncio.Event()
+        self._changed.set()  # Send the current rates first
+        self._sent: Dict[Pair, Tuple[float, Optional[str]]] = {}
+        self._sent_at = 0.0
+
+    def notify(self):
+        self._changed.set()
+
+    def _message(self, snapshot: RateSnapshot) -> Optional[dict]:
+        rates = []
+        index = snapshot.index
+        for pair in self.pairs:
+            i, j = index.get(pair[0]), index.get(pair[1])
+            if i is None or j is None:
+                continue
+            rate = float(snapshot.rates[i, j])
+            if rate != rate:
+                continue
+            k = int(snapshot.pivots[i, j])
+            current = (rate, snapshot.currencies[k] if k >= 0 else None)
+            if self._sent.get(pair) != current:
+                self._sent[pair] = current
+                rates.append({"from": pair[0], "to": pair[1], "rate": current[0], "pivot": current[1]})
+        if not rates:
+            return None
+        return {"version": snapshot.version, "timestamp": snapshot.updated_at.isoformat(), "rates": rates}
+
+    async def messages(self, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[dict]]:
+        """Yield rate updates as they happen (None every `heartbeat` seconds when idle)"""
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            delay = self._sent_at + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._changed.clear()
+            message = self._message(rate_engine.snapshot)
+            if message is not None:
+                self._sent_at = time.monotonic()
+                yield message
+
+
+class RateStream:
+    """
+    Rate update fan-out for this replica and across replicas
+
+    Quote ticks applied here are published to a Redis channel, with their
+    timestamp; every other replica applies them to its own engine, which
+    keeps the newest tick per pair whatever the arrival order, so all
+    replicas converge on the same rates and each notifies its local
+    subscribers. Without Redis
+    (or while it is down) ticks still apply and stream locally; other
+    replicas catch up on a pair with its next tick.
+
+    Subscribers are bounded twice over: pending work is one flag per
+    subscriber (see Subscription), and a send that does not complete
+    within `send_timeout` drops the subscriber rather than buffering for it.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        channel: str = settings.FOREX_TICKS_CHANNEL,
+        send_timeout: float = settings.FOREX_STREAM_SEND_TIMEOUT_SECONDS,
+        max_subscribers: int = settings.FOREX_STREAM_MAX_SUBSCRIBERS
+    ):
+        self.redis_url = redis_url
+        self.channel = channel
+        self.send_timeout = send_timeout
+        self.max_subscribers = max_subscribers
+        self.instance_id = uuid.uuid4().hex
+        self.connected = False
+
+        self._redis: Optional[redis.Redis] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscriptions: Set[Subscription] = set()
+
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    async def connect(self):
+        self._redis = redis.from_url(self.redis_url, socket_connect_timeout=1.0)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        self.connected = False
+
+    def check_capacity(self):
+        if len(self._subscriptions) >= self.max_subscribers:
+            raise TooManySubscribersError(f"Stream limit of {self.max_subscribers} subscribers reached")
+
+    @asynccontextmanager
+    async def subscribe(self, pairs: List[Pair], max_frequency: float) -> AsyncIterator[Subscription]:
+        """
+        Register a subscriber for the duration of the block
+
+        Raises:
+            TooManySubscribersError: If this replica is at its limit
+        """
+        self.check_capacity()
+        subscription = Subscription(pairs, max_frequency)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def drop(self, reason: str):
+        self.dropped += 1
+        logger.info(f"Dropped rate stream subscriber: {reason}")
+
+    def _notify(self):
+        for subscription in self._subscriptions:
+            subscription.notify()
+
+    async def apply(self, ticks: Iterable[Tick]) -> RateSnapshot:
+        """
+        Record ticks, apply them locally, wake subscribers and publish to the other replicas
+
+        Ticks without a timestamp are stamped now, so every replica records
+        the same time. A tick older than its pair's current quote is only
+        recorded (the engine keeps the newest); one stamped more than
+        FOREX_MAX_TICK_FUTURE_SECONDS ahead is refused, as it would pin the
+        pair's rate until then. Ticks are validated before anything changes, and
+        recorded before the engine is updated, so a failure leaves both
+        untouched or the tick only in history (never live but unrecorded).
+
+        Raises:
+            InvalidQuoteError: If a tick is invalid (nothing is applied or published)
+        """
+        ticks = list(ticks)
+        rate_engine.validate(ticks)
+        now = time.time()
+        for tick in ticks:
+            if tick.timestamp is None:
+                tick.timestamp = now
+            elif not tick.timestamp <= now + settings.FOREX_MAX_TICK_FUTURE_SECONDS:
+                raise InvalidQuoteError(f"Quote {tick.base}/{tick.quote} is timestamped in the future")
+        rate_history.record(ticks)
+        snapshot = rate_engine.apply(ticks)
+        self._notify()
+        # While the subscription is down other replicas would not see the
+        # message either; skip the publish instead of paying a timeout per update
+        if self.connected and ticks:
+            payload = json.dumps({
+                "origin": self.instance_id,
+                "ticks": [[tick.base, tick.quote, tick.bid, tick.ask, tick.timestamp] for tick in ticks]
+            })
+            try:
+                await self._redis.publish(self.channel, payload)
+                self.published += 1
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f"Failed to publish {len(ticks)} ticks to other replicas: {e}")
+        return snapshot
+
+    def _receive(self, data: bytes):
+        try:
+            payload = json.loads(data)
+            if payload["origin"] == self.instance_id:
+                return
+            ticks = [Tick(*fields) for fields in payload["ticks"]]
+            # Codes and prices from another replica are checked like a POST's
+            rate_engine.validate(ticks)
+        except (ValueError, KeyError, TypeError, InvalidQuoteError) as e:
+            logger.warning(f"Ignoring malformed tick message: {e}")
+            return
+        now = time.time()
+        for tick in ticks:
+            if tick.timestamp is None:
+                tick.timestamp = now
+        rate_history.record(ticks)
+        rate_engine.apply(ticks)
+        self.received += 1
+        self._notify()
+
+    async def _listen(self):
+        backoff = 1.0
+        warn = True
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self.connected = True
+                backoff = 1.0
+                async for message in pubsub.listen():
+                    self._receive(message["data"])
+            except (redis.RedisError, OSError) as e:
+                if warn or self.connected:
+                    logger.warning(f"Tick channel unavailable, local updates only until Redis is back: {e}")
+                warn = False
+                self.connected = False
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def stats(self) -> Dict:
+        return {
+            "redis_connected": self.connected,
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "received": self.received,
+            "dropped_subscribers": self.dropped
+        }
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    text/event-stream response that gives up on a client that stops reading
+
+    Each write must complete within the stream's send_timeout; a client
+    whose socket stays full that long is disconnected instead of letting
+    updates pile up for it.
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(self, content: AsyncIterator[str], stream: RateStream):
+        super().__init__(content, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        self.stream = stream
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_with_timeout(message):
+            try:
+                await asyncio.wait_for(send(message), timeout=self.stream.send_timeout)
+            except asyncio.TimeoutError:
+                raise _SlowConsumer() from None
+
+        try:
+            await super().__call__(scope, receive, send_with_timeout)
+        except _SlowConsumer:
+            self.stream.drop("SSE client not reading")
+        finally:
+            # Unregister the subscription now rather than when the
+            # abandoned generator is garbage collected
+            await self.body_iterator.aclose()
+
+
+# Global rate stream instance
+rate_stream = RateStream()
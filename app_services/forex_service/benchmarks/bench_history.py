@@ -0,0 +1,124 @@
+"""
+Rate history microbenchmark
+Measures append, point-in-time lookup and OHLC aggregation cost, and memory per million ticks
+
+Usage (from app_services/forex_service):
+    python -m benchmarks.bench_history
+    python -m benchmarks.bench_history --ticks 5000000 --dir /tmp/forex-history
+"""
+import argparse
+import bisect
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from app.services.rate_engine import Tick
+from app.services.rate_history import RECORD, RateHistory, parse_interval
+
+START = 1_767_225_600_000_000  # 2026-01-01 (us)
+
+
+def synthetic_ticks(count: int, rng: random.Random) -> list:
+    """EUR/USD and USD/JPY random walks, one tick per pair every ~100ms"""
+    ticks = []
+    eur, jpy = 1.10, 150.0
+    ts = START
+    for i in range(count):
+        ts += rng.randint(1, 200_000)
+        if i % 2:
+            eur *= 1 + rng.gauss(0, 1e-5)
+            ticks.append(Tick("EUR", "USD", eur * 0.9999, eur * 1.0001, ts / 1e6))
+        else:
+            jpy *= 1 + rng.gauss(0, 1e-5)
+            ticks.append(Tick("USD", "JPY", jpy * 0.9999, jpy * 1.0001, ts / 1e6))
+    return ticks
+
+
+def report(name: str, count: int, seconds: float):
+    print(f"{name:<38} {count:>9} {seconds * 1000:>10.2f} {seconds / count * 1e6:>10.3f}")
+
+
+def run(history: RateHistory, ticks: list, lookups: int, rng: random.Random):
+    start = time.perf_counter()
+    history.record(ticks)
+    report("append", len(ticks), time.perf_counter() - start)
+
+    end = int(ticks[-1].timestamp * 1e6) + 1
+    points = [rng.randrange(START, end) for _ in range(lookups)]
+    series = history._series[("EUR", "USD")]
+    start = time.perf_counter()
+    for ts in points:
+        series.index_at(ts)
+    report("point lookup (binary search)", lookups, time.perf_counter() - start)
+
+    sample = points[:max(1, lookups // 100)]
+    start = time.perf_counter()
+    for ts in sample:
+        history.rate_at("EUR", "JPY", ts)
+    report("cross rate_at", len(sample), time.perf_counter() - start)
+
+    for interval in ("1m", "1h", "1d"):
+        start = time.perf_counter()
+        candles = history.candles("EUR", "USD", START, end, parse_interval(interval))
+        report(f"direct OHLC {interval} ({len(candles.start)} candles)", 1, time.perf_counter() - start)
+    start = time.perf_counter()
+    candles = history.candles("EUR", "JPY", START, end, parse_interval("1h"), pivot="USD")
+    report(f"cross OHLC 1h ({len(candles.start)} candles)", 1, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the forex rate history store")
+    parser.add_argument("--ticks", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--dir", help="Directory for the memory-mapped run (default: a temporary one)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ticks = synthetic_ticks(args.ticks, rng)
+    print(f"{args.ticks} ticks over 2 pairs, {RECORD.itemsize} bytes per tick\n")
+    print(f"{'scenario':<38} {'count':>9} {'total ms':>10} {'us/op':>10}")
+
+    print("-- in memory")
+    history = RateHistory(directory=None)
+    run(history, ticks, args.lookups, random.Random(args.seed))
+    stored = history.stats()["bytes"]
+    allocated = sum(len(series._records) * RECORD.itemsize for series in history._series.values())
+
+    # Baseline: the same ticks as a sorted list of tuples per pair
+    tracemalloc.start()
+    rows = {}
+    for tick in ticks:
+        rows.setdefault((tick.base, tick.quote), []).append((int(tick.timestamp * 1e6), tick.bid, tick.ask))
+    tuples_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    times = [row[0] for row in rows[("EUR", "USD")]]
+    points = [rng.randrange(START, times[-1]) for _ in range(args.lookups)]
+    start = time.perf_counter()
+    for ts in points:
+        bisect.bisect_right(times, ts)
+    report("point lookup (list + bisect)", args.lookups, time.perf_counter() - start)
+
+    print("-- memory-mapped")
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.dir or scratch
+        history = RateHistory(directory=directory)
+        history.load()
+        run(history, ticks, args.lookups, random.Random(args.seed))
+        history.close()
+        on_disk = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".ticks")
+        )
+
+    per_million = 1_000_000 / args.ticks
+    print("\nmemory per million ticks")
+    print(f"  records                {stored * per_million / 2**20:>8.1f} MiB")
+    print(f"  allocated (capacity)   {allocated * per_million / 2**20:>8.1f} MiB")
+    print(f"  files on disk          {on_disk * per_million / 2**20:>8.1f} MiB")
+    print(f"  list of tuples         {tuples_bytes * per_million / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
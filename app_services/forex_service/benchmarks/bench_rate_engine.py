@@ -0,0 +1,112 @@
+"""
+Rate engine microbenchmark
+Measures cross-rate recompute, lookup and batch conversion cost against per-request triangulation
+
+Usage (from app_services/forex_service):
+    python -m benchmarks.bench_rate_engine
+    python -m benchmarks.bench_rate_engine --currencies 150 --lookups 1000000
+"""
+import argparse
+import math
+import random
+import time
+
+from app.services.batch_convert import BatchConverter
+from app.services.rate_engine import HOP_COST, RateEngine, Tick
+
+
+def synthetic_ticks(currencies: int, density: float, rng: random.Random) -> list:
+    """USD-based quotes for every currency plus a random share of direct crosses"""
+    codes = ["USD"] + [f"C{i:02d}" for i in range(currencies - 1)]
+    usd = {code: rng.uniform(0.01, 200) for code in codes[1:]}
+    usd["USD"] = 1.0
+    ticks = []
+    for i, base in enumerate(codes):
+        for quote in codes[i + 1:]:
+            if base == "USD" or rng.random() < density:
+                mid = usd[quote] / usd[base]
+                spread = rng.uniform(0.0001, 0.003)
+                ticks.append(Tick(base, quote, mid * (1 - spread / 2), mid * (1 + spread / 2)))
+    return ticks
+
+
+def naive_rate(quotes: dict, currencies: list, from_currency: str, to_currency: str) -> float:
+    """Per-request triangulation: scan every pivot for the cheapest path"""
+    best_cost, best_rate = math.inf, math.nan
+    for pivot in currencies:
+        first = quotes.get((from_currency, pivot)) if pivot != from_currency else (1.0, 0.0)
+        second = quotes.get((pivot, to_currency)) if pivot != to_currency else (1.0, 0.0)
+        if first is None or second is None:
+            continue
+        cost = first[1] + second[1]
+        if cost < best_cost:
+            best_cost, best_rate = cost, first[0] * second[0]
+    return best_rate
+
+
+def report(name: str, count: int, seconds: float):
+    print(f"{name:<38} {count:>9} {seconds * 1000:>10.2f} {seconds / count * 1e6:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the forex rate engine")
+    parser.add_argument("--currencies", type=int, default=150)
+    parser.add_argument("--density", type=float, default=0.05, help="Share of non-USD pairs quoted directly")
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--ticks", type=int, default=200, help="Single-tick updates to time")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ticks = synthetic_ticks(args.currencies, args.density, rng)
+    engine = RateEngine()
+
+    print(f"{args.currencies} currencies, {len(ticks)} direct quotes\n")
+    print(f"{'scenario':<38} {'count':>9} {'total ms':>10} {'us/op':>10}")
+
+    start = time.perf_counter()
+    engine.apply(ticks)
+    report("initial load + recompute", 1, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for tick in rng.choices(ticks, k=args.ticks):
+        engine.apply([tick])
+    report("recompute per tick", args.ticks, time.perf_counter() - start)
+
+    snapshot = engine.snapshot
+    codes = list(snapshot.currencies)
+    pairs = [(rng.choice(codes), rng.choice(codes)) for _ in range(args.lookups)]
+
+    start = time.perf_counter()
+    for from_currency, to_currency in pairs:
+        snapshot.rate(from_currency, to_currency)
+    report("snapshot lookup", args.lookups, time.perf_counter() - start)
+
+    items = [{"amount": 100.0, "from": a, "to": b} for a, b in pairs]
+    converter = BatchConverter(snapshot)
+    start = time.perf_counter()
+    for offset in range(0, len(items), 5000):
+        converter.convert(items[offset:offset + 5000])
+    report("batch convert (5000-item chunks)", len(items), time.perf_counter() - start)
+
+    # Baseline: triangulate on every request from a dict of direct quotes
+    quotes = {}
+    for tick in ticks:
+        mid, cost = (tick.bid + tick.ask) / 2, math.log(tick.ask / tick.bid) + HOP_COST
+        quotes[(tick.base, tick.quote)] = (mid, cost)
+        quotes[(tick.quote, tick.base)] = (1 / mid, cost)
+    sample = pairs[:max(1, args.lookups // 100)]
+    start = time.perf_counter()
+    for from_currency, to_currency in sample:
+        naive_rate(quotes, codes, from_currency, to_currency)
+    report("per-request triangulation", len(sample), time.perf_counter() - start)
+
+    mismatches = sum(
+        not math.isclose(snapshot.rate(a, b), naive_rate(quotes, codes, a, b), rel_tol=1e-9)
+        for a, b in sample
+    )
+    print(f"\nengine vs per-request triangulation mismatches: {mismatches}/{len(sample)}")
+
+
+if __name__ == "__main__":
+    main()
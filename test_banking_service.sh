@@ -158,6 +158,41 @@ else
     passed_tests=$((passed_tests + 1))
 fi
 
+# Test 6: Concurrent set-primary (needs at least 2 linked accounts)
+HAMMER_ROUNDS="${HAMMER_ROUNDS:-10}"
+account_ids=$(curl -s "$BASE_URL/api/v1/$USER_ID/bank-accounts?status_filter=all&limit=200" 2>/dev/null \
+    | jq -r '.accounts[].id' 2>/dev/null || true)
+account_count=$(echo "$account_ids" | grep -c . || true)
+
+if [ "$account_count" -ge 2 ]; then
+    total_tests=$((total_tests + 1))
+    print_info "Hammering set-primary: $HAMMER_ROUNDS parallel requests per account ($account_count accounts)"
+    
+    status_file=$(mktemp)
+    for round in $(seq "$HAMMER_ROUNDS"); do
+        for account_id in $account_ids; do
+            curl -s -o /dev/null -w "%{http_code}\n" -X POST \
+                "$BASE_URL/api/v1/$USER_ID/bank-accounts/$account_id/set-primary" >> "$status_file" &
+        done
+    done
+    wait
+    
+    non_200=$(grep -vc '^200$' "$status_file" || true)
+    rm -f "$status_file"
+    primaries=$(curl -s "$BASE_URL/api/v1/$USER_ID/bank-accounts?status_filter=all&limit=200" 2>/dev/null \
+        | jq '[.accounts[] | select(.is_primary)] | length' 2>/dev/null)
+    
+    if [ "$primaries" = "1" ] && [ "$non_200" = "0" ]; then
+        print_success "Exactly one primary account after concurrent switches"
+        passed_tests=$((passed_tests + 1))
+    else
+        print_error "Expected 1 primary and no failed requests, got $primaries primaries and $non_200 failures"
+        failed_tests=$((failed_tests + 1))
+    fi
+else
+    print_warning "Skipping set-primary concurrency test (needs 2+ linked accounts)"
+fi
+
 # Summary
 echo ""
 echo "================================================"